@@ -0,0 +1,65 @@
+"""
+Benchmark: ThreadPoolExecutor(8) vs AsyncChapterPipeline (ảnh/giây)
+Dùng fake server local giả lập CDN ảnh + ImageKit upload.
+
+Cách chạy:
+    python benchmarks/bench_async_pipeline.py [so_anh] [latency_giay]
+"""
+
+import os
+import sys
+import time
+import base64
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fake_servers import FakeServer
+from crawler.async_pipeline import AsyncChapterPipeline, HAS_AIOHTTP
+from crawler.image_dedup import image_dedup
+
+# Ảnh giả lập không cần tra/ghi index dedup trên MongoDB
+image_dedup.enabled = False
+
+
+def run_threads(sources, upload_url, max_workers=8):
+    """Đường cũ: mỗi thread download rồi upload (như _download_chapter_via_flaresolverr)"""
+    session = requests.Session()
+
+    def download_and_upload(item):
+        idx, src = item
+        response = session.get(src, timeout=30)
+        data = {"file": base64.b64encode(response.content).decode('utf-8'), "fileName": f"{idx:03d}.jpg"}
+        return requests.post(upload_url, data=data, timeout=60).json().get("url")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(download_and_upload, item) for item in sources]
+        return [f.result() for f in as_completed(futures)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+
+    with FakeServer(latency=latency) as server:
+        sources = [(i, f"{server.url}/img/{i}.jpg") for i in range(count)]
+        upload_url = f"{server.url}/api/v1/files/upload"
+
+        start = time.perf_counter()
+        run_threads(sources, upload_url)
+        elapsed = time.perf_counter() - start
+        print(f"🧵 threads(8): {count} ảnh trong {elapsed:.2f}s → {count / elapsed:.1f} ảnh/s")
+
+        if not HAS_AIOHTTP:
+            print("⚠️ Chưa cài aiohttp, bỏ qua async pipeline")
+            return
+
+        pipeline = AsyncChapterPipeline(upload_url=upload_url, auth=("bench", ""))
+        start = time.perf_counter()
+        pipeline.run(sources, "bench")
+        elapsed = time.perf_counter() - start
+        print(f"⚡ async({pipeline.max_in_flight}): {count} ảnh trong {elapsed:.2f}s → {count / elapsed:.1f} ảnh/s")
+
+
+if __name__ == "__main__":
+    main()
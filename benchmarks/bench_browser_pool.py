@@ -0,0 +1,65 @@
+"""
+Benchmark: độ trễ mỗi chapter khi dùng BrowserPool (warm) vs launch browser mỗi lần (cold)
+Dùng fake server local phục vụ trang chapter + ảnh.
+
+Cách chạy:
+    python benchmarks/bench_browser_pool.py [so_chapter]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fake_servers import FakeServer
+from crawler.browser_pool import BrowserPool, HAS_PLAYWRIGHT
+
+
+def load_chapter(url):
+    def fn(page):
+        page.goto(url, wait_until="domcontentloaded")
+        return len(page.query_selector_all(".reading-detail img"))
+    return fn
+
+
+def run_cold(url, user_data_dir):
+    """Đường cũ: sync_playwright + launch_persistent_context cho mỗi chapter"""
+    from playwright.sync_api import sync_playwright
+    with sync_playwright() as p:
+        context = p.chromium.launch_persistent_context(user_data_dir, headless=True)
+        page = context.new_page()
+        count = load_chapter(url)(page)
+        context.close()
+    return count
+
+
+def main():
+    chapters = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    if not HAS_PLAYWRIGHT:
+        print("⚠️ Chưa cài Playwright")
+        return
+
+    with FakeServer(latency=0.01) as server, tempfile.TemporaryDirectory() as tmp:
+        url = f"{server.url}/chapter.html"
+
+        timings = []
+        for _ in range(chapters):
+            start = time.perf_counter()
+            run_cold(url, os.path.join(tmp, "cold"))
+            timings.append(time.perf_counter() - start)
+        print(f"🧊 cold:   trung bình {sum(timings) / len(timings) * 1000:.0f} ms/chapter")
+
+        pool = BrowserPool(size=1, user_data_dir=os.path.join(tmp, "pool"))
+        pool.run(load_chapter(url))  # warm-up
+        timings = []
+        for _ in range(chapters):
+            start = time.perf_counter()
+            pool.run(load_chapter(url))
+            timings.append(time.perf_counter() - start)
+        pool.close()
+        print(f"🔥 pooled: trung bình {sum(timings) / len(timings) * 1000:.0f} ms/chapter")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Benchmark: FlareSolverr session pool vs request.get không session
+(kiểm tra pool không tạo quá pool_size session: tests/test_flaresolverr_sessions.py)
+Fake FlareSolverr local: request.get không kèm session tốn thêm thời gian
+"giải challenge"; request trong session đã giải thì nhanh. Đếm số session tạo ra.
+
+Cách chạy:
+    python benchmarks/bench_flaresolverr_sessions.py [so_trang] [solve_giay]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fake_servers import fake_flaresolverr
+from crawler.flaresolverr_client import FlareSolverrClient
+
+
+def run(client, urls, workers=4):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(client.get_page, urls))
+    return time.perf_counter() - start
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    solve_time = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+
+    with fake_flaresolverr(solve_time) as server:
+        urls = [f"https://example.test/page/{i}" for i in range(pages)]
+
+        for pool_size in (0, 2):
+            client = FlareSolverrClient()
+            client.base_url = server.url
+            client.pool_size = pool_size
+            client.available = True
+            before = server.stats["sessions.create"]
+            elapsed = run(client, urls)
+            client.close()
+            created = server.stats["sessions.create"] - before
+            print(f"{'🔁 pool=' + str(pool_size):<12} {pages} trang trong {elapsed:.2f}s "
+                  f"({pages / elapsed:.1f} trang/s), sessions.create = {created}")
+
+
+if __name__ == "__main__":
+    main()
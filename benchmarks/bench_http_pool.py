@@ -0,0 +1,87 @@
+"""
+Benchmark: requests.post cấp module (kết nối TLS mới mỗi upload) vs HTTPPool (keep-alive)
+Dùng fake server HTTPS local (chứng chỉ tự ký tạo bằng openssl) giả lập ImageKit upload;
+đo upload/giây và số kết nối (= số TLS handshake) server nhận được.
+
+Cách chạy:
+    python benchmarks/bench_http_pool.py [so_upload] [so_thread] [latency_giay]
+"""
+
+import os
+import ssl
+import sys
+import time
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fake_servers import FakeServer
+from crawler.http_pool import HTTPPool
+from crawler.rate_limiter import rate_limiter
+from imagekit_storage import MultipartBody
+
+
+def make_certificate(directory):
+    """Chứng chỉ tự ký cho 127.0.0.1"""
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+         "-keyout", key, "-out", cert],
+        check=True, capture_output=True
+    )
+    return cert, key
+
+
+def upload(send, upload_url, image, idx):
+    body = MultipartBody({"fileName": f"{idx:03d}.jpg", "folder": "/bench"}, f"{idx:03d}.jpg", image, "image/jpeg")
+    response = send("POST", upload_url, data=body, headers={"Content-Type": body.content_type})
+    return response.json().get("url")
+
+
+def run(name, send, count, threads, latency, context, image):
+    with FakeServer(latency=latency, ssl_context=context) as server:
+        upload_url = f"{server.url}/api/v1/files/upload"
+        # Benchmark đo kết nối, không đo rate limiter
+        rate_limiter.host_rates[urlparse(upload_url).netloc] = 100000
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            urls = list(executor.map(lambda idx: upload(send, upload_url, image, idx), range(count)))
+        elapsed = time.perf_counter() - start
+        assert all(urls), "có upload lỗi"
+        connections = server.stats["connections"]
+    print(f"  {name:<22} {count / elapsed:7.1f} upload/s   {connections:4d} kết nối TLS (handshake) / {count} upload")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.005
+    image = b"\xff\xd8\xff" + os.urandom(100 * 1024)
+
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            cert, key = make_certificate(directory)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"❌ Cần openssl để tạo chứng chỉ tự ký: {e}")
+            sys.exit(1)
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert, key)
+
+        print(f"🔐 {count} upload × 100 KB qua HTTPS local, {threads} thread, latency {latency}s")
+
+        # Đường cũ: rate_limiter.request không session → requests.request mở kết nối mới mỗi lần
+        run("requests.post (cũ)", lambda method, url, **kw: rate_limiter.request(method, url, verify=cert, timeout=60, **kw),
+            count, threads, latency, context, image)
+
+        pool = HTTPPool(pool_size=threads, host_pool_sizes={})
+        run("HTTPPool keep-alive", lambda method, url, **kw: pool.request(method, url, verify=cert, **kw),
+            count, threads, latency, context, image)
+        totals = pool.snapshot()["totals"]
+        print(f"    pool: {totals['requests']} request, {totals['connections']} kết nối mới, {totals['reused']} tái sử dụng")
+
+
+if __name__ == "__main__":
+    main()
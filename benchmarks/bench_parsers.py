@@ -0,0 +1,177 @@
+"""
+Benchmark + kiểm tra kết quả giống nhau giữa các HTML parser (soup / lxml / selectolax)
+Dùng trang giả lập (trang chủ, trang truyện nhiều chapter, trang chapter), các trang
+đã lưu trong tests/fixtures/html và tùy chọn thêm thư mục khác (file .html hoặc
+entry HTML cache .json.gz).
+
+Cách chạy:
+    python benchmarks/bench_parsers.py [so_lan_lap] [--fixtures data/html_cache]
+
+Tên file .html cần bắt đầu bằng home / story / chapter để biết loại trang.
+Thoát với mã 1 nếu có parser cho kết quả khác BeautifulSoup.
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.parsers import get_parser, available_parsers
+
+PAGE_METHODS = {"home": "parse_home", "story": "parse_story", "chapter": "chapter_images"}
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "fixtures", "html")
+
+
+def home_html(items=40):
+    """Trang chủ: .item với h3 a, ảnh lazy (data-original / data-src / src), chapter mới nhất"""
+    rows = []
+    for i in range(items):
+        img_attr = ["data-original", "data-src", "src"][i % 3]
+        chapter = (
+            f'<ul class="comic-item"><li class="chapter clearfix"><a href="/truyen-tranh/truyen-{i}/chuong-{i + 10}">'
+            f' Chapter <b>{i + 10}</b> </a></li></ul>'
+            if i % 4 else f'<div class="chapter"><a href="#">Chương\n {i}</a></div>'
+        )
+        rows.append(
+            f'<div class="item"><figure class="clearfix"><div class="image">'
+            f'<img {img_attr}="//cdn.example.com/cover-{i}.jpg" alt="cover"></div>'
+            f'<figcaption><h3><a href="https://nettruyen.me.uk/truyen-tranh/truyen-{i}"> Truyện &amp; số {i} <!-- ghi chú --></a></h3>'
+            f'{chapter}</figcaption></figure></div>'
+        )
+    # Item không có h3 a phải bị bỏ qua
+    rows.append('<div class="item ads"><img src="/ads.png"></div>')
+    return f'<html><head><title>Home</title><script>var a = "<div class=item>";</script></head><body><div class="items">{"".join(rows)}</div></body></html>'
+
+
+def story_html(chapters=1500):
+    """Trang truyện với danh sách chapter dài (hàng heading + link tương đối/tuyệt đối)"""
+    rows = ['<li class="row heading"><div class="col-xs-5">Số chương</div></li>']
+    for i in range(chapters, 0, -1):
+        href = f"/truyen-tranh/truyen-dai/chuong-{i}" if i % 2 else f"https://nettruyen.me.uk/truyen-tranh/truyen-dai/chuong-{i}"
+        rows.append(
+            f'<li class="row "><div class="col-xs-5 chapter"><a href="{href}" data-id="{i}">Chapter {i}</a></div>'
+            f'<div class="col-xs-4 text-center no-wrap small">{i % 28 + 1}/10/2024</div></li>'
+        )
+    genres = "".join(f'<a href="/the-loai/{g}">{g.title()}</a> - ' for g in ("action", "fantasy", "manhua"))
+    return f"""<html><head><title>Truyện dài</title><style>.x {{ color: red }}</style></head><body>
+<article id="item-detail">
+  <h1 class="title-detail">  Truyện <span>Dài</span>  Kỳ </h1>
+  <div class="detail-info"><div class="row">
+    <div class="col-xs-4 col-image"><img data-original="https://cdn.example.com/thumb.jpg" src="/placeholder.png"></div>
+    <div class="col-xs-8 col-info"><ul class="list-info">
+      <li class="author row"><p class="name col-xs-4">Tác giả</p><p class="col-xs-8">Tác <i>Giả</i> A</p></li>
+      <li class="status row"><p class="name col-xs-4">Tình trạng</p><p class="col-xs-8">Đang tiến hành</p></li>
+      <li class="kind row"><p class="name col-xs-4">Thể loại</p><p class="col-xs-8">{genres}</p></li>
+    </ul></div>
+  </div></div>
+  <div class="detail-content"><h3>Giới thiệu</h3><p> Mô tả <b>dài</b>&nbsp;về truyện.
+  <script>ignored()</script></p><p>Đoạn 2</p></div>
+  <div class="list-chapter" id="nt_listchapter"><nav><ul>{"".join(rows)}</ul></nav></div>
+</article></body></html>"""
+
+
+def chapter_html(images=80):
+    """Trang chapter: ảnh nằm trong .reading-detail / .page-chapter, vài ảnh không có src"""
+    pages = []
+    for i in range(images):
+        if i % 10 == 9:
+            pages.append(f'<div class="page-chapter" id="page_{i}"><img alt="trống"></div>')
+        else:
+            attr = ["data-original", "data-src", "src"][i % 3]
+            pages.append(f'<div class="page-chapter" id="page_{i}"><img {attr}="//img.example.com/{i:03d}.jpg" alt="Trang {i}"></div>')
+    return (
+        '<html><body><div class="reading"><div class="container"><div class="reading-detail box_doc">'
+        f'{"".join(pages)}</div></div></div><div class="top"><img src="/logo.png"></div></body></html>'
+    )
+
+
+def load_fixtures(path):
+    """Đọc trang thật đã lưu: *.html (tên bắt đầu bằng loại trang) hoặc entry HTML cache *.json.gz"""
+    fixtures = []
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            full = os.path.join(root, name)
+            if name.endswith(".json.gz"):
+                with gzip.open(full, "rt", encoding="utf-8") as f:
+                    entry = json.load(f)
+                if entry.get("page_type") in PAGE_METHODS:
+                    fixtures.append((f"{entry['page_type']}:{entry['url'][-40:]}", entry["page_type"], entry["html"]))
+            elif name.endswith(".html"):
+                kind = next((k for k in PAGE_METHODS if name.startswith(k)), None)
+                if kind:
+                    with open(full, encoding="utf-8") as f:
+                        fixtures.append((name, kind, f.read()))
+    return fixtures
+
+
+def check_parity(parsers, fixtures):
+    """So sánh kết quả mọi parser với BeautifulSoup, trả về số trang lệch"""
+    reference = parsers["soup"]
+    mismatches = 0
+    for label, kind, html in fixtures:
+        expected = getattr(reference, PAGE_METHODS[kind])(html)
+        for name, parser in parsers.items():
+            if name == "soup":
+                continue
+            actual = getattr(parser, PAGE_METHODS[kind])(html)
+            if actual != expected:
+                mismatches += 1
+                print(f"  ❌ {name} lệch ở {label}")
+                print(f"     soup: {json.dumps(expected, ensure_ascii=False)[:300]}")
+                print(f"     {name}: {json.dumps(actual, ensure_ascii=False)[:300]}")
+    return mismatches
+
+
+def bench(parser, kind, html, repeat):
+    """pages/giây và bộ nhớ đỉnh cho 1 loại trang (tracemalloc: chỉ tính phần cấp phát qua Python)"""
+    method = getattr(parser, PAGE_METHODS[kind])
+    method(html)  # warm-up
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        method(html)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    method(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return repeat / elapsed, peak
+
+
+def main():
+    args = sys.argv[1:]
+    fixtures_dir = None
+    if "--fixtures" in args:
+        i = args.index("--fixtures")
+        fixtures_dir = args[i + 1]
+        del args[i:i + 2]
+    repeat = int(args[0]) if args else 50
+
+    parsers = {name: get_parser(name) for name in available_parsers()}
+    synthetic = [
+        ("home (40 truyện)", "home", home_html()),
+        ("story (1500 chapters)", "story", story_html()),
+        ("chapter (80 ảnh)", "chapter", chapter_html()),
+    ]
+    fixtures = synthetic + load_fixtures(FIXTURES_DIR) + (load_fixtures(fixtures_dir) if fixtures_dir else [])
+
+    print(f"🔍 Kiểm tra kết quả ({len(fixtures)} trang, parser: {', '.join(parsers)})")
+    mismatches = check_parity(parsers, fixtures)
+    if not mismatches:
+        print("  ✅ Tất cả parser cho kết quả giống BeautifulSoup")
+
+    print(f"\n⏱️ Benchmark ({repeat} lần mỗi trang)")
+    for label, kind, html in synthetic:
+        for name, parser in parsers.items():
+            pages_per_sec, peak = bench(parser, kind, html, repeat)
+            print(f"  {label:<24} {name:<11} {pages_per_sec:8.1f} pages/s   peak {peak / 1024:8.0f} KB")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
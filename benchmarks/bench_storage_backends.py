@@ -0,0 +1,82 @@
+"""
+Benchmark: thông lượng ghi ảnh của các storage backend (ảnh/giây, MB/giây)
+    imagekit  - ImageKitBackend gửi tới fake upload server local (giả lập độ trễ ImageKit)
+    local     - LocalBackend trong thư mục tạm, put() từng ảnh vs put_many()
+    s3        - S3Backend nếu có boto3 + STORAGE_S3_ENDPOINT/STORAGE_S3_BUCKET (vd. MinIO local)
+
+Cách chạy:
+    python benchmarks/bench_storage_backends.py [so_anh] [kich_thuoc_kb] [latency_giay]
+    STORAGE_S3_ENDPOINT=http://localhost:9000 STORAGE_S3_BUCKET=bench \\
+        AWS_ACCESS_KEY_ID=minioadmin AWS_SECRET_ACCESS_KEY=minioadmin python benchmarks/bench_storage_backends.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fake_servers import FakeServer
+from crawler.rate_limiter import rate_limiter
+from crawler.storage_backends import LocalBackend, S3Backend, HAS_BOTO3, S3_ENDPOINT, S3_BUCKET
+from imagekit_storage import ImageKitBackend
+
+
+def run_put(backend, items, threads):
+    """Như pipeline upload: nhiều thread, mỗi thread put() 1 ảnh"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        urls = list(executor.map(lambda item: backend.put(*item), items))
+    return time.perf_counter() - start, urls
+
+
+def run_put_many(backend, items, threads):
+    start = time.perf_counter()
+    urls = backend.put_many(items, max_workers=threads)
+    return time.perf_counter() - start, urls
+
+
+def show(name, items, elapsed, urls):
+    total_mb = sum(len(item[0]) for item in items) / 1048576
+    ok = sum(1 for url in urls if url)
+    print(f"  {name:<22} {len(items) / elapsed:8.1f} ảnh/s  {total_mb / elapsed:8.1f} MB/s   ({ok}/{len(items)} ảnh)")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    size_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    threads = 8
+
+    items = [(b"\xff\xd8\xff" + os.urandom(size_kb * 1024 - 3), "manga/bench/1", f"{i:03d}.jpg", "image/jpeg")
+             for i in range(count)]
+    print(f"🖼️ {count} ảnh × {size_kb} KB, {threads} thread, latency ImageKit giả lập {latency}s")
+
+    with FakeServer(latency=latency) as server:
+        backend = ImageKitBackend()
+        backend.UPLOAD_URL = f"{server.url}/api/v1/files/upload"
+        rate_limiter.host_rates[urlparse(backend.UPLOAD_URL).netloc] = 100000
+        show("imagekit put", items, *run_put(backend, items, threads))
+
+    with tempfile.TemporaryDirectory() as root:
+        backend = LocalBackend(root=root)
+        show("local put", items, *run_put(backend, items, threads))
+    with tempfile.TemporaryDirectory() as root:
+        backend = LocalBackend(root=root)
+        show("local put_many", items, *run_put_many(backend, items, threads))
+        # Ghi lại đúng nội dung cũ: content-addressed → chỉ kiểm tra tồn tại
+        show("local put_many (trùng)", items, *run_put_many(backend, items, threads))
+
+    if HAS_BOTO3 and S3_ENDPOINT and S3_BUCKET:
+        backend = S3Backend()
+        if backend.connect():
+            show("s3 put", items, *run_put(backend, items, threads))
+            show("s3 put_many", items, *run_put_many(backend, items, threads))
+    else:
+        print("  s3: bỏ qua (cần boto3 + STORAGE_S3_ENDPOINT + STORAGE_S3_BUCKET, vd. MinIO local)")
+
+
+if __name__ == "__main__":
+    main()
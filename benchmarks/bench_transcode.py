@@ -0,0 +1,105 @@
+"""
+Benchmark: bytes tiết kiệm + CPU mỗi ảnh khi transcode sang WebP / AVIF
+Dùng strip webtoon giả lập (PNG + JPEG: nền phẳng, gradient, nét vẽ, chữ) và
+tùy chọn thêm ảnh thật trong 1 thư mục.
+
+Cách chạy:
+    python benchmarks/bench_transcode.py [so_anh] [--images thu_muc_anh] [--quality 80]
+"""
+
+import io
+import os
+import sys
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.transcoder import Transcoder, HAS_PIL, available_targets, sniff_format
+
+if HAS_PIL:
+    from PIL import Image, ImageDraw
+
+
+def strip_image(seed, width=720, height=4000, fmt="PNG"):
+    """Strip webtoon giả lập: các khung nền phẳng/gradient, nét vẽ, bong bóng thoại"""
+    rnd = random.Random(seed)
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    y = 0
+    while y < height:
+        panel = rnd.randint(600, 1200)
+        base = tuple(rnd.randint(40, 230) for _ in range(3))
+        for row in range(y, min(height, y + panel), 4):
+            shade = tuple(min(255, c + (row - y) * 60 // panel) for c in base)
+            draw.rectangle([20, row, width - 20, row + 3], fill=shade)
+        for _ in range(40):
+            x0, y0 = rnd.randint(20, width - 20), rnd.randint(y, y + panel)
+            draw.line([x0, y0, x0 + rnd.randint(-200, 200), y0 + rnd.randint(-200, 200)],
+                      fill=(0, 0, 0), width=rnd.randint(1, 4))
+        bx, by = rnd.randint(40, width - 300), y + 40
+        draw.ellipse([bx, by, bx + 260, by + 140], fill="white", outline="black", width=3)
+        draw.text((bx + 40, by + 60), f"Chapter {seed} - trang {y // 100}", fill="black")
+        y += panel + 30
+    out = io.BytesIO()
+    img.save(out, fmt, **({"quality": 92} if fmt == "JPEG" else {}))
+    return out.getvalue()
+
+
+def load_images(path):
+    images = []
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), "rb") as f:
+            data = f.read()
+        if sniff_format(data):
+            images.append((name, data))
+    return images
+
+
+def run(target, images, quality, threads=8):
+    """Giống crawler: nhiều thread download gọi prepare(), encode chạy ở process pool"""
+    transcoder = Transcoder(mode=target, quality=quality)
+    transcoder.prepare(images[0][1])  # khởi động process pool, không tính vào kết quả
+    for key in transcoder.stats:
+        transcoder.stats[key] = 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda item: transcoder.prepare(item[1]), images))
+    elapsed = time.perf_counter() - start
+    return transcoder.snapshot(), len(images) / elapsed
+
+
+def main():
+    if not HAS_PIL:
+        print("❌ Cần cài Pillow: pip install Pillow")
+        sys.exit(1)
+
+    args = sys.argv[1:]
+    options = {}
+    for flag in ("--images", "--quality"):
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+    count = int(args[0]) if args else 12
+    quality = int(options.get("--quality", 80))
+
+    images = [(f"synthetic-{i}.{'png' if i % 2 else 'jpg'}", strip_image(i, fmt="PNG" if i % 2 else "JPEG"))
+              for i in range(count)]
+    if "--images" in options:
+        images += load_images(options["--images"])
+
+    targets = available_targets()
+    total_in = sum(len(data) for _, data in images)
+    print(f"🖼️ {len(images)} ảnh, {total_in / 1048576:.1f} MB, quality {quality}, định dạng đích: {', '.join(targets) or 'không có'}")
+
+    for target in targets:
+        stats, images_per_sec = run(target, images, quality)
+        print(f"  {target:<5} {stats['bytes_in'] / 1048576:7.1f} MB → {stats['bytes_out'] / 1048576:7.1f} MB "
+              f"(tiết kiệm {stats['saved_percent']:5.1f}%, {stats['transcoded']}/{stats['images']} ảnh dùng bản mới)   "
+              f"CPU {stats['cpu_ms_per_image']:7.1f} ms/ảnh   {images_per_sec:6.1f} ảnh/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark: upload base64 (form urlencoded, cách cũ) vs multipart nhị phân (MultipartBody)
+Dùng fake server local giả lập ImageKit upload API; đo ảnh/giây, bytes gửi đi
+và đỉnh bộ nhớ Python (tracemalloc) trong lúc upload.
+
+Cách chạy:
+    python benchmarks/bench_upload_multipart.py [so_anh] [kich_thuoc_kb] [latency_giay]
+"""
+
+import os
+import sys
+import time
+import base64
+import tracemalloc
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fake_servers import FakeServer
+from imagekit_storage import MultipartBody, guess_mime_type
+
+
+def upload_base64(session, upload_url, file_bytes, file_name):
+    """Đường cũ: base64 → form urlencoded (body lớn hơn ~33%, 3 bản sao trong RAM)"""
+    data = {
+        "file": base64.b64encode(file_bytes).decode('utf-8'),
+        "fileName": file_name,
+        "folder": "/bench",
+        "useUniqueFileName": "false",
+        "overwriteFile": "true"
+    }
+    return session.post(upload_url, data=data, timeout=60).json().get("url")
+
+
+def upload_multipart(session, upload_url, file_bytes, file_name):
+    """Đường mới: giống ImageStorage._upload_bytes"""
+    body = MultipartBody(
+        {"fileName": file_name, "folder": "/bench", "useUniqueFileName": "false", "overwriteFile": "true"},
+        file_name, file_bytes, guess_mime_type(file_bytes)
+    )
+    return session.post(upload_url, data=body, headers={"Content-Type": body.content_type}, timeout=60).json().get("url")
+
+
+def run(upload, images, upload_url, threads, trace=False):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=threads)
+    session.mount("http://", adapter)
+
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        urls = list(executor.map(lambda item: upload(session, upload_url, item[1], item[0]), images))
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    assert all(urls), "có ảnh upload lỗi"
+    return elapsed, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 800
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.01
+    threads = 8
+
+    images = [(f"{i:03d}.jpg", b"\xff\xd8\xff" + os.urandom(size_kb * 1024 - 3)) for i in range(count)]
+    total_mb = count * size_kb / 1024
+    print(f"🖼️ {count} ảnh × {size_kb} KB = {total_mb:.1f} MB, {threads} thread, latency {latency}s")
+
+    for name, upload in (("base64", upload_base64), ("multipart", upload_multipart)):
+        with FakeServer(latency=latency) as server:
+            upload_url = f"{server.url}/api/v1/files/upload"
+            elapsed, _ = run(upload, images, upload_url, threads)
+            sent_mb = server.stats["bytes_received"] / 1048576
+        with FakeServer(latency=latency) as server:
+            _, peak = run(upload, images, f"{server.url}/api/v1/files/upload", threads, trace=True)
+        print(f"  {name:<9} {count / elapsed:7.1f} ảnh/s  {total_mb / elapsed:7.1f} MB/s   "
+              f"gửi {sent_mb:7.1f} MB ({sent_mb / total_mb * 100:5.1f}%)   đỉnh RAM Python {peak / 1048576:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
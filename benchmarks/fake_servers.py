@@ -0,0 +1,149 @@
+"""
+Fake HTTP servers cho benchmark và tests - Giả lập CDN ảnh, ImageKit upload API và FlareSolverr
+Chạy local bằng http.server (không cần mạng), có độ trễ giả lập.
+"""
+
+import json
+import time
+import uuid
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        server.count("get")
+        if self.path.endswith(".html"):
+            body, content_type = server.chapter_html(), "text/html; charset=utf-8"
+        else:
+            body, content_type = server.image_bytes, "image/jpeg"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        received = self.rfile.read(length)
+        time.sleep(server.latency)
+        server.count("post", len(received))
+        body = json.dumps({"url": f"http://{self.headers.get('Host')}/uploaded/{server.stats['post']}"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeServer(ThreadingHTTPServer):
+    """Server trả ảnh giả cho GET và JSON {"url": ...} cho POST (HTTPS nếu truyền ssl_context)"""
+    daemon_threads = True
+
+    def __init__(self, latency=0.05, image_size=200_000, handler=_FakeHandler, ssl_context=None):
+        super().__init__(("127.0.0.1", 0), handler)
+        if ssl_context:
+            # Handshake chạy trong thread xử lý kết nối, không chặn vòng accept
+            self.socket = ssl_context.wrap_socket(self.socket, server_side=True, do_handshake_on_connect=False)
+        self.scheme = "https" if ssl_context else "http"
+        self.latency = latency
+        self.image_bytes = b"\xff\xd8" + b"\x00" * (image_size - 2)
+        self.stats = {"get": 0, "post": 0, "bytes_received": 0, "connections": 0}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"{self.scheme}://127.0.0.1:{self.server_address[1]}"
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.stats["connections"] += 1
+        super().process_request(request, client_address)
+
+    def chapter_html(self, images=40):
+        """Trang chapter giả: danh sách <img> lazy-load giống NetTruyen"""
+        imgs = "".join(
+            f'<div class="page-chapter"><img data-src="{self.url}/img/{i}.jpg" src="{self.url}/img/{i}.jpg" '
+            f'loading="lazy" width="700" height="1000"></div>'
+            for i in range(images)
+        )
+        return f'<html><head><title>Chapter</title></head><body><div class="reading-detail">{imgs}</div></body></html>'.encode()
+
+    def count(self, kind, nbytes=0):
+        with self._lock:
+            self.stats[kind] += 1
+            self.stats["bytes_received"] += nbytes
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeFlareSolverrHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply({"msg": "FlareSolverr is ready!"})
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        cmd = payload.get("cmd")
+        if cmd == "sessions.create":
+            session_id = uuid.uuid4().hex
+            with server._lock:
+                server.sessions[session_id] = False  # chưa giải challenge
+            server.count("sessions.create")
+            return self._reply({"status": "ok", "session": session_id})
+        if cmd == "sessions.destroy":
+            with server._lock:
+                server.sessions.pop(payload.get("session"), None)
+            return self._reply({"status": "ok"})
+        if cmd == "sessions.list":
+            return self._reply({"status": "ok", "sessions": list(server.sessions)})
+        if cmd == "request.get":
+            session_id = payload.get("session")
+            with server._lock:
+                solved = server.sessions.get(session_id, False)
+                if session_id in server.sessions:
+                    server.sessions[session_id] = True
+            time.sleep(server.latency if solved else server.solve_time)
+            server.count("request.get")
+            return self._reply({"status": "ok", "solution": {
+                "response": "<html><title>ok</title></html>", "cookies": [], "userAgent": "fake", "status": 200
+            }})
+        self._reply({"status": "error", "message": f"unknown cmd {cmd}"})
+
+
+def fake_flaresolverr(solve_time=0.5, latency=0.05):
+    """FakeServer giả lập FlareSolverr: request.get lần đầu của mỗi session tốn solve_time giây"""
+    server = FakeServer(latency=latency, handler=FakeFlareSolverrHandler)
+    server.solve_time = solve_time
+    server.sessions = {}
+    server.stats.update({"sessions.create": 0, "request.get": 0})
+    return server
@@ -0,0 +1,171 @@
+"""
+Async Image Pipeline - Download + Upload ảnh chapter trên 1 event loop
+Dùng 1 aiohttp session (connection pool) để chạy song song hàng trăm
+request download/upload thay vì giới hạn 8 thread mỗi chapter.
+
+Mỗi lượt download vẫn giữ 1 slot của budget toàn process image_slots
+(DOWNLOAD_IMAGE_CONCURRENCY) như đường thread, nên chạy async song song
+với các chapter tải bằng thread không vượt quá giới hạn chung.
+"""
+
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from imagekit_storage import image_storage, guess_mime_type
+from crawler.rate_limiter import rate_limiter
+from crawler.image_dedup import image_dedup
+from crawler.transcoder import transcoder
+from crawler.image_tiles import image_tiler
+from crawler.chapter_scheduler import image_slots
+
+# aiohttp là tùy chọn - không có thì crawler dùng ThreadPoolExecutor như cũ
+try:
+    import aiohttp
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
+
+class _SharedImageSlot:
+    """async with: giữ 1 slot của image_slots (threading semaphore dùng chung với đường thread)"""
+
+    async def __aenter__(self):
+        # Không block event loop: thử acquire không chờ, hết slot thì ngủ ngắn rồi thử lại
+        delay = 0.005
+        while not image_slots.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    async def __aexit__(self, *exc):
+        image_slots.release()
+
+
+class AsyncChapterPipeline:
+    def __init__(self, max_in_flight=None, upload_url=None, auth=None):
+        # Số request đồng thời tối đa (download + upload) trên event loop
+        self.max_in_flight = max_in_flight or int(os.getenv("ASYNC_MAX_IN_FLIGHT", "64"))
+        # Backend không phải ImageKit (local / s3): không có upload URL, ghi qua backend.put trong thread
+        backend = image_storage.backend
+        self.upload_url = upload_url or getattr(backend, "UPLOAD_URL", None)
+        self.auth = auth if auth is not None else (backend._get_auth() if self.upload_url else None)
+        self.timeout = 60
+
+    async def _download(self, session, src, headers, cookies):
+        """Tải 1 ảnh về dạng bytes (người gọi đã chờ rate limiter)"""
+        async with session.get(src, headers=headers, cookies=cookies) as response:
+            rate_limiter.feedback(src, response.status, response.headers.get("Retry-After"))
+            if response.status != 200:
+                return None
+            data = await response.read()
+            return data if len(data) > 1000 else None
+
+    async def _upload(self, session, file_bytes, folder, file_name, transcode=True):
+        """Upload bytes lên ImageKit qua dedup (cùng format với ImageStorage.upload_from_bytes)"""
+        # Tra hash → URL chạy trong thread vì pymongo là blocking
+        digest, url = await asyncio.to_thread(image_dedup.lookup, file_bytes, folder)
+        if url:
+            return url
+        # Transcode (nếu bật) chạy ở process pool, đuôi file theo định dạng thật
+        data, mime_type = file_bytes, None
+        if transcode:
+            data, ext, mime_type = await transcoder.prepare_async(file_bytes)
+            file_name = f"{os.path.splitext(file_name)[0]}.{ext}"
+        # Ghi theo nội dung để URL chia sẻ qua dedup không bị repair chapter ghi đè
+        url = await self._post_upload(session, data, *image_dedup.target(digest, folder, file_name), mime_type)
+        await asyncio.to_thread(image_dedup.remember, digest, url, file_bytes, folder)
+        return url
+
+    async def _post_upload(self, session, file_bytes, folder, file_name, mime_type=None):
+        if not self.upload_url:
+            return await asyncio.to_thread(image_storage.backend.put, file_bytes, folder, file_name, mime_type)
+        # Multipart nhị phân như ImageKitBackend.put (không base64)
+        form = aiohttp.FormData()
+        form.add_field("file", file_bytes, filename=file_name, content_type=mime_type or guess_mime_type(file_bytes))
+        form.add_field("fileName", file_name)
+        form.add_field("folder", f"/{folder}")
+        form.add_field("useUniqueFileName", "false")
+        form.add_field("overwriteFile", "true")
+
+        await rate_limiter.acquire_async(self.upload_url)
+        async with session.post(self.upload_url, data=form, auth=aiohttp.BasicAuth(*self.auth)) as response:
+            rate_limiter.feedback(self.upload_url, response.status, response.headers.get("Retry-After"))
+            if response.status != 200:
+                print(f"❌ Lỗi upload: {response.status}")
+                return None
+            result = await response.json(content_type=None)
+            return result.get('url')
+
+    async def _upload_page(self, session, data, folder_path, idx):
+        """Như ImageStorage.upload_page: strip quá cao được cắt tile (process pool) rồi upload theo thứ tự"""
+        width, height, tiles = await image_tiler.split_async(data)
+        if not tiles:
+            url = await self._upload(session, data, folder_path, f"{idx:03d}.jpg")
+            return {"url": url, "width": width, "height": height} if url else None
+        uploaded = []
+        for t, (tile_bytes, ext, tile_width, tile_height) in enumerate(tiles):
+            url = await self._upload(session, tile_bytes, folder_path, f"{idx:03d}-{t:02d}.{ext}", transcode=False)
+            if not url:
+                return None
+            uploaded.append({"url": url, "width": tile_width, "height": tile_height})
+        return {"url": uploaded[0]["url"], "width": width, "height": height, "tiles": uploaded}
+
+    async def _process(self, session, semaphore, idx, src, folder_path, headers, cookies):
+        """Download rồi upload 1 ảnh, giới hạn bởi semaphore (download còn giới hạn bởi budget image_slots)"""
+        try:
+            # Chờ lượt của host (kể cả Retry-After) trước, chỉ giữ slot trong lúc tải
+            await rate_limiter.acquire_async(src)
+            async with _SharedImageSlot(), semaphore:
+                data = await self._download(session, src, headers, cookies)
+            if not data:
+                return idx, None
+            async with semaphore:
+                return idx, await self._upload_page(session, data, folder_path, idx)
+        except Exception as e:
+            print(f"  ❌ Ảnh {idx} lỗi: {e}")
+            return idx, None
+
+    async def run_async(self, sources, folder_path, headers=None, cookies=None):
+        """
+        Download + Upload tất cả ảnh của chapter
+
+        Args:
+            sources: List of (idx, src) tuples
+            folder_path: Folder trên ImageKit
+            headers: Headers cho request tải ảnh (User-Agent, Referer)
+            cookies: Cookies Cloudflare (dict)
+
+        Returns:
+            List kết quả theo thứ tự idx ({url, width, height, tiles?}, None cho ảnh lỗi)
+        """
+        if not sources:
+            return []
+
+        results = [None] * (max(idx for idx, _ in sources) + 1)
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight, limit_per_host=0)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        completed = 0
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            tasks = [
+                self._process(session, semaphore, idx, src, folder_path, headers or {}, cookies or {})
+                for idx, src in sources
+            ]
+            for coro in asyncio.as_completed(tasks):
+                idx, uploaded = await coro
+                if uploaded:
+                    results[idx] = uploaded
+                    completed += 1
+                    print(f"  ☁️ [{completed}/{len(sources)}] Downloaded + Uploaded (async)")
+
+        return results
+
+    def run(self, sources, folder_path, headers=None, cookies=None):
+        """Chạy pipeline đồng bộ (gọi từ code thread thường)"""
+        return asyncio.run(self.run_async(sources, folder_path, headers, cookies))
+
+
+# Singleton instance
+async_pipeline = AsyncChapterPipeline() if HAS_AIOHTTP else None
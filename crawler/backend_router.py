@@ -0,0 +1,172 @@
+"""
+Backend Router - Chọn thứ tự FlareSolverr / CloudScraper / Playwright theo sức khỏe
+Ghi nhận tỉ lệ thành công + độ trễ gần đây của từng backend cho từng loại
+thao tác (home, story, chapter), ưu tiên backend nhanh và ổn định hơn.
+Backend lỗi liên tục bị ngắt (circuit open), sau thời gian nghỉ cho thử lại
+1 request (half-open) trước khi dùng lại bình thường.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+
+WINDOW = int(os.getenv("BACKEND_STATS_WINDOW", "20"))           # số lần gọi gần nhất để tính stats
+FAILURE_THRESHOLD = float(os.getenv("BACKEND_FAILURE_THRESHOLD", "0.5"))
+MIN_CALLS = 4                                                    # tối thiểu số lần gọi trước khi xét ngắt
+CONSECUTIVE_FAILURES = 3                                         # lỗi liên tiếp → ngắt ngay
+OPEN_SECONDS = int(os.getenv("BACKEND_OPEN_SECONDS", "60"))
+MAX_OPEN_SECONDS = 900
+
+# Độ trễ giả định (giây) khi chưa có dữ liệu - giữ thứ tự mặc định ban đầu
+PRIOR_LATENCY = {"flaresolverr": 5.0, "cloudscraper": 10.0, "playwright": 20.0}
+
+
+class _Circuit:
+    def __init__(self):
+        self.state = "closed"   # closed / open / half_open
+        self.opened_at = 0
+        self.open_seconds = OPEN_SECONDS
+        self.calls = deque(maxlen=WINDOW)   # True/False, mọi thao tác
+        self.consecutive_failures = 0
+        self.probing = False
+
+
+class BackendRouter:
+    def __init__(self):
+        self._stats = {}      # (operation, backend) -> deque[(ok, latency)]
+        self._circuits = {}   # backend -> _Circuit
+        self._decisions = deque(maxlen=50)
+        self._lock = threading.Lock()
+
+    def _circuit(self, backend):
+        if backend not in self._circuits:
+            self._circuits[backend] = _Circuit()
+        return self._circuits[backend]
+
+    def _expected_cost(self, operation, backend):
+        """Thời gian kỳ vọng tới khi thành công = độ trễ trung bình / tỉ lệ thành công"""
+        calls = self._stats.get((operation, backend), ())
+        prior = PRIOR_LATENCY.get(backend, 10.0)
+        successes = sum(1 for ok, _ in calls if ok)
+        latency = (prior + sum(lat for _, lat in calls)) / (1 + len(calls))
+        success_rate = (successes + 1) / (len(calls) + 2)
+        return latency / success_rate
+
+    def _allow(self, backend, now):
+        """Backend có được gọi không (xét circuit breaker)"""
+        circuit = self._circuit(backend)
+        if circuit.state == "open" and now - circuit.opened_at >= circuit.open_seconds:
+            circuit.state = "half_open"
+            circuit.probing = False
+        if circuit.state == "half_open":
+            return not circuit.probing
+        return circuit.state == "closed"
+
+    def order(self, operation, backends):
+        """
+        Sắp xếp các backend khả dụng theo thứ tự nên thử
+
+        Args:
+            operation: Loại thao tác ("home", "story", "chapter")
+            backends: List tên backend đang bật (theo thứ tự mặc định)
+
+        Returns:
+            List backend đã sắp xếp, bỏ qua backend đang bị ngắt
+        """
+        now = time.time()
+        with self._lock:
+            allowed = [b for b in backends if self._allow(b, now)]
+            # Nếu tất cả đều bị ngắt, vẫn thử backend mặc định đầu tiên thay vì bỏ request
+            if not allowed and backends:
+                allowed = [backends[0]]
+            ranked = sorted(allowed, key=lambda b: (self._expected_cost(operation, b), backends.index(b)))
+            self._decisions.append({
+                "time": now,
+                "operation": operation,
+                "order": ranked,
+                "skipped": [b for b in backends if b not in allowed]
+            })
+        return ranked
+
+    def record(self, operation, backend, ok, latency):
+        """Ghi nhận kết quả 1 lần gọi và cập nhật circuit breaker"""
+        now = time.time()
+        with self._lock:
+            key = (operation, backend)
+            if key not in self._stats:
+                self._stats[key] = deque(maxlen=WINDOW)
+            self._stats[key].append((ok, latency))
+
+            circuit = self._circuit(backend)
+            circuit.calls.append(ok)
+            circuit.consecutive_failures = 0 if ok else circuit.consecutive_failures + 1
+
+            if circuit.state == "half_open":
+                circuit.probing = False
+                if ok:
+                    circuit.state = "closed"
+                    circuit.open_seconds = OPEN_SECONDS
+                    circuit.calls.clear()
+                    print(f"🟢 Backend {backend}: hoạt động lại, đóng circuit")
+                else:
+                    circuit.state = "open"
+                    circuit.opened_at = now
+                    circuit.open_seconds = min(circuit.open_seconds * 2, MAX_OPEN_SECONDS)
+                    print(f"🔴 Backend {backend}: thử lại vẫn lỗi, ngắt {circuit.open_seconds}s")
+                return
+
+            failures = sum(1 for c in circuit.calls if not c)
+            failing = (
+                circuit.consecutive_failures >= CONSECUTIVE_FAILURES
+                or (len(circuit.calls) >= MIN_CALLS and failures / len(circuit.calls) >= FAILURE_THRESHOLD)
+            )
+            if circuit.state == "closed" and failing:
+                circuit.state = "open"
+                circuit.opened_at = now
+                print(f"🔴 Backend {backend}: lỗi nhiều ({failures}/{len(circuit.calls)}), ngắt {circuit.open_seconds}s")
+
+    def call(self, operation, backend, fn, is_ok=bool):
+        """Chạy fn(), đo thời gian và ghi nhận kết quả. Exception được tính là thất bại"""
+        with self._lock:
+            circuit = self._circuit(backend)
+            if circuit.state == "half_open":
+                # Chỉ 1 request thử (probe) được chạy khi half-open
+                if circuit.probing:
+                    return None
+                circuit.probing = True
+        start = time.time()
+        result = None
+        try:
+            result = fn()
+        except Exception as e:
+            print(f"❌ Lỗi {backend}: {e}")
+        self.record(operation, backend, is_ok(result), time.time() - start)
+        return result
+
+    def snapshot(self):
+        """Thống kê cho admin: circuit, tỉ lệ thành công, độ trễ, các quyết định gần đây"""
+        with self._lock:
+            stats = {}
+            for (operation, backend), calls in self._stats.items():
+                latencies = [lat for _, lat in calls]
+                stats.setdefault(operation, {})[backend] = {
+                    "calls": len(calls),
+                    "success_rate": round(sum(1 for ok, _ in calls if ok) / len(calls), 3) if calls else None,
+                    "avg_latency": round(sum(latencies) / len(latencies), 3) if latencies else None,
+                    "expected_cost": round(self._expected_cost(operation, backend), 3)
+                }
+            circuits = {
+                backend: {
+                    "state": c.state,
+                    "consecutive_failures": c.consecutive_failures,
+                    "open_seconds": c.open_seconds,
+                    "reopen_in": max(0, round(c.opened_at + c.open_seconds - time.time(), 1)) if c.state == "open" else 0
+                }
+                for backend, c in self._circuits.items()
+            }
+            return {"stats": stats, "circuits": circuits, "decisions": list(self._decisions)[-20:]}
+
+
+# Singleton instance
+backend_router = BackendRouter()
@@ -0,0 +1,225 @@
+"""
+Browser Pool - Giữ sẵn các browser context Playwright (warm) để tái sử dụng
+Tránh tốn 1-3s khởi động Chromium cho mỗi lần crawl và cho phép chạy
+nhiều trang song song.
+
+Playwright sync API gắn với thread tạo ra nó, nên mỗi slot là 1 thread riêng
+sở hữu 1 persistent context. Code crawl truyền vào dạng fn(page) và được chạy
+trên thread của slot rảnh (checkout), xong thì slot trở lại pool (return).
+
+Slot chỉ vào pool sau khi thread của nó đã launch xong browser. Thread chết
+(Playwright / Chromium không khởi động được) thì các task đang chờ nhận lỗi
+ngay và slot bị loại khỏi pool; run() luôn có timeout (BROWSER_POOL_TIMEOUT).
+"""
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+# Kiểm tra Playwright có khả dụng không (không có trên Vercel)
+try:
+    from playwright.sync_api import sync_playwright, Error as PlaywrightError
+    HAS_PLAYWRIGHT = True
+except ImportError:
+    HAS_PLAYWRIGHT = False
+    PlaywrightError = Exception
+
+START_TIMEOUT = 60  # giây chờ 1 slot launch xong browser
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36"
+
+
+class _BrowserSlot(threading.Thread):
+    """1 thread giữ 1 persistent context, chạy lần lượt các task được giao"""
+
+    def __init__(self, pool, index):
+        super().__init__(daemon=True, name=f"browser-slot-{index}")
+        self.pool = pool
+        self.index = index
+        self.tasks = queue.Queue()
+        self.context = None
+        self.pages_served = 0
+        self.restarts = 0
+        self.ready = threading.Event()   # set khi đã launch xong browser hoặc thread đã chết
+        self.dead = False
+        self.error = None
+        self._state_lock = threading.Lock()
+        # Mỗi slot cần profile riêng (Chromium khóa user_data_dir)
+        self.user_data_dir = pool.user_data_dir if index == 0 else f"{pool.user_data_dir}-{index}"
+
+    def _ensure_context(self, playwright):
+        if self.context is None:
+            self.context = playwright.chromium.launch_persistent_context(
+                self.user_data_dir,
+                headless=self.pool.headless,
+                args=["--disable-blink-features=AutomationControlled"],
+                user_agent=self.pool.user_agent
+            )
+            self.pages_served = 0
+
+    def _reset(self, reason):
+        """Đóng context hiện tại, lần dùng sau sẽ launch lại"""
+        print(f"♻️ Browser slot {self.index}: {reason}, khởi động lại context")
+        try:
+            if self.context:
+                self.context.close()
+        except Exception:
+            pass
+        self.context = None
+        self.restarts += 1
+
+    def submit(self, fn):
+        """Giao task cho slot, raise nếu thread của slot đã chết"""
+        future = Future()
+        with self._state_lock:
+            if self.dead:
+                raise RuntimeError(f"Browser slot {self.index} đã dừng: {self.error}")
+            self.tasks.put((fn, future))
+        return future
+
+    def _die(self, error):
+        """Đánh dấu slot chết và trả lỗi cho mọi task còn trong hàng đợi"""
+        with self._state_lock:
+            self.dead = True
+            self.error = error
+        self.ready.set()
+        while True:
+            try:
+                task = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is not None:
+                task[1].set_exception(RuntimeError(f"Browser slot {self.index} đã dừng: {error}"))
+
+    def run(self):
+        try:
+            with sync_playwright() as playwright:
+                self._ensure_context(playwright)
+                if self.dead:
+                    # Launch xong sau START_TIMEOUT, pool đã bỏ slot này
+                    self.context.close()
+                    return
+                self.ready.set()
+                self._serve(playwright)
+            self._die("đã đóng")
+        except Exception as e:
+            print(f"❌ Browser slot {self.index} dừng: {e}")
+            self._die(e)
+
+    def _serve(self, playwright):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            fn, future = task
+            page = None
+            try:
+                self._ensure_context(playwright)
+                page = self.context.new_page()
+                future.set_result(fn(page))
+            except Exception as e:
+                # Browser crash / target closed → launch lại context cho task sau
+                if isinstance(e, PlaywrightError) and ("closed" in str(e).lower() or "crash" in str(e).lower()):
+                    self._reset("browser bị đóng")
+                    page = None
+                future.set_exception(e)
+            finally:
+                try:
+                    if page:
+                        page.close()
+                except Exception:
+                    pass
+                self.pages_served += 1
+                if self.context and self.pages_served >= self.pool.recycle_after:
+                    self._reset(f"đã dùng {self.pages_served} trang")
+                self.pool._release(self)
+        if self.context:
+            self.context.close()
+
+
+class BrowserPool:
+    def __init__(self, size=None, recycle_after=None, user_data_dir=None, user_agent=None, headless=True):
+        self.size = size or int(os.getenv("BROWSER_POOL_SIZE", "2"))
+        self.recycle_after = recycle_after or int(os.getenv("BROWSER_RECYCLE_AFTER", "50"))
+        self.user_data_dir = user_data_dir or os.path.join(os.path.dirname(__file__), "browser_profile")
+        self.user_agent = user_agent or DEFAULT_USER_AGENT
+        self.headless = headless
+        self.timeout = float(os.getenv("BROWSER_POOL_TIMEOUT", "300"))
+        self._free = queue.Queue()
+        self._slots = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        """Khởi tạo các slot ở lần dùng đầu tiên (hoặc khi mọi slot đã chết), chỉ đưa slot đã launch xong vào pool"""
+        with self._lock:
+            if any(not slot.dead for slot in self._slots):
+                return
+            slots = [_BrowserSlot(self, index) for index in range(self.size)]
+            for slot in slots:
+                slot.start()
+            self._slots = []
+            errors = []
+            for slot in slots:
+                if not slot.ready.wait(START_TIMEOUT):
+                    slot._die(f"không khởi động được browser sau {START_TIMEOUT}s")
+                if slot.dead:
+                    errors.append(str(slot.error))
+                    continue
+                self._slots.append(slot)
+                self._free.put(slot)
+            if not self._slots:
+                raise RuntimeError(f"Không khởi động được browser nào: {errors[0] if errors else '?'}")
+
+    def _release(self, slot):
+        self._free.put(slot)
+
+    def run(self, fn, timeout=None):
+        """
+        Chạy fn(page) trên 1 slot rảnh và trả về kết quả
+
+        Args:
+            fn: Hàm nhận page Playwright (chỉ dùng page bên trong hàm)
+            timeout: Số giây tối đa chờ slot rảnh + chạy xong (mặc định BROWSER_POOL_TIMEOUT)
+
+        Returns:
+            Giá trị trả về của fn (exception của fn được raise lại)
+        """
+        if not HAS_PLAYWRIGHT:
+            raise RuntimeError("Playwright chưa được cài đặt")
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            self._start()
+            try:
+                slot = self._free.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                raise TimeoutError(f"Không có browser slot rảnh sau {timeout}s")
+            if slot.dead:
+                # Slot chết khi đang rảnh → bỏ khỏi pool, lấy slot khác
+                continue
+            try:
+                future = slot.submit(fn)
+            except RuntimeError:
+                continue
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+
+    def stats(self):
+        return [
+            {"slot": s.index, "alive": s.context is not None and not s.dead, "pages_served": s.pages_served, "restarts": s.restarts}
+            for s in self._slots
+        ]
+
+    def close(self):
+        """Đóng tất cả browser"""
+        with self._lock:
+            for slot in self._slots:
+                slot.tasks.put(None)
+            for slot in self._slots:
+                slot.join(timeout=10)
+            self._slots = []
+            self._free = queue.Queue()
+
+
+# Singleton instance
+browser_pool = BrowserPool()
@@ -0,0 +1,95 @@
+"""
+Chapter Probe - Kiểm tra các chapter được generate từ pattern URL có tồn tại không
+Danh sách chapter được suy ra từ max_chapter → 0 nên có thể có chapter ảo
+(truyện bắt đầu từ chap 1, bị thiếu số, chap lẻ 12.5...). Mỗi chapter ảo về sau
+tốn 1 lần gọi solver + cả chuỗi fallback khi tải. Probe bằng request nhẹ
+(HEAD, không theo redirect) song song với số luồng giới hạn.
+
+Trạng thái chapter:
+- verified: có trên trang truyện hoặc probe trả 200
+- missing: probe trả 404/410 hoặc redirect về trang khác
+- unknown: chưa kiểm tra được (chưa có cookie Cloudflare, lỗi mạng...)
+"""
+
+import os
+import re
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from crawler.rate_limiter import rate_limiter
+
+PROBE_CONCURRENCY = int(os.getenv("CHAPTER_PROBE_CONCURRENCY", "8"))
+_NUMBER_RE = re.compile(r'(?:chuong|chap|chapter)[/-]?(\d+)(?:[.-](\d+))?', re.IGNORECASE)
+
+
+def chapter_number(chapter_id):
+    """
+    Số thứ tự chapter để sắp xếp/so sánh: (major, minor)
+    chuong-12 → (12, 0), chuong-12-5 / chuong-12.5 → (12, 5), chuong-12-15 → (12, 15) (sau 12.5)
+    """
+    match = _NUMBER_RE.search(chapter_id or "")
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2) or 0)
+
+
+class ChapterProber:
+    def __init__(self, session, concurrency=None, is_challenge=None):
+        """
+        Args:
+            session: requests.Session đã có cookie Cloudflare (cf_clearance) + User-Agent
+            concurrency: Số request probe đồng thời
+            is_challenge: Hàm nhận response, True nếu là trang challenge Cloudflare
+        """
+        self.session = session
+        self.concurrency = concurrency or PROBE_CONCURRENCY
+        self.is_challenge = is_challenge or (lambda response: False)
+        self._blocked = threading.Event()
+
+    def _probe_one(self, chapter):
+        """Trạng thái của 1 chapter"""
+        # Bị Cloudflare chặn → các probe còn lại cũng sẽ bị chặn, dừng sớm
+        if self._blocked.is_set():
+            return "unknown"
+        url = chapter["url"]
+        try:
+            response = rate_limiter.request("HEAD", url, session=self.session, allow_redirects=False, timeout=10)
+            if response.status_code == 405:
+                response = rate_limiter.request("GET", url, session=self.session, allow_redirects=False, timeout=10, stream=True)
+                response.close()
+        except Exception as e:
+            print(f"  ⚠️ Probe {chapter['id']} lỗi: {e}")
+            return "unknown"
+
+        status = response.status_code
+        if status == 200:
+            return "verified"
+        if status in (404, 410):
+            return "missing"
+        if status in (301, 302, 303, 307, 308):
+            # Chapter không tồn tại thường bị redirect về trang truyện
+            location = urlparse(response.headers.get("Location", "")).path.rstrip("/")
+            return "verified" if location.endswith(chapter["id"]) else "missing"
+        if status in (403, 503) and self.is_challenge(response):
+            self._blocked.set()
+        return "unknown"
+
+    def probe(self, chapters):
+        """
+        Probe song song danh sách chapter
+
+        Args:
+            chapters: List chapter dict (id, url)
+
+        Returns:
+            Dict chapter_id → "verified" / "missing" / "unknown"
+        """
+        if not chapters:
+            return {}
+        self._blocked.clear()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            statuses = dict(zip((c["id"] for c in chapters), executor.map(self._probe_one, chapters)))
+        if self._blocked.is_set():
+            print("  🛡️ Probe bị Cloudflare chặn, các chapter còn lại để unknown")
+        return statuses
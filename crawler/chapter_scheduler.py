@@ -0,0 +1,102 @@
+"""
+Chapter Scheduler - Tải nhiều chapter song song cho /api/download-all
+Giới hạn số chapter chạy cùng lúc và tổng số ảnh đang tải/upload (global budget)
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from crawler.image_dedup import image_dedup
+
+# Tổng số ảnh được download/upload đồng thời trên toàn process,
+# dùng chung cho mọi chapter đang chạy (MangaCrawler acquire trước mỗi ảnh)
+IMAGE_CONCURRENCY = int(os.getenv("DOWNLOAD_IMAGE_CONCURRENCY", "24"))
+image_slots = threading.BoundedSemaphore(IMAGE_CONCURRENCY)
+
+
+class ChapterScheduler:
+    def __init__(self, crawler, chapter_concurrency=None):
+        self.crawler = crawler
+        self.chapter_concurrency = chapter_concurrency or int(os.getenv("DOWNLOAD_CHAPTER_CONCURRENCY", "3"))
+
+    def _download_one(self, manga_id, chapter_id):
+        """Tải 1 chapter, trả về event progress hoặc error"""
+        try:
+            images = self.crawler.download_chapter_images(manga_id, chapter_id)
+            return {"type": "progress", "chapter": chapter_id, "images": len(images) if images else 0}
+        except Exception as e:
+            return {"type": "error", "chapter": chapter_id, "error": str(e)}
+
+    def run(self, manga_id, chapters):
+        """
+        Tải toàn bộ chapters, yield các event theo thứ tự hoàn thành
+
+        Args:
+            manga_id: ID của manga
+            chapters: List chapter dict (theo thứ tự muốn tải)
+
+        Yields:
+            Dict event: start / progress / error / complete
+        """
+        total = len(chapters)
+        downloaded = 0
+        completed = 0
+        errors = []
+
+        yield {"type": "start", "total": total, "concurrency": self.chapter_concurrency}
+        dedup_before = image_dedup.manga_stats(manga_id)
+
+        # Bỏ qua các chapter đã có trên cloud, không cần gọi crawler
+        already = set(self.crawler.get_downloaded_chapters(manga_id))
+        pending = []
+        for chapter in chapters:
+            chapter_id = chapter.get("id")
+            if not chapter_id:
+                continue
+            if chapter_id in already:
+                downloaded += 1
+                completed += 1
+                yield {"type": "progress", "current": completed, "total": total, "chapter": chapter_id, "images": 0, "skipped": True}
+            elif chapter.get("status") == "missing":
+                # Chapter generate từ pattern nhưng probe xác nhận không tồn tại
+                completed += 1
+                yield {"type": "progress", "current": completed, "total": total, "chapter": chapter_id, "images": 0, "skipped": True, "missing": True}
+            else:
+                pending.append(chapter_id)
+
+        # Worker threads đẩy kết quả vào queue, generator đọc ra theo thứ tự hoàn thành
+        results = queue.Queue()
+        executor = ThreadPoolExecutor(max_workers=self.chapter_concurrency)
+
+        def on_done(future, chapter_id):
+            # Future bị hủy khi shutdown(cancel_futures=True): generator đã dừng, không cần event
+            if future.cancelled():
+                return
+            error = future.exception()
+            results.put({"type": "error", "chapter": chapter_id, "error": str(error)} if error else future.result())
+
+        try:
+            for chapter_id in pending:
+                future = executor.submit(self._download_one, manga_id, chapter_id)
+                future.add_done_callback(lambda f, chapter_id=chapter_id: on_done(f, chapter_id))
+
+            for _ in range(len(pending)):
+                event = results.get()
+                completed += 1
+                event.update({"current": completed, "total": total})
+                if event["type"] == "progress":
+                    if event["images"]:
+                        downloaded += 1
+                else:
+                    errors.append(f"{event['chapter']}: {event['error']}")
+                yield event
+        finally:
+            # Client ngắt kết nối SSE → hủy các chapter chưa bắt đầu
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        dedup = image_dedup.manga_stats(manga_id, since=dedup_before)
+        if dedup["images"]:
+            print(f"♻️ Dedup {manga_id}: {dedup['hits']}/{dedup['images']} ảnh trùng ({dedup['hit_rate']}%), tiết kiệm {dedup['mb_saved']} MB")
+        yield {"type": "complete", "success": True, "total": total, "downloaded": downloaded, "errors": errors[:10], "dedup": dedup}
@@ -0,0 +1,95 @@
+"""
+Clearance Cache - Lưu cookies Cloudflare (cf_clearance) + User-Agent theo host
+Sau 1 lần FlareSolverr/CloudScraper giải challenge, các trang tiếp theo có thể
+fetch trực tiếp bằng requests với cookie này cho tới khi hết hạn.
+Lưu trong RAM + MongoDB (collection cf_clearance) để các worker dùng chung.
+"""
+
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from database import db
+
+DEFAULT_TTL = int(os.getenv("CF_CLEARANCE_TTL", "1800"))  # giây, khi cookie không có expiry
+DB_RECHECK = 30  # giây giữa 2 lần đọc lại MongoDB khi RAM chưa có
+
+
+class ClearanceCache:
+    def __init__(self):
+        self._entries = {}   # host -> {"cookies", "user_agent", "expires_at"}
+        self._misses = {}    # host -> thời điểm đọc MongoDB gần nhất mà không có
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(cookies):
+        """
+        Chuẩn hóa cookies về dict name -> value và tìm expiry của cf_clearance
+        FlareSolverr trả list [{"name", "value", "expiry"}], CloudScraper trả dict
+        """
+        if isinstance(cookies, dict):
+            return dict(cookies), None
+        values, expiry = {}, None
+        for cookie in cookies or []:
+            name = cookie.get("name")
+            if not name:
+                continue
+            values[name] = cookie.get("value")
+            if name == "cf_clearance":
+                expiry = cookie.get("expiry") or cookie.get("expires")
+        return values, expiry
+
+    def store(self, host, cookies, user_agent):
+        """Lưu cookies vừa giải được cho host"""
+        values, expiry = self._normalize(cookies)
+        if not values or not user_agent:
+            return
+        now = time.time()
+        expires_at = now + DEFAULT_TTL
+        if expiry and expiry > now:
+            expires_at = min(float(expiry), expires_at)
+        entry = {"cookies": values, "user_agent": user_agent, "expires_at": expires_at}
+        with self._lock:
+            self._entries[host] = entry
+            self._misses.pop(host, None)
+        try:
+            db.save_clearance(host, values, user_agent, expires_at)
+        except Exception as e:
+            print(f"⚠️ Không lưu được clearance vào MongoDB: {e}")
+
+    def get(self, host):
+        """Lấy clearance còn hạn của host, None nếu không có"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry and entry["expires_at"] > now:
+                return entry
+            if now - self._misses.get(host, 0) < DB_RECHECK:
+                return None
+        try:
+            entry = db.get_clearance(host)
+        except Exception:
+            entry = None
+        with self._lock:
+            if entry and entry.get("expires_at", 0) > now:
+                self._entries[host] = entry
+                return entry
+            self._entries.pop(host, None)
+            self._misses[host] = now
+        return None
+
+    def invalidate(self, host):
+        """Cookie bị Cloudflare từ chối → xóa để lần sau gọi lại solver"""
+        with self._lock:
+            self._entries.pop(host, None)
+            self._misses[host] = time.time()
+        try:
+            db.delete_clearance(host)
+        except Exception:
+            pass
+
+
+# Singleton instance
+clearance_cache = ClearanceCache()
@@ -6,6 +6,8 @@ Sử dụng cho Vercel serverless (không cần FlareSolverr hay Playwright)
 import cloudscraper
 from bs4 import BeautifulSoup
 
+from crawler.rate_limiter import rate_limiter
+
 
 class CloudScraperClient:
     def __init__(self):
@@ -62,14 +64,15 @@ class CloudScraperClient:
         for attempt in range(retries):
             try:
                 print(f"🌐 CloudScraper attempt {attempt + 1}/{retries}: {url[:60]}...")
-                response = self.scraper.get(url, timeout=max_timeout)
+                response = rate_limiter.request("GET", url, session=self.scraper, timeout=max_timeout)
                 
                 if response.status_code == 200:
                     print(f"✅ CloudScraper success: {len(response.text)} bytes")
                     return {
                         "html": response.text,
                         "cookies": response.cookies.get_dict(),
-                        "status": response.status_code
+                        "status": response.status_code,
+                        "headers": dict(response.headers)
                     }
                 else:
                     print(f"⚠️ CloudScraper response: {response.status_code}")
@@ -83,8 +86,8 @@ class CloudScraperClient:
         
         return None
     
-    def get_image(self, url, referer=None, timeout=30):
-        """Tải ảnh về dưới dạng bytes"""
+    def get_image(self, url, referer=None, timeout=30, slot=None):
+        """Tải ảnh về dưới dạng bytes (slot: semaphore chỉ giữ trong lúc tải)"""
         if not self.available or not self.scraper:
             return None
         
@@ -93,7 +96,7 @@ class CloudScraperClient:
             if referer:
                 headers['Referer'] = referer
             
-            response = self.scraper.get(url, headers=headers, timeout=timeout)
+            response = rate_limiter.request("GET", url, session=self.scraper, slot=slot, headers=headers, timeout=timeout)
             
             if response.status_code == 200 and len(response.content) > 1000:
                 return response.content
@@ -1,12 +1,20 @@
 """
 FlareSolverr Client - Bypass Cloudflare protection
 https://github.com/FlareSolverr/FlareSolverr
+
+Dùng pool các FlareSolverr session (sessions.create) để giữ browser tab
+và cookie Cloudflare giữa các request, tránh giải challenge lại mỗi trang.
 """
 
 import os
+import time
+import atexit
+import threading
 import requests
 from bs4 import BeautifulSoup
 
+from crawler.rate_limiter import rate_limiter
+
 class FlareSolverrClient:
     def __init__(self):
         # FlareSolverr URL - có thể từ env variable hoặc default
@@ -14,6 +22,16 @@ class FlareSolverrClient:
         self.timeout = 60000  # 60 seconds
         self.available = False
         
+        # Session pool
+        self.pool_size = int(os.getenv("FLARESOLVERR_SESSIONS", "2"))
+        self.session_ttl = int(os.getenv("FLARESOLVERR_SESSION_TTL", "600"))  # giây, sau đó tạo session mới
+        self.health_interval = 60  # giây giữa 2 lần sessions.list
+        self._idle = []  # session rảnh: {"id", "created_at"}
+        self._total = 0  # tổng số session (rảnh + đang dùng)
+        self._last_health_check = 0
+        self._cond = threading.Condition()
+        self.stats = {"sessions_created": 0, "sessions_destroyed": 0, "requests": 0}
+    
     def check_connection(self):
         """Kiểm tra FlareSolverr có sẵn không"""
         try:
@@ -29,39 +47,155 @@ class FlareSolverrClient:
         print(f"⚠️ FlareSolverr not available at {self.base_url}")
         return False
     
+    def _command(self, payload, timeout=30):
+        """Gửi 1 command tới FlareSolverr API, trả về JSON nếu status ok"""
+        response = requests.post(f"{self.base_url}/v1", json=payload, timeout=timeout)
+        if response.status_code == 200:
+            data = response.json()
+            if data.get("status") == "ok":
+                return data
+            print(f"⚠️ FlareSolverr error: {data.get('message', 'Unknown error')}")
+        return None
+    
+    # ==================== SESSION POOL ====================
+    
+    def _create_session(self):
+        """Tạo session mới (1 browser tab giữ cookie riêng)"""
+        try:
+            data = self._command({"cmd": "sessions.create"})
+            if data and data.get("session"):
+                self.stats["sessions_created"] += 1
+                print(f"🆕 FlareSolverr session: {data['session']}")
+                return {"id": data["session"], "created_at": time.time()}
+        except Exception as e:
+            print(f"⚠️ Không tạo được FlareSolverr session: {e}")
+        return None
+    
+    def _destroy_session(self, session_id):
+        try:
+            self._command({"cmd": "sessions.destroy", "session": session_id})
+            self.stats["sessions_destroyed"] += 1
+        except Exception as e:
+            print(f"⚠️ Không hủy được FlareSolverr session {session_id}: {e}")
+    
+    def _health_check(self):
+        """Bỏ các session rảnh không còn tồn tại phía FlareSolverr (vd: server restart)"""
+        try:
+            data = self._command({"cmd": "sessions.list"}, timeout=10)
+        except Exception:
+            data = None
+        if data is None:
+            # Lỗi tạm thời → giữ nguyên pool, lần sau kiểm tra lại
+            with self._cond:
+                self._last_health_check = time.time()
+            return
+        alive = set(data.get("sessions", []))
+        with self._cond:
+            dead = [s for s in self._idle if s["id"] not in alive]
+            for session in dead:
+                self._idle.remove(session)
+                self._total -= 1
+            self._last_health_check = time.time()
+            self._cond.notify_all()
+        if dead:
+            print(f"🩺 Bỏ {len(dead)} FlareSolverr session không còn hoạt động")
+            # Vẫn gọi destroy phòng khi session còn sống nhưng không có trong list
+            for session in dead:
+                self._destroy_session(session["id"])
+    
+    def _acquire_session(self, wait=30):
+        """Lấy 1 session rảnh (tạo mới nếu pool chưa đầy). None nếu không lấy được"""
+        if time.time() - self._last_health_check > self.health_interval:
+            self._health_check()
+        
+        expired = []
+        deadline = time.time() + wait
+        try:
+            with self._cond:
+                while True:
+                    while self._idle:
+                        session = self._idle.pop()
+                        if time.time() - session["created_at"] < self.session_ttl:
+                            return session
+                        # Hết TTL → hủy, tạo session mới thay thế
+                        expired.append(session["id"])
+                        self._total -= 1
+                    if self._total < self.pool_size:
+                        self._total += 1
+                        break
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+        finally:
+            for session_id in expired:
+                self._destroy_session(session_id)
+        
+        session = self._create_session()
+        if session is None:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+        return session
+    
+    def _release_session(self, session, healthy=True):
+        """Trả session về pool, hủy nếu request vừa rồi lỗi"""
+        if not healthy:
+            self._destroy_session(session["id"])
+        with self._cond:
+            if healthy:
+                self._idle.append(session)
+            else:
+                self._total -= 1
+            self._cond.notify()
+    
+    def close(self):
+        """Hủy toàn bộ session rảnh"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+        for session in idle:
+            self._destroy_session(session["id"])
+    
+    # ==================== REQUESTS ====================
+    
     def get_page(self, url, max_timeout=60000):
-        """Lấy HTML của trang qua FlareSolverr"""
+        """Lấy HTML của trang qua FlareSolverr (tái sử dụng session trong pool)"""
         if not self.available:
             return None
-            
+        
+        session = self._acquire_session() if self.pool_size > 0 else None
+        healthy = False
         try:
             payload = {
                 "cmd": "request.get",
                 "url": url,
                 "maxTimeout": max_timeout
             }
+            if session:
+                payload["session"] = session["id"]
             
-            response = requests.post(
-                f"{self.base_url}/v1",
-                json=payload,
-                timeout=max_timeout/1000 + 10
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("status") == "ok":
-                    solution = data.get("solution", {})
-                    return {
-                        "html": solution.get("response", ""),
-                        "cookies": solution.get("cookies", []),
-                        "user_agent": solution.get("userAgent", ""),
-                        "status": solution.get("status", 0)
-                    }
-                else:
-                    print(f"⚠️ FlareSolverr error: {data.get('message', 'Unknown error')}")
-            
+            # FlareSolverr chạy local nhưng browser của nó request tới site nguồn → tính vào host đích
+            rate_limiter.acquire(url)
+            self.stats["requests"] += 1
+            data = self._command(payload, timeout=max_timeout/1000 + 10)
+            if data:
+                healthy = True
+                solution = data.get("solution", {})
+                rate_limiter.feedback(url, solution.get("status", 200), solution.get("headers", {}).get("retry-after"))
+                return {
+                    "html": solution.get("response", ""),
+                    "cookies": solution.get("cookies", []),
+                    "user_agent": solution.get("userAgent", ""),
+                    "status": solution.get("status", 0),
+                    "headers": solution.get("headers", {})
+                }
+        
         except Exception as e:
             print(f"❌ FlareSolverr request failed: {e}")
+        finally:
+            if session:
+                self._release_session(session, healthy)
         
         return None
     
@@ -75,3 +209,4 @@ class FlareSolverrClient:
 
 # Singleton instance
 flaresolverr = FlareSolverrClient()
+atexit.register(flaresolverr.close)
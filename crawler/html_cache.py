@@ -0,0 +1,128 @@
+"""
+HTML Cache - Lưu HTML trang (nén gzip) trên đĩa theo URL
+Kèm ETag / Last-Modified và thời điểm fetch để:
+- Trả về ngay khi còn trong TTL (không request)
+- Hết TTL thì fetch lại có điều kiện (If-None-Match / If-Modified-Since), 304 → dùng lại bản cũ
+
+TTL theo loại trang: trang chủ ngắn, trang truyện vừa, trang chapter dài
+(danh sách ảnh chapter hầu như không đổi).
+"""
+
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+from urllib.parse import urlparse
+
+CACHE_DIR = os.getenv("HTML_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "html_cache"))
+ENABLED = os.getenv("HTML_CACHE", "true").lower() != "false"
+
+TTL = {
+    "home": int(os.getenv("HTML_CACHE_TTL_HOME", "300")),
+    "story": int(os.getenv("HTML_CACHE_TTL_STORY", "1800")),
+    "chapter": int(os.getenv("HTML_CACHE_TTL_CHAPTER", "86400")),
+    "other": 0
+}
+
+
+def page_type(url):
+    """home / story / chapter theo đường dẫn NetTruyen (/truyen-tranh/<manga>/<chapter>)"""
+    parts = [p for p in urlparse(url).path.split("/") if p]
+    if not parts:
+        return "home"
+    if parts[0] == "truyen-tranh":
+        return "story" if len(parts) == 2 else "chapter"
+    return "other"
+
+
+class HtmlCache:
+    def __init__(self, cache_dir=None, ttl=None, enabled=None):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.ttl = ttl or TTL
+        self.enabled = ENABLED if enabled is None else enabled
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "stores": 0, "invalidated": 0}
+        self._lock = threading.Lock()
+
+    def _path(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json.gz")
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, url):
+        """Entry đã lưu (kể cả hết TTL) hoặc None"""
+        if not self.enabled:
+            return None
+        try:
+            with gzip.open(self._path(url), "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+            return entry if entry.get("url") == url else None
+        except (OSError, ValueError):
+            return None
+
+    def is_fresh(self, entry):
+        return bool(entry) and time.time() - entry["fetched_at"] < self.ttl.get(entry["page_type"], 0)
+
+    def get_fresh(self, url):
+        """Entry còn trong TTL (cache hit) hoặc None"""
+        entry = self.get(url)
+        if self.is_fresh(entry):
+            self._count("hits")
+            return entry
+        self._count("misses")
+        return None
+
+    def conditional_headers(self, entry):
+        """Headers cho conditional GET từ validators đã lưu"""
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, html, headers=None):
+        """Lưu HTML + ETag/Last-Modified (ghi file tạm rồi rename để không đọc phải file dở)"""
+        if not self.enabled or not html:
+            return
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        entry = {
+            "url": url,
+            "page_type": page_type(url),
+            "html": html,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "fetched_at": time.time()
+        }
+        path = self._path(url)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self._count("stores")
+        except OSError as e:
+            # Filesystem read-only (Vercel) → bỏ qua cache
+            print(f"⚠️ Không ghi được HTML cache: {e}")
+
+    def invalidate(self, url):
+        """Xóa entry (refresh thủ công: fetch lại đầy đủ, không dùng cache / 304)"""
+        try:
+            os.remove(self._path(url))
+            self._count("invalidated")
+        except OSError:
+            pass
+
+    def touch(self, url, entry):
+        """Server trả 304 → làm mới thời điểm fetch, giữ nguyên HTML"""
+        self._count("revalidated")
+        self.store(url, entry["html"], {"etag": entry.get("etag"), "last-modified": entry.get("last_modified")})
+
+
+# Singleton instance
+html_cache = HtmlCache()
@@ -0,0 +1,166 @@
+"""
+HTTP Pool - Session keep-alive dùng chung cho ImageKit và CDN ảnh
+requests.get/post cấp module mở TCP + TLS mới cho mỗi request; 8 thread mỗi
+chapter × nhiều chapter song song = hàng trăm handshake tới upload.imagekit.io.
+Module này giữ 1 requests.Session với HTTPAdapter có pool theo từng host
+(mặc định bằng số ảnh tải/upload đồng thời DOWNLOAD_IMAGE_CONCURRENCY),
+timeout connect/read mặc định và đếm số kết nối mới (handshake) / tái sử dụng.
+
+HTTP/2 (tùy chọn, cần httpx[http2]) cho các host trong HTTP_POOL_HTTP2:
+nhiều upload đi chung 1 kết nối thay vì mỗi thread 1 kết nối.
+Benchmark: python benchmarks/bench_http_pool.py
+"""
+
+import os
+import threading
+from collections.abc import Mapping
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from crawler.chapter_scheduler import IMAGE_CONCURRENCY
+from crawler.rate_limiter import rate_limiter
+
+# httpx là tùy chọn - chỉ cần khi bật HTTP/2
+try:
+    import httpx
+    import h2  # noqa: F401 - httpx cần h2 cho http2=True
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "0")) or IMAGE_CONCURRENCY
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP2_HOSTS = {h.strip() for h in os.getenv("HTTP_POOL_HTTP2", "").split(",") if h.strip()}
+
+
+def _parse_pool_sizes(value):
+    """HTTP_POOL_HOSTS="upload.imagekit.io=32,img.example.com=16" → {host: size}"""
+    sizes = {}
+    for part in value.split(","):
+        if "=" in part:
+            host, size = part.split("=", 1)
+            try:
+                sizes[host.strip()] = int(size)
+            except ValueError:
+                print(f"⚠️ HTTP_POOL_HOSTS không hợp lệ: {part}")
+    return sizes
+
+
+HOST_POOL_SIZES = _parse_pool_sizes(os.getenv("HTTP_POOL_HOSTS", ""))
+
+
+class _Http2Client:
+    """Bọc httpx.Client cho giống requests.Session.request (dùng được với rate_limiter.request)"""
+
+    def __init__(self, pool_size):
+        self.client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+        self.requests = 0
+
+    def request(self, method, url, data=None, timeout=None, allow_redirects=True, stream=False, **kwargs):
+        if data is not None and not isinstance(data, Mapping):
+            # Body nhị phân / MultipartBody: httpx nhận qua content= (các phần phải là bytes)
+            kwargs["content"] = (bytes(chunk) for chunk in data)
+        elif data is not None:
+            kwargs["data"] = data
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        self.requests += 1
+        return self.client.request(method, url, timeout=timeout, follow_redirects=allow_redirects, **kwargs)
+
+
+class HTTPPool:
+    def __init__(self, pool_size=None, host_pool_sizes=None, connect_timeout=None, read_timeout=None, http2_hosts=None):
+        """
+        Args:
+            pool_size: Số kết nối giữ lại mỗi host (mặc định = số ảnh tải đồng thời)
+            host_pool_sizes: {host: size} cho host cần pool khác mặc định
+            connect_timeout / read_timeout: Timeout mặc định khi caller không truyền timeout
+            http2_hosts: Các host gửi qua HTTP/2 (cần httpx[http2])
+        """
+        self.pool_size = pool_size or POOL_SIZE
+        self.host_pool_sizes = HOST_POOL_SIZES if host_pool_sizes is None else host_pool_sizes
+        self.timeout = (connect_timeout or CONNECT_TIMEOUT, read_timeout or READ_TIMEOUT)
+        self.http2_hosts = HTTP2_HOSTS if http2_hosts is None else set(http2_hosts)
+        if self.http2_hosts and not HAS_HTTP2:
+            print("⚠️ HTTP_POOL_HTTP2 cần httpx[http2], dùng HTTP/1.1 keep-alive")
+            self.http2_hosts = set()
+
+        self._adapters = []
+        self._http2 = None
+        self._lock = threading.Lock()
+        self.session = self.mount(requests.Session())
+
+    def _new_adapter(self, size):
+        # pool_block=False: vượt pool thì vẫn mở kết nối tạm (được đếm là handshake) thay vì chờ
+        adapter = HTTPAdapter(pool_connections=max(10, len(self.host_pool_sizes) + 4), pool_maxsize=size)
+        with self._lock:
+            self._adapters.append(adapter)
+        return adapter
+
+    def mount(self, session):
+        """Gắn adapter có pool của HTTPPool vào 1 session (vd. MangaCrawler.session giữ cookie Cloudflare)"""
+        adapter = self._new_adapter(self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        for host, size in self.host_pool_sizes.items():
+            host_adapter = self._new_adapter(size)
+            session.mount(f"https://{host}/", host_adapter)
+            session.mount(f"http://{host}/", host_adapter)
+        return session
+
+    def client_for(self, url):
+        """Client cho URL: httpx HTTP/2 nếu host được bật, không thì session keep-alive"""
+        if self.http2_hosts and urlparse(url).hostname in self.http2_hosts:
+            with self._lock:
+                if self._http2 is None:
+                    self._http2 = _Http2Client(self.pool_size)
+                return self._http2
+        return self.session
+
+    def request(self, method, url, session=None, **kwargs):
+        """
+        Gửi request qua rate limiter bằng kết nối trong pool (thay cho requests.get/post)
+
+        Args:
+            session: Session riêng (đã mount()) - mặc định dùng session chung / HTTP/2
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return rate_limiter.request(method, url, session=session or self.client_for(url), **kwargs)
+
+    def snapshot(self):
+        """Số request, kết nối mới (handshake) và tỉ lệ tái sử dụng theo host (cho admin)"""
+        hosts = {}
+        with self._lock:
+            adapters = list(self._adapters)
+        for adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                stats = hosts.setdefault(f"{pool.scheme}://{pool.host}:{pool.port}", {"requests": 0, "connections": 0})
+                stats["requests"] += pool.num_requests
+                stats["connections"] += pool.num_connections
+        for stats in hosts.values():
+            stats["reused"] = max(0, stats["requests"] - stats["connections"])
+            stats["reuse_rate"] = round(stats["reused"] / stats["requests"] * 100, 1) if stats["requests"] else 0.0
+        totals = {key: sum(s[key] for s in hosts.values()) for key in ("requests", "connections", "reused")}
+        return {
+            "pool_size": self.pool_size,
+            "host_pool_sizes": self.host_pool_sizes,
+            "timeout": {"connect": self.timeout[0], "read": self.timeout[1]},
+            "http2_hosts": sorted(self.http2_hosts),
+            "http2_requests": self._http2.requests if self._http2 else 0,
+            "totals": totals,
+            "hosts": hosts
+        }
+
+
+# Singleton instance
+http_pool = HTTPPool()
@@ -0,0 +1,184 @@
+"""
+Image Dedup - Bỏ qua upload ảnh trùng nội dung (content-addressed)
+Trang credit nhóm dịch, banner quảng cáo, recap lặp lại ở hàng trăm chapter và
+crawl lại cũng upload đúng những bytes cũ. Mỗi ảnh được hash (xxh3-128 nếu có
+xxhash, không thì BLAKE2b-128), tra index hash → URL trong MongoDB
+(collection image_hashes); trùng thì dùng lại URL cũ thay vì upload.
+
+Ảnh qua dedup được ghi theo nội dung (HASH_FOLDER/<2 ký tự>/<hash>.<đuôi>), không
+nằm trong folder chapter: tải lại / repair chapter ghi đè manga/<id>/<chapter>/NNN
+nhưng không bao giờ đổi bytes sau 1 URL đã chia sẻ cho chapter khác. Hash cũ trỏ
+vào folder chapter (trước khi có HASH_FOLDER) không được dùng lại.
+
+Thống kê hit rate / bytes tiết kiệm theo chapter (in ra sau mỗi chapter)
+và cộng dồn theo manga + toàn process (cho admin).
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict, deque
+
+from database import db
+
+try:
+    import xxhash
+    HAS_XXHASH = True
+except ImportError:
+    HAS_XXHASH = False
+
+ENABLED = os.getenv("IMAGE_DEDUP", "true").lower() == "true"
+MEMORY_ENTRIES = int(os.getenv("IMAGE_DEDUP_MEMORY", "4096"))   # hash gần đây giữ trong RAM
+HASH_FOLDER = os.getenv("IMAGE_DEDUP_FOLDER", "manga/_by_hash").strip("/")
+
+
+def content_hash(data):
+    """Hash nội dung ảnh (có tiền tố thuật toán để không lẫn khi đổi backend)"""
+    if HAS_XXHASH:
+        return "xxh3:" + xxhash.xxh3_128_hexdigest(data)
+    return "b2b:" + hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _new_counters():
+    return {"images": 0, "hits": 0, "bytes_total": 0, "bytes_saved": 0}
+
+
+def _with_rate(counters):
+    images = counters["images"]
+    return {
+        **counters,
+        "hit_rate": round(counters["hits"] / images * 100, 1) if images else 0.0,
+        "mb_saved": round(counters["bytes_saved"] / 1048576, 2)
+    }
+
+
+class ImageDedup:
+    def __init__(self, enabled=None, memory_entries=None):
+        self.enabled = ENABLED if enabled is None else enabled
+        self.memory_entries = memory_entries or MEMORY_ENTRIES
+        self.algorithm = "xxh3-128" if HAS_XXHASH else "blake2b-128"
+        self.totals = _new_counters()
+        self._recent = OrderedDict()      # hash → URL (LRU, tránh query MongoDB cho ảnh lặp liên tục)
+        self._folders = {}                # folder → counters của chapter đang tải
+        self._mangas = {}                 # manga_id → counters cộng dồn
+        self.recent_reports = deque(maxlen=20)
+        self._lock = threading.Lock()
+
+    def _count(self, folder, size, hit):
+        with self._lock:
+            parts = folder.split("/")
+            manga_id = parts[1] if len(parts) > 1 else folder
+            for counters in (self.totals,
+                             self._folders.setdefault(folder, _new_counters()),
+                             self._mangas.setdefault(manga_id, _new_counters())):
+                counters["images"] += 1
+                counters["bytes_total"] += size
+                if hit:
+                    counters["hits"] += 1
+                    counters["bytes_saved"] += size
+
+    def _remember(self, digest, url):
+        with self._lock:
+            self._recent[digest] = url
+            self._recent.move_to_end(digest)
+            while len(self._recent) > self.memory_entries:
+                self._recent.popitem(last=False)
+
+    @staticmethod
+    def target(digest, folder, file_name):
+        """
+        Folder + tên file để upload ảnh: theo nội dung nếu có hash (URL không bao giờ bị ghi đè
+        bằng bytes khác), giữ nguyên folder chapter khi dedup tắt
+        """
+        if not digest:
+            return folder, file_name
+        name = digest.split(":", 1)[-1]
+        ext = os.path.splitext(file_name)[1] or ".jpg"
+        return f"{HASH_FOLDER}/{name[:2]}", f"{name}{ext}"
+
+    def lookup(self, data, folder):
+        """
+        Tìm ảnh cùng nội dung đã upload
+
+        Returns:
+            (hash, URL đã có hoặc None) - hash dùng cho remember() sau khi upload
+        """
+        if not self.enabled:
+            return None, None
+        digest = content_hash(data)
+        with self._lock:
+            url = self._recent.get(digest)
+        if url is None:
+            try:
+                url = db.get_image_by_hash(digest)
+            except Exception as e:
+                print(f"⚠️ Không tra được image_hashes: {e}")
+                url = None
+            if url:
+                self._remember(digest, url)
+        if url:
+            self._count(folder, len(data), hit=True)
+        return digest, url
+
+    def remember(self, digest, url, data, folder):
+        """Ghi hash → URL sau khi upload thành công"""
+        if not digest or not url:
+            return
+        self._count(folder, len(data), hit=False)
+        self._remember(digest, url)
+        try:
+            db.save_image_hash(digest, url, len(data))
+        except Exception as e:
+            print(f"⚠️ Không ghi được image_hashes: {e}")
+
+    def upload(self, data, folder, file_name, uploader):
+        """
+        Upload qua dedup: trùng nội dung thì trả URL cũ, không thì gọi uploader
+
+        Args:
+            uploader: Hàm (data, folder, file_name) → URL hoặc None
+        """
+        digest, url = self.lookup(data, folder)
+        if url:
+            return url
+        url = uploader(data, *self.target(digest, folder, file_name))
+        self.remember(digest, url, data, folder)
+        return url
+
+    def report(self, folder):
+        """In + trả thống kê dedup của 1 chapter (folder manga/<manga_id>/<chapter_id>) rồi xóa khỏi bộ đếm"""
+        with self._lock:
+            counters = self._folders.pop(folder, None)
+        if not counters or not counters["images"]:
+            return None
+        stats = {"folder": folder, **_with_rate(counters)}
+        self.recent_reports.append(stats)
+        if counters["hits"]:
+            print(f"  ♻️ Dedup {folder}: {counters['hits']}/{counters['images']} ảnh trùng "
+                  f"({stats['hit_rate']}%), tiết kiệm {stats['mb_saved']} MB upload")
+        return stats
+
+    def manga_stats(self, manga_id, since=None):
+        """Thống kê cộng dồn của 1 manga (since: kết quả manga_stats lúc bắt đầu crawl → chỉ tính phần chênh)"""
+        with self._lock:
+            counters = dict(self._mangas.get(manga_id) or _new_counters())
+        if since:
+            counters = {key: counters[key] - since.get(key, 0) for key in counters}
+        return _with_rate(counters)
+
+    def snapshot(self):
+        """Thống kê toàn process + theo manga + các chapter gần nhất (cho admin)"""
+        with self._lock:
+            mangas = {manga_id: _with_rate(dict(c)) for manga_id, c in self._mangas.items()}
+            totals = _with_rate(dict(self.totals))
+        return {
+            "enabled": self.enabled,
+            "algorithm": self.algorithm,
+            "totals": totals,
+            "mangas": mangas,
+            "recent_chapters": list(self.recent_reports)
+        }
+
+
+# Singleton instance
+image_dedup = ImageDedup()
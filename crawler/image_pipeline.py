@@ -0,0 +1,315 @@
+"""
+Image Pipeline - Producer/consumer cho ảnh chapter với bộ nhớ giới hạn
+Producer (thread Playwright) đẩy bytes ảnh vào queue có giới hạn, các thread
+upload lấy ra và upload ngay trong lúc browser vẫn đang tải các ảnh sau.
+
+Tổng số bytes ảnh đang giữ trong RAM (chờ upload + đang upload) bị chặn bởi
+1 budget dùng chung cho mọi chapter đang chạy song song: producer phải chờ
+khi budget đầy thay vì gom cả chapter vào dict.
+
+FlareSolverr / CloudScraper dùng thêm stage download (feed): pool thread tải
+ảnh riêng đẩy vào cùng queue, nên upload ImageKit chậm không giữ chỗ của
+download và ngược lại. Mỗi stage có số thread, retry và thống kê riêng
+(mức sử dụng, thời gian chờ stage kia) để biết nên tăng bên nào.
+"""
+
+import os
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from imagekit_storage import image_storage
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+INFLIGHT_BYTES = int(float(os.getenv("IMAGE_INFLIGHT_MB", "96")) * 1024 * 1024)
+QUEUE_SIZE = int(os.getenv("IMAGE_PIPELINE_QUEUE", "16"))
+UPLOAD_WORKERS = int(os.getenv("IMAGE_PIPELINE_WORKERS", "8"))
+DOWNLOAD_WORKERS = int(os.getenv("IMAGE_DOWNLOAD_WORKERS", "8"))
+UPLOAD_RETRIES = int(os.getenv("IMAGE_UPLOAD_RETRIES", "1"))
+DOWNLOAD_RETRIES = int(os.getenv("IMAGE_DOWNLOAD_RETRIES", "1"))
+RETRY_BACKOFF = 1.0   # giây, nhân đôi sau mỗi lần thử lại
+
+
+def current_rss():
+    """RSS hiện tại của process (bytes), None nếu không đọc được"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if HAS_RESOURCE:
+        # Không có /proc (macOS): chỉ có đỉnh từ lúc process chạy (ru_maxrss tính bằng bytes trên macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+
+class ByteBudget:
+    """Giới hạn tổng số bytes ảnh đang nằm trong RAM trên toàn process"""
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity or INFLIGHT_BYTES
+        self.in_flight = 0
+        self.peak = 0
+        self.waits = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size):
+        """Chờ tới khi còn chỗ cho size bytes (ảnh lớn hơn cả budget vẫn được qua khi budget trống)"""
+        with self._cond:
+            if self.in_flight and self.in_flight + size > self.capacity:
+                self.waits += 1
+                self._cond.wait_for(lambda: not self.in_flight or self.in_flight + size <= self.capacity)
+            self.in_flight += size
+            self.peak = max(self.peak, self.in_flight)
+
+    def release(self, size):
+        with self._cond:
+            self.in_flight -= size
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "capacity_mb": round(self.capacity / 1048576, 1),
+                "in_flight_mb": round(self.in_flight / 1048576, 1),
+                "peak_mb": round(self.peak / 1048576, 1),
+                "waits": self.waits
+            }
+
+
+class RssSampler(threading.Thread):
+    """Đo RSS định kỳ trong lúc tải 1 chapter để lấy đỉnh RSS của chapter đó"""
+
+    def __init__(self, interval=0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.start_rss = current_rss()
+        self.peak_rss = self.start_rss or 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, current_rss() or 0)
+
+    def stop(self):
+        self._stopped.set()
+        self.peak_rss = max(self.peak_rss, current_rss() or 0)
+
+
+class StageStats:
+    """Thống kê 1 stage (download / upload) của 1 chapter"""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.failed = 0
+        self.retries = 0
+        self.busy = 0.0       # giây thread đang tải / upload
+        self.waiting = 0.0    # giây thread chờ stage kia (download: queue/budget đầy, upload: queue rỗng)
+        self._lock = threading.Lock()
+
+    def add(self, busy=0.0, waiting=0.0, ok=None, retries=0):
+        with self._lock:
+            self.busy += busy
+            self.waiting += waiting
+            self.retries += retries
+            if ok is True:
+                self.items += 1
+            elif ok is False:
+                self.failed += 1
+
+    def snapshot(self, wall):
+        """Mức sử dụng = thời gian bận / (số thread × thời gian chạy chapter)"""
+        capacity = self.workers * wall
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "items": self.items,
+                "failed": self.failed,
+                "retries": self.retries,
+                "busy_seconds": round(self.busy, 1),
+                "utilization": round(self.busy / capacity * 100, 1) if capacity else 0.0,
+                "waiting_percent": round(self.waiting / capacity * 100, 1) if capacity else 0.0
+            }
+
+
+def _bottleneck(stages):
+    """Stage nên tăng số thread: stage bận hơn khi stage kia phải chờ nó"""
+    download, upload = stages.get("download"), stages.get("upload")
+    if not download or not upload:
+        return None
+    if download["waiting_percent"] > 20 and upload["utilization"] > download["utilization"]:
+        return "upload"
+    if upload["waiting_percent"] > 20 and download["utilization"] > upload["utilization"]:
+        return "download"
+    return None
+
+
+class UploadPipeline:
+    def __init__(self, folder_path, budget=None, workers=None, queue_size=None, label=None):
+        """
+        Args:
+            folder_path: Folder trên ImageKit (manga/<manga_id>/<chapter_id>)
+            budget: ByteBudget dùng chung (mặc định: image_byte_budget)
+            workers: Số thread upload
+            queue_size: Số ảnh tối đa chờ upload trong queue
+            label: Tên hiển thị khi báo cáo (chapter_id)
+        """
+        self.folder_path = folder_path
+        self.budget = budget or image_byte_budget
+        self.label = label or folder_path
+        self.results = {}
+        self.uploaded = 0
+        self.bytes_total = 0
+        self.upload_stats = StageStats("upload", workers or UPLOAD_WORKERS)
+        self.download_stats = None
+        self._queue = queue.Queue(maxsize=queue_size or QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self._rss = RssSampler()
+        self._rss.start()
+        self._workers = [
+            threading.Thread(target=self._consume, daemon=True, name=f"upload-{i}")
+            for i in range(self.upload_stats.workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _upload(self, idx, data):
+        """Upload 1 ảnh, thử lại IMAGE_UPLOAD_RETRIES lần (backoff) khi lỗi"""
+        for attempt in range(UPLOAD_RETRIES + 1):
+            if attempt:
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            try:
+                uploaded = image_storage.upload_page(data, self.folder_path, idx)
+                if uploaded:
+                    return uploaded, attempt
+            except Exception as e:
+                print(f"  ❌ Upload error {idx}: {e}")
+        return None, UPLOAD_RETRIES
+
+    def _consume(self):
+        while True:
+            waited_at = time.monotonic()
+            item = self._queue.get()
+            if item is None:
+                return
+            started_at = time.monotonic()
+            idx, data = item
+            size = len(data)
+            try:
+                uploaded, retries = self._upload(idx, data)
+                if uploaded:
+                    with self._lock:
+                        self.results[idx] = uploaded
+                        self.uploaded += 1
+                        print(f"  ☁️ Uploaded {self.uploaded} ảnh (đang tải tiếp)")
+                self.upload_stats.add(time.monotonic() - started_at, started_at - waited_at, bool(uploaded), retries)
+            finally:
+                del data, item
+                self.budget.release(size)
+
+    def put(self, idx, data):
+        """
+        Producer: đưa bytes ảnh vào queue (chờ nếu budget hoặc queue đầy)
+
+        Returns:
+            Số giây đã phải chờ stage upload
+        """
+        waited_at = time.monotonic()
+        size = len(data)
+        self.budget.acquire(size)
+        with self._lock:
+            self.bytes_total += size
+        self._queue.put((idx, data))
+        return time.monotonic() - waited_at
+
+    def _download(self, idx, src, fetch, retries):
+        """Tải 1 ảnh (thử lại khi lỗi) rồi đưa vào queue upload"""
+        started_at = time.monotonic()
+        data = None
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            try:
+                data = fetch(src)
+            except Exception as e:
+                print(f"  ❌ Ảnh {idx} lỗi: {e}")
+            if data:
+                break
+        busy = time.monotonic() - started_at
+        waited = self.put(idx, data) if data else 0.0
+        self.download_stats.add(busy, waited, bool(data), attempt)
+
+    def feed(self, sources, fetch, workers=None, retries=None):
+        """
+        Stage download: pool thread riêng tải ảnh rồi đẩy vào queue upload
+        (chờ khi queue/budget đầy). Gọi close() sau đó để lấy kết quả upload.
+
+        Args:
+            sources: List (idx, src)
+            fetch: Hàm src → bytes ảnh hoặc None
+            workers: Số thread download (mặc định IMAGE_DOWNLOAD_WORKERS)
+            retries: Số lần thử lại mỗi ảnh (mặc định IMAGE_DOWNLOAD_RETRIES)
+        """
+        self.download_stats = StageStats("download", workers or DOWNLOAD_WORKERS)
+        retries = DOWNLOAD_RETRIES if retries is None else retries
+        with ThreadPoolExecutor(max_workers=self.download_stats.workers) as executor:
+            for idx, src in sources:
+                executor.submit(self._download, idx, src, fetch, retries)
+
+    def close(self):
+        """
+        Chờ upload xong các ảnh còn trong queue
+
+        Returns:
+            Dict idx → kết quả upload_page ({url, width, height, tiles?})
+        """
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._rss.stop()
+        self.report()
+        return self.results
+
+    def report(self):
+        """In và lưu thống kê chapter (đỉnh RSS, tổng bytes, thời gian, mức sử dụng từng stage)"""
+        wall = time.time() - self._started_at
+        stages = {"upload": self.upload_stats.snapshot(wall)}
+        if self.download_stats:
+            stages["download"] = self.download_stats.snapshot(wall)
+        stats = {
+            "chapter": self.label,
+            "images": self.uploaded,
+            "bytes_mb": round(self.bytes_total / 1048576, 1),
+            "seconds": round(wall, 1),
+            "peak_rss_mb": round(self._rss.peak_rss / 1048576, 1) if self._rss.peak_rss else None,
+            "rss_delta_mb": round((self._rss.peak_rss - self._rss.start_rss) / 1048576, 1) if self._rss.start_rss else None,
+            "stages": stages,
+            "bottleneck": _bottleneck(stages)
+        }
+        recent_chapters.append(stats)
+        print(f"  📊 {self.label}: {stats['images']} ảnh, {stats['bytes_mb']} MB, "
+              f"peak RSS {stats['peak_rss_mb']} MB (+{stats['rss_delta_mb']} MB), {stats['seconds']}s")
+        for name, stage in stages.items():
+            print(f"     {name}: {stage['workers']} thread, bận {stage['utilization']}%, "
+                  f"chờ {stage['waiting_percent']}%, retry {stage['retries']}, lỗi {stage['failed']}")
+        if stats["bottleneck"]:
+            print(f"     ⚠️ Stage {stats['bottleneck']} là nút thắt, nên tăng số thread của stage này")
+        return stats
+
+
+# Thống kê các chapter gần nhất (cho admin)
+recent_chapters = deque(maxlen=20)
+
+# Singleton instance - budget dùng chung cho mọi chapter
+image_byte_budget = ByteBudget()
@@ -0,0 +1,125 @@
+"""
+Image Tiles - Cắt strip webtoon quá cao thành các tile cao cố định
+Một số chapter có ảnh đơn 700×15000+ px: reader phải tải cả strip mới vẽ được.
+Khi bật IMAGE_TILE_HEIGHT, ảnh cao hơn 1.5 lần chiều cao tile được cắt (trong
+process pool của transcoder), các tile upload theo thứ tự và lưu kèm kích thước
+trong chapter_images để reader vẽ dần từ tile đầu tiên.
+"""
+
+import io
+import os
+
+from crawler.transcoder import transcoder, sniff_format, HAS_PIL
+
+if HAS_PIL:
+    from PIL import Image
+
+TILE_HEIGHT = int(os.getenv("IMAGE_TILE_HEIGHT", "0"))      # 0 = tắt
+SPLIT_RATIO = 1.5                                            # chỉ cắt ảnh cao hơn 1.5 tile
+MIN_LAST_TILE = 0.25                                         # phần dư nhỏ hơn 1/4 tile gộp vào tile trước
+
+# Định dạng tile khi không bật transcode: giữ định dạng gốc (ảnh lạ → PNG)
+_SOURCE_FORMATS = {"jpeg": ("JPEG", "jpg"), "png": ("PNG", "png"), "webp": ("WEBP", "webp")}
+_TARGET_FORMATS = {"webp": ("WEBP", "webp"), "avif": ("AVIF", "avif")}
+
+
+def tile_boundaries(height, tile_height):
+    """[(top, bottom)] các tile cao tile_height, phần dư quá ngắn gộp vào tile cuối"""
+    bounds = []
+    top = 0
+    while top < height:
+        bottom = min(height, top + tile_height)
+        if height - bottom < tile_height * MIN_LAST_TILE:
+            bottom = height
+        bounds.append((top, bottom))
+        top = bottom
+    return bounds
+
+
+def split_image(data, tile_height, target, quality):
+    """
+    Cắt 1 ảnh thành tile (chạy trong process con)
+
+    Args:
+        target: Định dạng encode tile ("webp" / "avif"), None = giữ định dạng gốc
+
+    Returns:
+        (width, height, [(bytes, đuôi file, width, height)]) - list rỗng nếu không cần cắt
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        width, height = img.size
+        if height <= tile_height * SPLIT_RATIO or getattr(img, "is_animated", False):
+            return width, height, []
+        pil_format, ext = _TARGET_FORMATS.get(target) or _SOURCE_FORMATS.get(sniff_format(data), ("PNG", "png"))
+        if img.mode not in ("RGB", "RGBA", "L"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        if pil_format == "JPEG" and img.mode == "RGBA":
+            img = img.convert("RGB")
+
+        tiles = []
+        for top, bottom in tile_boundaries(height, tile_height):
+            out = io.BytesIO()
+            params = {} if pil_format == "PNG" else {"quality": quality}
+            img.crop((0, top, width, bottom)).save(out, pil_format, **params)
+            tiles.append((out.getvalue(), ext, width, bottom - top))
+        return width, height, tiles
+
+
+def image_size(data):
+    """(width, height) chỉ đọc header ảnh, (None, None) nếu không đọc được"""
+    if not HAS_PIL:
+        return None, None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return img.size
+    except Exception:
+        return None, None
+
+
+class ImageTiler:
+    def __init__(self, tile_height=None, quality=None):
+        self.tile_height = TILE_HEIGHT if tile_height is None else tile_height
+        self.quality = quality or transcoder.quality
+        if self.tile_height and not HAS_PIL:
+            print("⚠️ IMAGE_TILE_HEIGHT cần Pillow, không cắt tile")
+            self.tile_height = 0
+
+    @property
+    def enabled(self):
+        return self.tile_height > 0
+
+    def _needs_split(self, height):
+        return self.enabled and height and height > self.tile_height * SPLIT_RATIO
+
+    def split(self, data):
+        """
+        Cắt ảnh nếu quá cao (process pool)
+
+        Returns:
+            (width, height, tiles) - tiles rỗng khi ảnh không cần cắt
+        """
+        width, height = image_size(data)
+        if not self._needs_split(height):
+            return width, height, []
+        target = transcoder.mode if transcoder.enabled else None
+        try:
+            return transcoder.call(split_image, data, self.tile_height, target, self.quality)
+        except Exception as e:
+            print(f"  ⚠️ Không cắt được tile ({e}), upload nguyên ảnh")
+            return width, height, []
+
+    async def split_async(self, data):
+        """Như split() nhưng không chặn event loop"""
+        width, height = image_size(data)
+        if not self._needs_split(height):
+            return width, height, []
+        target = transcoder.mode if transcoder.enabled else None
+        try:
+            return await transcoder.call_async(split_image, data, self.tile_height, target, self.quality)
+        except Exception as e:
+            print(f"  ⚠️ Không cắt được tile ({e}), upload nguyên ảnh")
+            return width, height, []
+
+
+# Singleton instance
+image_tiler = ImageTiler()
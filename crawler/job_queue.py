@@ -0,0 +1,349 @@
+"""
+Crawl Job Queue - Hàng đợi crawl bền vững (MongoDB hoặc SQLite)
+Web chỉ enqueue job, worker process riêng (crawler/worker.py) lấy job ra chạy.
+
+Trạng thái job: queued → running → done / failed
+- Lease: worker giữ job trong LEASE_SECONDS, phải heartbeat để gia hạn.
+  Worker chết → lease hết hạn → worker khác lấy lại job.
+- Retry: lỗi thì quay lại queued với backoff, quá max_attempts thì failed.
+  Job làm chết worker (OOM, browser treo) cũng tính lượt thử: lease hết hạn mà
+  đã hết lượt thì chuyển failed thay vì chạy lại mãi.
+- Progress: lưu tiến độ (chapter đã xong) để job chạy lại tiếp từ chỗ dừng.
+- Mọi cập nhật job (progress / complete / fail) chỉ áp dụng khi worker còn giữ
+  lease: worker mất lease không ghi đè kết quả của worker đã lấy lại job.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+LEASE_SECONDS = int(os.getenv("CRAWL_JOB_LEASE", "120"))
+MAX_ATTEMPTS = int(os.getenv("CRAWL_JOB_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF = 30  # giây, nhân đôi sau mỗi lần thử
+LEASE_EXPIRED_ERROR = "Lease hết hạn (worker chết hoặc treo) và đã hết lượt thử"
+
+ACTIVE_STATES = ("queued", "running")
+
+
+class LeaseLost(Exception):
+    """Worker không còn giữ lease của job (đã hết hạn và worker khác lấy lại)"""
+
+
+def _retry_delay(attempts):
+    return RETRY_BACKOFF * (2 ** max(attempts - 1, 0))
+
+
+class SQLiteJobQueue:
+    """Queue lưu trong file SQLite local (dùng chung cho các worker trên cùng máy)"""
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv(
+            "CRAWL_JOB_DB",
+            os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "crawl_jobs.sqlite3")
+        )
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS crawl_jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    dedupe_key TEXT,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    run_after REAL NOT NULL,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON crawl_jobs (state, run_after)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON crawl_jobs (dedupe_key, state)")
+
+    def _conn(self):
+        """Mỗi thread 1 connection (sqlite3 không chia sẻ connection giữa thread)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return _Transaction(conn)
+
+    @staticmethod
+    def _to_job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        for key in ("payload", "progress", "result"):
+            job[key] = json.loads(job[key]) if job[key] else ({} if key != "result" else None)
+        return job
+
+    def enqueue(self, kind, payload, dedupe_key=None, max_attempts=MAX_ATTEMPTS):
+        """Thêm job mới. Nếu đã có job cùng dedupe_key đang chờ/chạy thì trả về job đó"""
+        now = time.time()
+        with self._conn() as conn:
+            if dedupe_key:
+                row = conn.execute(
+                    "SELECT id FROM crawl_jobs WHERE dedupe_key = ? AND state IN (?, ?) LIMIT 1",
+                    (dedupe_key, *ACTIVE_STATES)
+                ).fetchone()
+                if row:
+                    return row["id"]
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO crawl_jobs (id, kind, payload, dedupe_key, state, attempts, max_attempts, run_after, progress, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', 0, ?, ?, '{}', ?, ?)",
+                (job_id, kind, json.dumps(payload), dedupe_key, max_attempts, now, now, now)
+            )
+        return job_id
+
+    def claim(self, worker_id, lease_seconds=LEASE_SECONDS):
+        """Lấy 1 job sẵn sàng (hoặc job có lease đã hết hạn) và giữ lease"""
+        now = time.time()
+        with self._conn() as conn:
+            # Lease hết hạn mà đã hết lượt thử → failed, không lấy lại
+            conn.execute(
+                "UPDATE crawl_jobs SET state = 'failed', error = ?, lease_owner = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE state = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+                (LEASE_EXPIRED_ERROR, now, now)
+            )
+            row = conn.execute(
+                "SELECT id FROM crawl_jobs "
+                "WHERE (state = 'queued' AND run_after <= ?) OR (state = 'running' AND lease_expires < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if not row:
+                return None
+            conn.execute(
+                "UPDATE crawl_jobs SET state = 'running', attempts = attempts + 1, lease_owner = ?, "
+                "lease_expires = ?, updated_at = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, now, row["id"])
+            )
+            return self._to_job(conn.execute("SELECT * FROM crawl_jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=LEASE_SECONDS):
+        """Gia hạn lease. Trả về False nếu job đã bị worker khác lấy"""
+        now = time.time()
+        with self._conn() as conn:
+            cursor = conn.execute(
+                "UPDATE crawl_jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND state = 'running'",
+                (now + lease_seconds, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def update_progress(self, job_id, worker_id, progress):
+        """Lưu tiến độ. Trả về False nếu worker đã mất lease"""
+        with self._conn() as conn:
+            cursor = conn.execute(
+                "UPDATE crawl_jobs SET progress = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND state = 'running'",
+                (json.dumps(progress), time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result=None):
+        """Đánh dấu xong. Trả về False nếu worker đã mất lease (kết quả bị bỏ)"""
+        with self._conn() as conn:
+            cursor = conn.execute(
+                "UPDATE crawl_jobs SET state = 'done', result = ?, lease_owner = NULL, lease_expires = NULL, "
+                "error = NULL, updated_at = ? WHERE id = ? AND lease_owner = ? AND state = 'running'",
+                (json.dumps(result), time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Ghi lỗi, đưa job về queued (có backoff) hoặc failed nếu hết lượt thử. False nếu đã mất lease"""
+        now = time.time()
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM crawl_jobs WHERE id = ? AND lease_owner = ? AND state = 'running'",
+                (job_id, worker_id)
+            ).fetchone()
+            if not row:
+                return False
+            if row["attempts"] >= row["max_attempts"]:
+                conn.execute(
+                    "UPDATE crawl_jobs SET state = 'failed', error = ?, lease_owner = NULL, lease_expires = NULL, "
+                    "updated_at = ? WHERE id = ?",
+                    (str(error), now, job_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE crawl_jobs SET state = 'queued', error = ?, run_after = ?, lease_owner = NULL, "
+                    "lease_expires = NULL, updated_at = ? WHERE id = ?",
+                    (str(error), now + _retry_delay(row["attempts"]), now, job_id)
+                )
+            return True
+
+    def get(self, job_id):
+        with self._conn() as conn:
+            return self._to_job(conn.execute("SELECT * FROM crawl_jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list_jobs(self, state=None, limit=50):
+        with self._conn() as conn:
+            if state:
+                rows = conn.execute(
+                    "SELECT * FROM crawl_jobs WHERE state = ? ORDER BY created_at DESC LIMIT ?", (state, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM crawl_jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+            return [self._to_job(row) for row in rows]
+
+
+class _Transaction:
+    """Context manager BEGIN IMMEDIATE / COMMIT cho sqlite3 ở chế độ autocommit"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class MongoJobQueue:
+    """Queue lưu trong collection MongoDB crawl_jobs (dùng chung cho nhiều máy)"""
+
+    def __init__(self):
+        from database import db
+        from pymongo import ReturnDocument, ASCENDING
+        self._return_after = ReturnDocument.AFTER
+        self.collection = db.db.crawl_jobs
+        self.collection.create_index([("state", ASCENDING), ("run_after", ASCENDING)])
+        self.collection.create_index([("dedupe_key", ASCENDING), ("state", ASCENDING)])
+
+    @staticmethod
+    def _to_job(doc):
+        if doc is None:
+            return None
+        doc["id"] = doc.pop("_id")
+        return doc
+
+    def enqueue(self, kind, payload, dedupe_key=None, max_attempts=MAX_ATTEMPTS):
+        if dedupe_key:
+            existing = self.collection.find_one(
+                {"dedupe_key": dedupe_key, "state": {"$in": list(ACTIVE_STATES)}}, {"_id": 1}
+            )
+            if existing:
+                return existing["_id"]
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        self.collection.insert_one({
+            "_id": job_id,
+            "kind": kind,
+            "payload": payload,
+            "dedupe_key": dedupe_key,
+            "state": "queued",
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "lease_owner": None,
+            "lease_expires": None,
+            "run_after": now,
+            "progress": {},
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now
+        })
+        return job_id
+
+    def claim(self, worker_id, lease_seconds=LEASE_SECONDS):
+        now = time.time()
+        # Lease hết hạn mà đã hết lượt thử → failed, không lấy lại
+        self.collection.update_many(
+            {"state": "running", "lease_expires": {"$lt": now}, "$expr": {"$gte": ["$attempts", "$max_attempts"]}},
+            {"$set": {"state": "failed", "error": LEASE_EXPIRED_ERROR, "lease_owner": None,
+                      "lease_expires": None, "updated_at": now}}
+        )
+        doc = self.collection.find_one_and_update(
+            {"$or": [
+                {"state": "queued", "run_after": {"$lte": now}},
+                {"state": "running", "lease_expires": {"$lt": now}, "$expr": {"$lt": ["$attempts", "$max_attempts"]}}
+            ]},
+            {
+                "$set": {"state": "running", "lease_owner": worker_id, "lease_expires": now + lease_seconds, "updated_at": now},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=self._return_after
+        )
+        return self._to_job(doc)
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=LEASE_SECONDS):
+        now = time.time()
+        result = self.collection.update_one(
+            {"_id": job_id, "lease_owner": worker_id, "state": "running"},
+            {"$set": {"lease_expires": now + lease_seconds, "updated_at": now}}
+        )
+        return result.modified_count == 1
+
+    def update_progress(self, job_id, worker_id, progress):
+        result = self.collection.update_one(
+            {"_id": job_id, "lease_owner": worker_id, "state": "running"},
+            {"$set": {"progress": progress, "updated_at": time.time()}}
+        )
+        return result.matched_count == 1
+
+    def complete(self, job_id, worker_id, result=None):
+        update = self.collection.update_one(
+            {"_id": job_id, "lease_owner": worker_id, "state": "running"},
+            {"$set": {"state": "done", "result": result, "error": None, "lease_owner": None,
+                      "lease_expires": None, "updated_at": time.time()}}
+        )
+        return update.matched_count == 1
+
+    def fail(self, job_id, worker_id, error):
+        now = time.time()
+        owned = {"_id": job_id, "lease_owner": worker_id, "state": "running"}
+        doc = self.collection.find_one(owned, {"attempts": 1, "max_attempts": 1})
+        if not doc:
+            return False
+        update = {"error": str(error), "lease_owner": None, "lease_expires": None, "updated_at": now}
+        if doc["attempts"] >= doc["max_attempts"]:
+            update["state"] = "failed"
+        else:
+            update.update({"state": "queued", "run_after": now + _retry_delay(doc["attempts"])})
+        return self.collection.update_one(owned, {"$set": update}).matched_count == 1
+
+    def get(self, job_id):
+        return self._to_job(self.collection.find_one({"_id": job_id}))
+
+    def list_jobs(self, state=None, limit=50):
+        query = {"state": state} if state else {}
+        return [self._to_job(doc) for doc in self.collection.find(query).sort("created_at", -1).limit(limit)]
+
+
+_queue = None
+
+
+def get_job_queue():
+    """
+    Lấy job queue theo biến môi trường CRAWL_JOB_QUEUE
+    ("sqlite" hoặc "mongo"; để trống = tắt, crawl chạy trực tiếp trong request)
+    """
+    global _queue
+    backend = os.getenv("CRAWL_JOB_QUEUE", "").lower()
+    if not backend:
+        return None
+    if _queue is None:
+        _queue = MongoJobQueue() if backend == "mongo" else SQLiteJobQueue()
+    return _queue
@@ -0,0 +1,83 @@
+"""
+Lazy Loader - Chờ ảnh lazy-load của trang chapter tải xong (Playwright)
+Thay cho cuộn cố định + sleep: theo dõi từng <img> trong trang bằng
+IntersectionObserver + naturalWidth, chỉ cuộn tới ảnh còn đang chờ và trả về
+ngay khi mọi ảnh đã tải xong (hoặc hết deadline).
+"""
+
+import os
+import time
+
+LAZY_LOAD_TIMEOUT = float(os.getenv("PLAYWRIGHT_LAZY_TIMEOUT", "20"))  # giây
+POLL_INTERVAL = 150  # ms giữa 2 lần kiểm tra
+
+# Trả về trạng thái ảnh trong trang; observer được cài 1 lần và ghi nhận ảnh đã vào viewport
+_IMAGE_STATE_JS = """
+(selector) => {
+    if (!window.__lazyState) {
+        const seen = new WeakSet();
+        window.__lazyState = {
+            seen,
+            observer: new IntersectionObserver(entries => {
+                for (const entry of entries) {
+                    if (entry.isIntersecting) seen.add(entry.target);
+                }
+            }, {rootMargin: '1500px 0px'})
+        };
+    }
+    const state = window.__lazyState;
+    const isPlaceholder = (src) => !src || src.startsWith('data:') || src.endsWith('/blank.gif');
+    let loaded = 0, failed = 0, pending = 0, firstUnseenTop = null;
+    for (const img of document.querySelectorAll(selector)) {
+        state.observer.observe(img);
+        const resolved = !isPlaceholder(img.currentSrc || img.getAttribute('src'));
+        if (resolved && img.complete && img.naturalWidth > 0) {
+            loaded++;
+        } else if (resolved && img.complete) {
+            failed++;
+        } else {
+            pending++;
+            // Ảnh chưa từng vào vùng nhìn thấy → cần cuộn tới để trang kích hoạt lazy-load
+            if (!state.seen.has(img) && firstUnseenTop === null) {
+                firstUnseenTop = img.getBoundingClientRect().top + window.scrollY;
+            }
+        }
+    }
+    const atBottom = window.innerHeight + window.scrollY >= document.body.scrollHeight - 2;
+    return {total: loaded + failed + pending, loaded, failed, pending, firstUnseenTop, atBottom};
+}
+"""
+
+
+def wait_for_lazy_images(page, selector, timeout=None):
+    """
+    Cuộn và chờ cho tới khi mọi ảnh khớp selector đã có src thật và tải xong
+
+    Args:
+        page: Playwright page
+        selector: CSS selector của ảnh chapter
+        timeout: Deadline (giây), mặc định PLAYWRIGHT_LAZY_TIMEOUT
+
+    Returns:
+        Dict trạng thái cuối cùng (total, loaded, failed, pending, ...)
+    """
+    deadline = time.monotonic() + (timeout or LAZY_LOAD_TIMEOUT)
+    last_total = -1
+    state = {"total": 0, "loaded": 0, "failed": 0, "pending": 0}
+
+    while time.monotonic() < deadline:
+        state = page.evaluate(_IMAGE_STATE_JS, selector)
+
+        if state["total"] and not state["pending"]:
+            # Mọi ảnh đã xong; nếu đã ở cuối trang và không có ảnh mới xuất hiện thì dừng
+            if state["atBottom"] and state["total"] == last_total:
+                break
+            page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        elif state["firstUnseenTop"] is not None:
+            # Chỉ cuộn tới ảnh đầu tiên chưa vào viewport; ảnh đã thấy thì chờ tải xong
+            page.evaluate("(y) => window.scrollTo(0, Math.max(y - 200, 0))", state["firstUnseenTop"])
+
+        last_total = state["total"]
+        page.wait_for_timeout(POLL_INTERVAL)
+
+    return state
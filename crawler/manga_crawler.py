@@ -8,15 +8,25 @@ Không sử dụng local storage
 import os
 import re
 import sys
+import time
 import requests
+from datetime import timezone
+from urllib.parse import urlparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from bs4 import BeautifulSoup
 
 # Import database và image storage
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-from database import db
+from database import db, page_urls
 from imagekit_storage import image_storage
 from crawler.flaresolverr_client import flaresolverr
+from crawler.chapter_scheduler import image_slots
+from crawler.clearance_cache import clearance_cache
+from crawler.backend_router import backend_router
+from crawler.rate_limiter import rate_limiter
+from crawler.http_pool import http_pool
+from crawler.html_cache import html_cache
+from crawler.parsers import html_parser
+from crawler.chapter_probe import ChapterProber, chapter_number
 
 # Import cloudscraper cho Vercel (không cần browser)
 try:
@@ -26,22 +36,31 @@ except ImportError:
     HAS_CLOUDSCRAPER = False
     cloudscraper_client = None
 
-# Kiểm tra Playwright có khả dụng không (không có trên Vercel)
+# Playwright (không có trên Vercel) - dùng chung browser pool đã khởi động sẵn
+from crawler.browser_pool import browser_pool, HAS_PLAYWRIGHT
+from crawler.lazy_loader import wait_for_lazy_images
+from crawler.image_pipeline import UploadPipeline
+from crawler.image_dedup import image_dedup
+from crawler.remote_ingest import remote_ingest
+
+# Title trang không còn là trang challenge Cloudflare
+CHALLENGE_DONE_JS = "() => !/Just a moment|Attention Required|Cloudflare/.test(document.title)"
+
+# Async pipeline (aiohttp) cho chế độ CRAWLER_IMAGE_MODE=async
 try:
-    from playwright.sync_api import sync_playwright
-    HAS_PLAYWRIGHT = True
+    from crawler.async_pipeline import async_pipeline, HAS_AIOHTTP
 except ImportError:
-    HAS_PLAYWRIGHT = False
+    async_pipeline = None
+    HAS_AIOHTTP = False
 
 class MangaCrawler:
     def __init__(self):
         self.base_url = "https://nettruyen.me.uk"
-        self.user_data_dir = os.path.join(os.path.dirname(__file__), "browser_profile")
         
         # Kết nối cloud storage
         db.connect()
         image_storage.connect()
-        print("☁️ Cloud-Only Mode: MongoDB + ImageKit")
+        print(f"☁️ Cloud-Only Mode: MongoDB + {image_storage.backend.name}")
         
         # Kiểm tra các phương thức bypass Cloudflare (theo thứ tự ưu tiên)
         # 1. FlareSolverr (tốt nhất, cần server riêng)
@@ -62,8 +81,8 @@ class MangaCrawler:
             else:
                 print("⚠️ WARNING: Không có phương thức bypass Cloudflare khả dụng!")
         
-        # Session cho requests (dùng cookies từ FlareSolverr)
-        self.session = requests.Session()
+        # Session cho requests (dùng cookies từ FlareSolverr), pool kết nối keep-alive theo host
+        self.session = http_pool.mount(requests.Session())
         self.session.headers.update({
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36",
             "Referer": self.base_url
@@ -71,21 +90,124 @@ class MangaCrawler:
         
         # Cookies từ FlareSolverr để bypass Cloudflare
         self.cf_cookies = None
+        
+        # Playwright: lấy ảnh từ network traffic của browser thay vì tải lại lần 2
+        self.playwright_capture = os.getenv("PLAYWRIGHT_CAPTURE_IMAGES", "true").lower() == "true"
+        
+        # Chế độ tải ảnh chapter: "threads" (ThreadPoolExecutor) hoặc "async" (aiohttp)
+        self.image_mode = os.getenv("CRAWLER_IMAGE_MODE", "threads").lower()
+        if self.image_mode == "async" and not HAS_AIOHTTP:
+            print("⚠️ CRAWLER_IMAGE_MODE=async nhưng chưa cài aiohttp, dùng threads")
+            self.image_mode = "threads"
+        
+        # Refresh truyện đã có: chỉ thêm chapter mới thay vì ghi lại cả mảng chapters
+        self.incremental_refresh = os.getenv("STORY_INCREMENTAL_REFRESH", "true").lower() == "true"
+        
+        # Kiểm tra chapter generate từ pattern có tồn tại không (tránh chapter ảo)
+        self.probe_chapters = os.getenv("CHAPTER_PROBE", "true").lower() == "true"
+        
+        # Repair ảnh lỗi của chapter: số lượt thử lại, backoff (giây) tăng gấp đôi theo số lần thử
+        self.repair_rounds = int(os.getenv("CHAPTER_REPAIR_ROUNDS", "3"))
+        self.repair_backoff = float(os.getenv("CHAPTER_REPAIR_BACKOFF", "2"))
+        self.repair_backoff_max = float(os.getenv("CHAPTER_REPAIR_BACKOFF_MAX", "60"))
 
-    def _get_browser_context(self, playwright):
-        """Tạo browser context với anti-bot (fallback khi không có FlareSolverr)"""
-        return playwright.chromium.launch_persistent_context(
-            self.user_data_dir,
-            headless=True,
-            args=["--disable-blink-features=AutomationControlled"],
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36"
-        )
-
-    def _update_session_cookies(self, cookies):
-        """Cập nhật cookies từ FlareSolverr vào session requests"""
-        self.cf_cookies = cookies
+    def _update_session_cookies(self, cookies, user_agent=None, url=None):
+        """Cập nhật cookies từ FlareSolverr vào session requests (và cache theo host)"""
+        if cookies:
+            # Gộp theo (domain, name): fetch trực tiếp / cache hit trả [] không được xóa cf_clearance đã có
+            merged = {(c.get("domain"), c.get("name")): c for c in self.cf_cookies or []}
+            merged.update({(c.get("domain"), c.get("name")): c for c in cookies})
+            self.cf_cookies = list(merged.values())
         for cookie in cookies:
             self.session.cookies.set(cookie.get("name"), cookie.get("value"))
+        if user_agent:
+            self.session.headers["User-Agent"] = user_agent
+        if url and cookies:
+            clearance_cache.store(urlparse(url).netloc, cookies, user_agent or self.session.headers["User-Agent"])
+
+    def _is_challenge(self, response):
+        """Response là trang challenge Cloudflare (cookie hết hạn hoặc bị từ chối)"""
+        if response.status_code in (403, 503) and any(h.lower().startswith("cf-") for h in response.headers):
+            return True
+        head = response.text[:2000]
+        return "<title>Just a moment" in head or "Attention Required" in head
+
+    def _fetch_direct(self, url):
+        """
+        Fast path: HTML cache còn hạn, hoặc fetch trực tiếp bằng cookie cf_clearance
+        đã cache (không qua solver, kèm If-None-Match/If-Modified-Since nếu có).
+        Trả về None nếu chưa có cookie hoặc cookie hết hiệu lực.
+        Kết quả lấy từ cache / 304 có "not_modified": True.
+        """
+        cached = html_cache.get_fresh(url)
+        if cached:
+            print(f"💾 HTML cache: {url[:60]}")
+            return {"html": cached["html"], "cookies": [], "status": 200, "not_modified": True}
+        
+        host = urlparse(url).netloc
+        clearance = clearance_cache.get(host)
+        if not clearance:
+            return None
+        
+        # Cookie cf_clearance chỉ hợp lệ với đúng User-Agent đã giải challenge
+        self.session.cookies.update(clearance["cookies"])
+        self.session.headers["User-Agent"] = clearance["user_agent"]
+        
+        stale = html_cache.get(url)
+        try:
+            response = rate_limiter.request(
+                "GET", url, session=self.session, timeout=15,
+                headers=html_cache.conditional_headers(stale)
+            )
+        except Exception as e:
+            print(f"⚠️ Fetch trực tiếp lỗi: {e}")
+            return None
+        
+        if response.status_code == 304 and stale:
+            print(f"💾 Trang không đổi (304): {url[:60]}")
+            html_cache.touch(url, stale)
+            return {"html": stale["html"], "cookies": [], "user_agent": clearance["user_agent"], "status": 304, "not_modified": True}
+        if self._is_challenge(response):
+            print(f"🛡️ Cookie Cloudflare của {host} đã hết hạn, dùng lại solver")
+            clearance_cache.invalidate(host)
+            return None
+        if response.status_code != 200:
+            return None
+        
+        print(f"⚡ Fetch trực tiếp (cf_clearance): {url[:60]}")
+        html_cache.store(url, response.text, response.headers)
+        return {
+            "html": response.text,
+            "cookies": [],
+            "user_agent": clearance["user_agent"],
+            "status": response.status_code
+        }
+
+    def _get_page_via_flaresolverr(self, url):
+        """Lấy trang qua fast path, nếu không được thì qua FlareSolverr (và lưu HTML cache)"""
+        result = self._fetch_direct(url)
+        if result:
+            return result
+        result = flaresolverr.get_page(url)
+        if result and result.get("status") == 200:
+            html_cache.store(url, result.get("html"), result.get("headers"))
+        return result
+
+    def _get_page_via_cloudscraper(self, url):
+        """Lấy trang qua fast path, nếu không được thì qua CloudScraper (và cache cookies)"""
+        result = self._fetch_direct(url)
+        if result:
+            return result
+        result = cloudscraper_client.get_page(url)
+        if result:
+            html_cache.store(url, result.get("html"), result.get("headers"))
+        if result and result.get("cookies"):
+            clearance_cache.store(
+                urlparse(url).netloc,
+                result["cookies"],
+                cloudscraper_client.scraper.headers.get("User-Agent", "")
+            )
+        return result
 
     def upload_cover_via_requests(self, manga_id, thumbnail_url):
         """Tải và upload ảnh bìa lên ImageKit sử dụng requests (cho FlareSolverr)"""
@@ -106,7 +228,7 @@ class MangaCrawler:
                 for cookie in self.cf_cookies:
                     cookies[cookie.get('name')] = cookie.get('value')
             
-            response = requests.get(thumbnail_url, headers=headers, cookies=cookies, timeout=30)
+            response = http_pool.request("GET", thumbnail_url, headers=headers, cookies=cookies, timeout=30)
             if response.status_code == 200 and len(response.content) > 1000:
                 # Upload lên ImageKit
                 url = image_storage.upload_from_bytes(
@@ -122,6 +244,102 @@ class MangaCrawler:
         
         return thumbnail_url  # Fallback về URL gốc
 
+    def _run_backends(self, operation, attempts, is_ok=bool):
+        """
+        Thử các backend theo thứ tự backend router đề xuất cho tới khi thành công
+        
+        Args:
+            operation: Loại thao tác ("home", "story", "chapter")
+            attempts: List (tên backend, đang bật, hàm thực hiện)
+            is_ok: Hàm kiểm tra kết quả có hợp lệ không
+        
+        Returns:
+            (tên backend thành công, kết quả) hoặc (None, None)
+        """
+        functions = {name: fn for name, enabled, fn in attempts if enabled}
+        for backend in backend_router.order(operation, list(functions)):
+            result = backend_router.call(operation, backend, functions[backend], is_ok)
+            if is_ok(result):
+                return backend, result
+            print(f"⚠️ {backend} thất bại, thử backend tiếp theo...")
+        return None, None
+
+    def _extract_image_sources(self, imgs):
+        """Lấy (idx, src) từ src thô của các thẻ img chapter, bỏ qua src không hợp lệ"""
+        sources = []
+        for idx, src in enumerate(imgs):
+            if not src:
+                continue
+            if "http" not in src:
+                if src.startswith("//"):
+                    src = "https:" + src
+                else:
+                    continue
+            sources.append((idx, src))
+        return sources
+
+    def _build_pages(self, sources, results):
+        """
+        Trạng thái từng ảnh sau lượt tải đầu (giữ lại ảnh lỗi để repair, không bỏ lỗ)
+        
+        Args:
+            sources: List (idx, src)
+            results: List kết quả upload_page theo idx ({url, width, height, tiles?}, None = lỗi)
+        """
+        pages = []
+        for idx, src in sources:
+            uploaded = results[idx] if idx < len(results) else None
+            page = {
+                "index": idx,
+                "source_url": src,
+                "status": "done" if uploaded else "failed",
+                "attempts": 1,
+                "url": None
+            }
+            if uploaded:
+                page.update(uploaded)
+            pages.append(page)
+        return pages
+
+    def _ingest_remote(self, sources, folder_path, size):
+        """
+        Gửi ảnh của host không chặn hotlink cho ImageKit tự fetch (IMAGE_INGEST_MODE=remote)
+        
+        Returns:
+            (list kết quả theo idx - None cho ảnh chưa có, list (idx, src) còn phải tự tải)
+        """
+        remote_results, local_sources = remote_ingest.ingest(sources, folder_path)
+        results = [None] * size
+        for idx, uploaded in remote_results.items():
+            results[idx] = uploaded
+        return results, local_sources
+
+    def _download_staged(self, sources, fetch, folder_path, chapter_id, results):
+        """
+        Download (pool IMAGE_DOWNLOAD_WORKERS) → queue giới hạn → upload (pool IMAGE_PIPELINE_WORKERS)
+        Kết quả ghi vào results theo idx nên thứ tự trang giữ nguyên dù upload xong không theo thứ tự.
+        
+        Returns:
+            Số ảnh đã xong trong results
+        """
+        if sources:
+            pipeline = UploadPipeline(folder_path, label=chapter_id)
+            try:
+                pipeline.feed(sources, fetch)
+            finally:
+                uploaded = pipeline.close()
+            for idx, page in uploaded.items():
+                results[idx] = page
+        return sum(1 for r in results if r)
+
+    def _has_done_page(self, pages):
+        return any(page["status"] == "done" for page in pages or [])
+
+    def _download_chapter_async(self, sources, folder_path, headers, cookies):
+        """Download + Upload ảnh chapter qua async pipeline (1 event loop)"""
+        print(f"⚡ Async pipeline: {len(sources)} ảnh, tối đa {async_pipeline.max_in_flight} request đồng thời")
+        return async_pipeline.run(sources, folder_path, headers=headers, cookies=cookies)
+
     def upload_cover(self, page, manga_id, thumbnail_url):
         """Tải và upload ảnh bìa lên ImageKit"""
         if not thumbnail_url:
@@ -129,7 +347,9 @@ class MangaCrawler:
         
         try:
             # Tải ảnh từ nguồn
+            rate_limiter.acquire(thumbnail_url)
             response = page.request.get(thumbnail_url, headers={"referer": self.base_url + "/"})
+            rate_limiter.feedback(thumbnail_url, response.status, response.headers.get("retry-after"))
             if response.status == 200:
                 # Upload trực tiếp lên ImageKit
                 image_bytes = response.body()
@@ -150,25 +370,14 @@ class MangaCrawler:
         """Crawl danh sách manga từ trang chủ - LƯU VÀO MONGODB"""
         print("🌍 Đang crawl trang chủ NetTruyen...")
         
-        # Thứ tự ưu tiên: FlareSolverr > CloudScraper > Playwright
-        
-        # 1. Thử FlareSolverr
-        if self.use_flaresolverr:
-            manga_list = self._crawl_home_via_flaresolverr(download_covers)
-            if manga_list:
-                return manga_list
-            print("⚠️ FlareSolverr thất bại, thử CloudScraper...")
-        
-        # 2. Thử CloudScraper (cho Vercel)
-        if self.use_cloudscraper:
-            manga_list = self._crawl_home_via_cloudscraper(download_covers)
-            if manga_list:
-                return manga_list
-            print("⚠️ CloudScraper thất bại, thử Playwright...")
-        
-        # 3. Fallback: Playwright
-        if self.use_playwright:
-            return self._crawl_home_via_playwright(download_covers)
+        # Thứ tự thử do backend router quyết định (mặc định: FlareSolverr > CloudScraper > Playwright)
+        backend, manga_list = self._run_backends("home", [
+            ("flaresolverr", self.use_flaresolverr, lambda: self._crawl_home_via_flaresolverr(download_covers)),
+            ("cloudscraper", self.use_cloudscraper, lambda: self._crawl_home_via_cloudscraper(download_covers)),
+            ("playwright", self.use_playwright, lambda: self._crawl_home_via_playwright(download_covers)),
+        ])
+        if backend:
+            return manga_list
         
         print("❌ Không có phương thức nào khả dụng để crawl!")
         return []
@@ -177,46 +386,18 @@ class MangaCrawler:
         """Crawl trang chủ qua FlareSolverr"""
         print("🔓 Đang crawl trang chủ qua FlareSolverr...")
         
-        result = flaresolverr.get_page(self.base_url)
+        result = self._get_page_via_flaresolverr(self.base_url)
         if not result or not result.get("html"):
             print("❌ FlareSolverr không thể lấy được trang")
             return None
         
         # Lưu cookies để dùng cho các request khác
-        self._update_session_cookies(result.get("cookies", []))
-        
-        html = result["html"]
-        soup = BeautifulSoup(html, "lxml")
+        self._update_session_cookies(result.get("cookies", []), result.get("user_agent"), self.base_url)
         
         manga_list = []
-        items = soup.select(".item")
         
         # Thu thập thông tin trước
-        manga_data = []
-        for item in items:
-            title_el = item.select_one("h3 a")
-            img_el = item.select_one("img")
-            
-            if title_el:
-                href = title_el.get('href', '')
-                manga_id = href.split('/')[-1] if href else ''
-                
-                thumbnail_original = ""
-                if img_el:
-                    thumbnail_original = img_el.get('data-original') or img_el.get('data-src') or img_el.get('src', '')
-                
-                latest_chapter = ""
-                chapter_el = item.select_one(".comic-item .chapter a") or item.select_one(".chapter a")
-                if chapter_el:
-                    latest_chapter = chapter_el.get_text(strip=True)
-                
-                manga_data.append({
-                    "id": manga_id,
-                    "title": title_el.get_text(strip=True),
-                    "url": href,
-                    "thumbnail_original": thumbnail_original,
-                    "latest_chapter": latest_chapter
-                })
+        manga_data = html_parser.parse_home(result["html"])
         
         # Upload covers song song nếu cần
         if download_covers and manga_data:
@@ -247,43 +428,15 @@ class MangaCrawler:
         """Crawl trang chủ qua CloudScraper (cho Vercel - không cần browser)"""
         print("🌐 Đang crawl trang chủ qua CloudScraper...")
         
-        result = cloudscraper_client.get_page(self.base_url)
+        result = self._get_page_via_cloudscraper(self.base_url)
         if not result or not result.get("html"):
             print("❌ CloudScraper không thể lấy được trang")
             return None
         
-        html = result["html"]
-        soup = BeautifulSoup(html, "lxml")
-        
         manga_list = []
-        items = soup.select(".item")
         
         # Thu thập thông tin
-        manga_data = []
-        for item in items:
-            title_el = item.select_one("h3 a")
-            img_el = item.select_one("img")
-            
-            if title_el:
-                href = title_el.get('href', '')
-                manga_id = href.split('/')[-1] if href else ''
-                
-                thumbnail_original = ""
-                if img_el:
-                    thumbnail_original = img_el.get('data-original') or img_el.get('data-src') or img_el.get('src', '')
-                
-                latest_chapter = ""
-                chapter_el = item.select_one(".comic-item .chapter a") or item.select_one(".chapter a")
-                if chapter_el:
-                    latest_chapter = chapter_el.get_text(strip=True)
-                
-                manga_data.append({
-                    "id": manga_id,
-                    "title": title_el.get_text(strip=True),
-                    "url": href,
-                    "thumbnail_original": thumbnail_original,
-                    "latest_chapter": latest_chapter
-                })
+        manga_data = html_parser.parse_home(result["html"])
         
         # Upload covers song song nếu cần
         if download_covers and manga_data:
@@ -365,12 +518,8 @@ class MangaCrawler:
         return results
     
     def _crawl_home_via_playwright(self, download_covers=True):
-        """Crawl trang chủ qua Playwright (fallback)"""
-        from playwright.sync_api import sync_playwright
-        
-        with sync_playwright() as p:
-            context = self._get_browser_context(p)
-            page = context.new_page()
+        """Crawl trang chủ qua Playwright (fallback, dùng browser pool)"""
+        def crawl(page):
             page.goto(self.base_url, wait_until="networkidle", timeout=60000)
             
             # Cuộn để load thêm
@@ -379,79 +528,62 @@ class MangaCrawler:
                 page.wait_for_timeout(1000)
             
             content = page.content()
-            soup = BeautifulSoup(content, "lxml")
+            items = html_parser.parse_home(content)
             
             manga_list = []
-            items = soup.select(".item")
-            
-            for idx, item in enumerate(items):
-                title_el = item.select_one("h3 a")
-                img_el = item.select_one("img")
+            for idx, manga in enumerate(items):
+                # Upload cover lên ImageKit
+                thumbnail = manga["thumbnail_original"]
+                if download_covers and thumbnail:
+                    uploaded_url = self.upload_cover(page, manga["id"], thumbnail)
+                    if uploaded_url:
+                        thumbnail = uploaded_url
                 
-                if title_el:
-                    href = title_el.get('href', '')
-                    manga_id = href.split('/')[-1] if href else ''
-                    
-                    # Lấy thumbnail gốc
-                    thumbnail_original = ""
-                    if img_el:
-                        thumbnail_original = img_el.get('data-original') or img_el.get('data-src') or img_el.get('src', '')
-                    
-                    # Upload cover lên ImageKit
-                    thumbnail = thumbnail_original
-                    if download_covers and thumbnail_original:
-                        uploaded_url = self.upload_cover(page, manga_id, thumbnail_original)
-                        if uploaded_url:
-                            thumbnail = uploaded_url
-                    
-                    # Lấy chapter mới nhất
-                    latest_chapter = ""
-                    chapter_el = item.select_one(".comic-item .chapter a") or item.select_one(".chapter a")
-                    if chapter_el:
-                        latest_chapter = chapter_el.get_text(strip=True)
-                    
-                    manga_list.append({
-                        "id": manga_id,
-                        "title": title_el.get_text(strip=True),
-                        "url": href,
-                        "thumbnail": thumbnail,
-                        "thumbnail_original": thumbnail_original,
-                        "latest_chapter": latest_chapter
-                    })
-                    
-                    print(f"  [{idx+1}/{len(items)}] {title_el.get_text(strip=True)[:30]}...")
-            
-            # Lưu vào MongoDB
-            db.save_manga_list(manga_list)
-            print(f"☁️ Đã lưu {len(manga_list)} truyện vào MongoDB")
+                manga_list.append({
+                    "id": manga["id"],
+                    "title": manga["title"],
+                    "url": manga["url"],
+                    "thumbnail": thumbnail,
+                    "thumbnail_original": manga["thumbnail_original"],
+                    "latest_chapter": manga["latest_chapter"]
+                })
+                
+                print(f"  [{idx+1}/{len(items)}] {manga['title'][:30]}...")
             
-            context.close()
             return manga_list
-
-    def crawl_story_detail(self, manga_id, download_cover=True):
-        """Crawl chi tiết một truyện - LƯU VÀO MONGODB"""
-        url = f"{self.base_url}/truyen-tranh/{manga_id}"
-        print(f"📖 Đang crawl chi tiết truyện: {manga_id}")
         
-        # Thứ tự ưu tiên: FlareSolverr > CloudScraper > Playwright
+        manga_list = browser_pool.run(crawl)
         
-        # 1. FlareSolverr
-        if self.use_flaresolverr:
-            data = self._crawl_story_via_flaresolverr(manga_id, url, download_cover)
-            if data and data.get('title'):
-                return data
-            print("⚠️ FlareSolverr thất bại, thử CloudScraper...")
+        # Lưu vào MongoDB
+        db.save_manga_list(manga_list)
+        print(f"☁️ Đã lưu {len(manga_list)} truyện vào MongoDB")
         
-        # 2. CloudScraper (cho Vercel)
-        if self.use_cloudscraper:
-            data = self._crawl_story_via_cloudscraper(manga_id, url, download_cover)
-            if data and data.get('title'):
-                return data
-            print("⚠️ CloudScraper thất bại, thử Playwright...")
+        return manga_list
+
+    def crawl_story_detail(self, manga_id, download_cover=True, force=False):
+        """
+        Crawl chi tiết một truyện - LƯU VÀO MONGODB
+        force=True (refresh thủ công): bỏ qua HTML cache, luôn fetch lại trang truyện
+        """
+        url = f"{self.base_url}/truyen-tranh/{manga_id}"
+        print(f"📖 Đang crawl chi tiết truyện: {manga_id}")
         
-        # 3. Playwright (fallback cuối)
-        if self.use_playwright:
-            return self._crawl_story_via_playwright(manga_id, url, download_cover)
+        if force:
+            html_cache.invalidate(url)
+        # HTML còn trong TTL → dữ liệu đã parse lần trước vẫn đúng, không cần fetch/parse
+        elif html_cache.get_fresh(url):
+            stored = self._stored_story(manga_id)
+            if stored:
+                return stored
+        
+        # Thứ tự thử do backend router quyết định (mặc định: FlareSolverr > CloudScraper > Playwright)
+        backend, data = self._run_backends("story", [
+            ("flaresolverr", self.use_flaresolverr, lambda: self._crawl_story_via_flaresolverr(manga_id, url, download_cover)),
+            ("cloudscraper", self.use_cloudscraper, lambda: self._crawl_story_via_cloudscraper(manga_id, url, download_cover)),
+            ("playwright", self.use_playwright, lambda: self._crawl_story_via_playwright(manga_id, url, download_cover)),
+        ], is_ok=lambda data: bool(data and data.get('title')))
+        if backend:
+            return data
         
         print("❌ Không có phương thức nào khả dụng!")
         return None
@@ -460,47 +592,47 @@ class MangaCrawler:
         """Crawl story detail qua FlareSolverr"""
         print(f"🔓 Đang bypass Cloudflare qua FlareSolverr...")
         
-        result = flaresolverr.get_page(url)
+        result = self._get_page_via_flaresolverr(url)
         if not result or not result.get("html"):
             print("❌ FlareSolverr không thể lấy được trang")
             return None
         
+        if result.get("not_modified"):
+            stored = self._stored_story(manga_id)
+            if stored:
+                return stored
+        
         # Lưu cookies từ FlareSolverr để dùng cho requests
-        self.cf_cookies = result.get("cookies", [])
+        self._update_session_cookies(result.get("cookies", []), result.get("user_agent"), url)
         
-        html = result["html"]
-        soup = BeautifulSoup(html, "lxml")
+        story = html_parser.parse_story(result["html"])
         
         # Lấy và upload thumbnail qua requests
-        thumbnail_original = ""
-        thumb_el = soup.select_one(".col-image img")
-        if thumb_el:
-            thumbnail_original = thumb_el.get('data-original') or thumb_el.get('data-src') or thumb_el.get('src', '')
-        
+        thumbnail_original = story["thumbnail_original"]
         thumbnail = thumbnail_original
         if download_cover and thumbnail_original:
             thumbnail = self.upload_cover_via_requests(manga_id, thumbnail_original)
         
-        return self._parse_story_detail(soup, manga_id, download_cover, thumbnail, thumbnail_original)
+        return self._parse_story_detail(story, manga_id, download_cover, thumbnail, thumbnail_original)
     
     def _crawl_story_via_cloudscraper(self, manga_id, url, download_cover=True):
         """Crawl story detail qua CloudScraper (cho Vercel - không cần browser)"""
         print(f"🌐 Đang crawl story qua CloudScraper...")
         
-        result = cloudscraper_client.get_page(url)
+        result = self._get_page_via_cloudscraper(url)
         if not result or not result.get("html"):
             print("❌ CloudScraper không thể lấy được trang")
             return None
         
-        html = result["html"]
-        soup = BeautifulSoup(html, "lxml")
+        if result.get("not_modified"):
+            stored = self._stored_story(manga_id)
+            if stored:
+                return stored
         
-        # Lấy và upload thumbnail qua CloudScraper
-        thumbnail_original = ""
-        thumb_el = soup.select_one(".col-image img")
-        if thumb_el:
-            thumbnail_original = thumb_el.get('data-original') or thumb_el.get('data-src') or thumb_el.get('src', '')
+        story = html_parser.parse_story(result["html"])
         
+        # Lấy và upload thumbnail qua CloudScraper
+        thumbnail_original = story["thumbnail_original"]
         thumbnail = thumbnail_original
         if download_cover and thumbnail_original:
             image_bytes = cloudscraper_client.get_image(thumbnail_original, referer=self.base_url)
@@ -514,106 +646,176 @@ class MangaCrawler:
                     thumbnail = uploaded_url
                     print(f"  ☁️ Uploaded cover via CloudScraper: {manga_id}")
         
-        return self._parse_story_detail(soup, manga_id, download_cover, thumbnail, thumbnail_original)
+        return self._parse_story_detail(story, manga_id, download_cover, thumbnail, thumbnail_original)
     
     def _crawl_story_via_playwright(self, manga_id, url, download_cover=True):
-        """Crawl story detail qua Playwright (fallback)"""
-        from playwright.sync_api import sync_playwright
-        
-        with sync_playwright() as p:
-            context = self._get_browser_context(p)
-            page = context.new_page()
+        """Crawl story detail qua Playwright (fallback, dùng browser pool)"""
+        def crawl(page):
             page.goto(url, wait_until="domcontentloaded", timeout=60000)
             page.wait_for_timeout(2000)
             
             print("📜 Đang phân tích chapters...")
             
             content = page.content()
-            soup = BeautifulSoup(content, "lxml")
+            html_cache.store(url, content)
+            story = html_parser.parse_story(content)
             
             # Upload cover nếu dùng Playwright
-            thumbnail_original = ""
-            thumb_el = soup.select_one(".col-image img")
-            if thumb_el:
-                thumbnail_original = thumb_el.get('data-original') or thumb_el.get('data-src') or thumb_el.get('src', '')
-            
+            thumbnail_original = story["thumbnail_original"]
             thumbnail = thumbnail_original
             if download_cover and thumbnail_original:
                 thumbnail = self.upload_cover(page, manga_id, thumbnail_original)
             
-            data = self._parse_story_detail(soup, manga_id, download_cover, thumbnail, thumbnail_original)
-            
-            context.close()
-            return data
+            return story, thumbnail, thumbnail_original
+        
+        story, thumbnail, thumbnail_original = browser_pool.run(crawl)
+        return self._parse_story_detail(story, manga_id, download_cover, thumbnail, thumbnail_original)
     
-    def _parse_story_detail(self, soup, manga_id, download_cover=True, thumbnail=None, thumbnail_original=None):
-        """Parse HTML để lấy thông tin truyện"""
+    def _stored_story(self, manga_id):
+        """Dữ liệu truyện đã lưu trong MongoDB (dùng khi HTML không đổi), None nếu chưa có"""
+        stored = self.get_story_data(manga_id)
+        if stored and stored.get('title') and stored.get('chapters'):
+            print(f"⏭️ Trang truyện không đổi, dùng dữ liệu đã lưu ({len(stored['chapters'])} chapters)")
+            stored["new_chapters"] = []
+            return stored
+        return None
+
+    def _probe_session(self):
+        """Session dùng để probe chapter: requests + cf_clearance nếu có, không thì CloudScraper"""
+        clearance = clearance_cache.get(urlparse(self.base_url).netloc)
+        if clearance:
+            self.session.cookies.update(clearance["cookies"])
+            self.session.headers["User-Agent"] = clearance["user_agent"]
+            return self.session
+        if self.use_cloudscraper:
+            return cloudscraper_client.scraper
+        return None
+
+    def _validate_chapters(self, manga_id, chapters, chapter_links):
+        """
+        Gộp chapter có trên trang (chap lẻ, ID khác pattern) vào danh sách generate
+        và đánh dấu verified / missing / unknown (probe các chapter chưa rõ)
+        
+        Returns:
+            (chapters, status_changes) - status_changes: {chapter_id: status} của
+            các chapter đã lưu trước đó mà trạng thái thay đổi
+        """
+        by_id = {c["id"]: c for c in chapters}
+        for chap_url, chap_name in chapter_links:
+            chap_id = chap_url.split('/')[-1] if chap_url else ''
+            if not chap_id:
+                continue
+            if chap_id not in by_id:
+                if not chap_url.startswith('http'):
+                    chap_url = self.base_url + chap_url
+                by_id[chap_id] = {"id": chap_id, "name": chap_name, "url": chap_url}
+                chapters.append(by_id[chap_id])
+            by_id[chap_id]["status"] = "verified"
+        
+        # Chapter mới nhất trước, chap lẻ nằm đúng vị trí (sort ổn định giữ thứ tự cũ khi bằng nhau)
+        chapters.sort(key=lambda c: chapter_number(c["id"]) or (0, 0), reverse=True)
+        
+        stored = db.get_chapter_statuses(manga_id)
+        to_probe = []
+        for chapter in chapters:
+            if "status" in chapter:
+                continue
+            if stored.get(chapter["id"]) in ("verified", "missing"):
+                chapter["status"] = stored[chapter["id"]]
+            else:
+                to_probe.append(chapter)
+        
+        session = self._probe_session() if self.probe_chapters and to_probe else None
+        if session is not None:
+            print(f"  🔎 Probe {len(to_probe)} chapters chưa xác minh...")
+            statuses = ChapterProber(session, is_challenge=self._is_challenge).probe(to_probe)
+        else:
+            statuses = {}
+        for chapter in to_probe:
+            chapter["status"] = statuses.get(chapter["id"], "unknown")
+        
+        missing = sum(1 for c in chapters if c["status"] == "missing")
+        if missing:
+            print(f"  👻 {missing} chapter không tồn tại (sẽ bỏ qua khi tải)")
+        
+        status_changes = {
+            c["id"]: c["status"] for c in chapters
+            if c["id"] in stored and stored[c["id"]] != c["status"]
+        }
+        return chapters, status_changes
+
+    def _save_story_incremental(self, data):
+        """
+        So sánh chapter mới nhất với bản đã lưu, chỉ $push các chapter mới lên đầu mảng
+        
+        Returns:
+            List ID chapter mới, hoặc None nếu cần lưu lại toàn bộ
+            (chưa có trong DB, danh sách chapter bị đổi, hoặc document vừa bị ghi bởi nơi khác)
+        """
+        stored = db.get_manga_head(data["id"])
+        if not stored or not stored.get("chapters"):
+            return None
+        
+        head_id = stored["chapters"][0].get("id")
+        ids = [c["id"] for c in data["chapters"]]
+        if head_id not in ids:
+            return None
+        new_count = ids.index(head_id)
+        # Phần cũ phải khớp số lượng đã lưu, nếu không (site đổi pattern, fallback...) thì ghi lại hết
+        if len(ids) - new_count != stored.get("total_chapters"):
+            return None
+        
+        fields = {k: v for k, v in data.items() if k not in ("chapters", "total_chapters", "latest_chapter")}
+        if not db.append_new_chapters(data["id"], data["chapters"][:new_count], head_id, fields):
+            return None
+        
+        if new_count:
+            print(f"  🆕 {new_count} chapter mới: {', '.join(ids[:min(new_count, 5)])}{'...' if new_count > 5 else ''}")
+        else:
+            print("  ✅ Không có chapter mới")
+        return ids[:new_count]
+
+    def _parse_story_detail(self, story, manga_id, download_cover=True, thumbnail=None, thumbnail_original=None):
+        """Dựng dữ liệu truyện (generate đủ chapters) từ kết quả html_parser.parse_story"""
         print("📜 Đang phân tích chapters...")
         
         # Lấy thông tin truyện
-        title = ""
-        title_el = soup.select_one("h1.title-detail")
-        if title_el:
-            title = title_el.get_text(strip=True)
-        
-        description = ""
-        desc_el = soup.select_one(".detail-content p")
-        if desc_el:
-            description = desc_el.get_text(strip=True)
+        title = story["title"]
+        description = story["description"]
         
         # Lấy thumbnail nếu chưa có
         if not thumbnail_original:
-            thumb_el = soup.select_one(".col-image img")
-            if thumb_el:
-                thumbnail_original = thumb_el.get('data-original') or thumb_el.get('data-src') or thumb_el.get('src', '')
+            thumbnail_original = story["thumbnail_original"]
             thumbnail = thumbnail_original
         
-        # Lấy thể loại
-        genres = []
-        genre_els = soup.select(".kind.row .col-xs-8 a")
-        for g in genre_els:
-            genres.append(g.get_text(strip=True))
-        
-        # Lấy tác giả
-        author = ""
-        author_el = soup.select_one(".author.row .col-xs-8")
-        if author_el:
-            author = author_el.get_text(strip=True)
-        
-        # Lấy trạng thái
-        status = ""
-        status_el = soup.select_one(".status.row .col-xs-8")
-        if status_el:
-            status = status_el.get_text(strip=True)
+        genres = story["genres"]
+        author = story["author"]
+        status = story["status"]
         
         # Phân tích pattern chapters
-        visible_rows = soup.select("#nt_listchapter ul li.row:not(.heading)")
+        chapter_links = story["chapter_links"]
         
         chapters = []
         chapter_pattern = None
         max_chapter = 0
         min_chapter = float('inf')
         
-        for row in visible_rows:
-            link = row.select_one("a")
-            if link:
-                chap_url = link.get('href', '')
+        for chap_url, _ in chapter_links:
+            url_match = re.search(r'[/-](chuong|chap|chapter)[/-]?(\d+)', chap_url, re.IGNORECASE)
+            if url_match:
+                chapter_num = int(url_match.group(2))
+                prefix = url_match.group(1).lower()
                 
-                url_match = re.search(r'[/-](chuong|chap|chapter)[/-]?(\d+)', chap_url, re.IGNORECASE)
-                if url_match:
-                    chapter_num = int(url_match.group(2))
-                    prefix = url_match.group(1).lower()
-                    
-                    if not chapter_pattern:
-                        base_url = re.sub(r'[/-](chuong|chap|chapter)[/-]?\d+.*$', '', chap_url, flags=re.IGNORECASE)
-                        chapter_pattern = {
-                            'base_url': base_url,
-                            'prefix': prefix,
-                            'separator': '-' if f'{prefix}-' in chap_url.lower() else ''
-                        }
-                    
-                    max_chapter = max(max_chapter, chapter_num)
-                    min_chapter = min(min_chapter, chapter_num)
+                if not chapter_pattern:
+                    base_url = re.sub(r'[/-](chuong|chap|chapter)[/-]?\d+.*$', '', chap_url, flags=re.IGNORECASE)
+                    chapter_pattern = {
+                        'base_url': base_url,
+                        'prefix': prefix,
+                        'separator': '-' if f'{prefix}-' in chap_url.lower() else ''
+                    }
+                
+                max_chapter = max(max_chapter, chapter_num)
+                min_chapter = min(min_chapter, chapter_num)
         
         print(f"  📊 Phân tích: Chapter {min_chapter} → {max_chapter}")
         
@@ -633,20 +835,20 @@ class MangaCrawler:
                 })
             
             print(f"  ✅ Đã generate {len(chapters)} chapters!")
+            chapters, status_changes = self._validate_chapters(manga_id, chapters, chapter_links)
         else:
             # Fallback
-            for row in visible_rows:
-                link = row.select_one("a")
-                if link:
-                    chap_url = link.get('href', '')
-                    chap_id = chap_url.split('/')[-1] if chap_url else ''
-                    if not chap_url.startswith('http'):
-                        chap_url = self.base_url + chap_url
-                    chapters.append({
-                        "id": chap_id,
-                        "name": link.get_text(strip=True),
-                        "url": chap_url
-                    })
+            status_changes = {}
+            for chap_url, chap_name in chapter_links:
+                chap_id = chap_url.split('/')[-1] if chap_url else ''
+                if not chap_url.startswith('http'):
+                    chap_url = self.base_url + chap_url
+                chapters.append({
+                    "id": chap_id,
+                    "name": chap_name,
+                    "url": chap_url,
+                    "status": "verified"
+                })
         
         # Chuẩn bị dữ liệu
         data = {
@@ -659,11 +861,20 @@ class MangaCrawler:
             "status": status,
             "genres": genres,
             "chapters": chapters,
-            "total_chapters": len(chapters)
+            "total_chapters": len(chapters),
+            "latest_chapter": chapters[0]["name"] if chapters else ""
         }
         
         # Lưu vào MongoDB (cả manga_details và mangas)
-        db.save_manga_detail(data)
+        new_chapters = self._save_story_incremental(data) if self.incremental_refresh else None
+        if new_chapters is None:
+            # Ghi lại toàn bộ: chapter mới = chapter chưa có trong bản đã lưu (không phải cả truyện)
+            stored_ids = set(db.get_chapter_ids(manga_id))
+            db.save_manga_detail(data)
+            new_chapters = [c["id"] for c in chapters if c["id"] not in stored_ids]
+        elif status_changes:
+            db.set_chapter_status(manga_id, status_changes)
+        data["new_chapters"] = new_chapters
         
         # Thêm vào danh sách manga trên trang chủ
         manga_item = {
@@ -684,16 +895,13 @@ class MangaCrawler:
         """Download chapter sử dụng FlareSolverr - Download + Upload song song"""
         print(f"🔓 Đang bypass Cloudflare qua FlareSolverr...")
         
-        result = flaresolverr.get_page(chapter_url)
+        result = self._get_page_via_flaresolverr(chapter_url)
         if not result or not result.get("html"):
             print("❌ FlareSolverr không thể lấy được trang")
             return []
         
-        html = result["html"]
-        soup = BeautifulSoup(html, "lxml")
-        
         # Tìm tất cả ảnh chapter
-        imgs = soup.select(".reading-detail img, .page-chapter img, .reading img")
+        imgs = html_parser.chapter_images(result["html"])
         
         if not imgs:
             print(f"⚠️ Không tìm thấy ảnh trong chapter")
@@ -704,54 +912,38 @@ class MangaCrawler:
         folder_path = f"manga/{manga_id}/{chapter_id}"
         
         # Cập nhật cookies từ FlareSolverr vào session
-        self._update_session_cookies(result.get("cookies", []))
-        
-        if result.get("user_agent"):
-            self.session.headers["User-Agent"] = result["user_agent"]
-        
-        # Download và Upload song song trong cùng 1 task
-        def download_and_upload(item):
-            idx, img = item
-            src = img.get("data-original") or img.get("data-src") or img.get("src")
-            if not src:
-                return None
-            if "http" not in src:
-                if src.startswith("//"):
-                    src = "https:" + src
-                else:
-                    return None
-            try:
-                # Download
-                response = self.session.get(src, timeout=30)
-                if response.status_code == 200 and len(response.content) > 1000:
-                    # Upload ngay sau khi download xong
-                    filename = f"{idx:03d}.jpg"
-                    url = image_storage.upload_from_bytes(response.content, folder_path, filename)
-                    if url:
-                        return (idx, url)
-            except Exception as e:
-                print(f"  ❌ Ảnh {idx} lỗi: {e}")
+        self._update_session_cookies(result.get("cookies", []), result.get("user_agent"), chapter_url)
+        
+        sources = self._extract_image_sources(imgs)
+        results, local_sources = self._ingest_remote(sources, folder_path, len(imgs))
+        
+        if self.image_mode == "async":
+            downloaded = self._download_chapter_async(
+                local_sources, folder_path,
+                headers=dict(self.session.headers),
+                cookies=self.session.cookies.get_dict()
+            )
+            for idx, uploaded in enumerate(downloaded):
+                results[idx] = results[idx] or uploaded
+            pages = self._build_pages(sources, results)
+            print(f"✅ Hoàn thành {sum(1 for r in results if r)}/{len(imgs)} ảnh (async)")
+            return pages
+        
+        def fetch(src):
+            # Giới hạn tổng số ảnh đang tải trên toàn process (slot chỉ giữ lúc tải, không giữ khi chờ rate limit)
+            response = rate_limiter.request("GET", src, session=self.session, slot=image_slots, timeout=30)
+            if response.status_code == 200 and len(response.content) > 1000:
+                return response.content
             return None
         
-        # Chạy song song: download + upload cùng lúc
-        urls = [None] * len(imgs)
-        completed = 0
+        # Stage download và stage upload chạy song song với số thread riêng (ảnh đã ingest từ xa bỏ qua)
+        completed = self._download_staged(local_sources, fetch, folder_path, chapter_id, results)
         
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            futures = {executor.submit(download_and_upload, (idx, img)): idx for idx, img in enumerate(imgs)}
-            for future in as_completed(futures):
-                result = future.result()
-                if result:
-                    idx, url = result
-                    urls[idx] = url
-                    completed += 1
-                    print(f"  ☁️ [{completed}/{len(imgs)}] Downloaded + Uploaded")
-        
-        # Lọc bỏ None
-        urls = [url for url in urls if url]
-        print(f"✅ Hoàn thành {len(urls)}/{len(imgs)} ảnh")
-        
-        return urls
+        # Ảnh lỗi giữ trạng thái failed để repair sau
+        pages = self._build_pages(sources, results)
+        print(f"✅ Hoàn thành {completed}/{len(imgs)} ảnh")
+        
+        return pages
 
     def download_chapter_images(self, manga_id, chapter_id, chapter_url=None):
         """Tải và upload ảnh chapter lên ImageKit - LƯU URLs VÀO MONGODB"""
@@ -759,61 +951,98 @@ class MangaCrawler:
             chapter_url = f"{self.base_url}/truyen-tranh/{manga_id}/{chapter_id}"
         
         # Kiểm tra đã có trên cloud chưa
-        existing_urls = db.get_chapter_images(manga_id, chapter_id)
+        state = db.get_chapter_state(manga_id, chapter_id)
+        if state and state.get("complete") is False:
+            # Lượt trước còn ảnh lỗi → chỉ tải lại các ảnh đó
+            return self.repair_chapter(manga_id, chapter_id, state.get("pages"))
+        existing_urls = state.get("images", []) if state else []
         if existing_urls:
             print(f"⏭️ Chapter {chapter_id} đã có trên cloud ({len(existing_urls)} ảnh)")
             return existing_urls
         
         print(f"📥 Đang tải và upload chapter: {chapter_id}")
         
-        # Ưu tiên sử dụng FlareSolverr để bypass Cloudflare (cho production)
-        if self.use_flaresolverr:
-            urls = self._download_chapter_via_flaresolverr(manga_id, chapter_id, chapter_url)
-            if urls:
-                db.save_chapter_images(manga_id, chapter_id, urls)
-                print(f"☁️ Đã lưu {len(urls)} URLs vào MongoDB (via FlareSolverr)")
-                return urls
-            else:
-                print("⚠️ FlareSolverr thất bại, thử CloudScraper...")
+        # Thứ tự thử do backend router quyết định (mặc định: FlareSolverr > CloudScraper > Playwright)
+        backend, pages = self._run_backends("chapter", [
+            ("flaresolverr", self.use_flaresolverr, lambda: self._download_chapter_via_flaresolverr(manga_id, chapter_id, chapter_url)),
+            ("cloudscraper", self.use_cloudscraper, lambda: self._download_chapter_via_cloudscraper(manga_id, chapter_id, chapter_url)),
+            ("playwright", self.use_playwright, lambda: self._download_chapter_via_playwright(manga_id, chapter_id, chapter_url)),
+        ], is_ok=self._has_done_page)
+        if backend:
+            db.save_chapter_pages(manga_id, chapter_id, pages)
+            done = [page for page in pages if page["status"] == "done"]
+            print(f"☁️ Đã lưu {len(done)}/{len(pages)} trang vào MongoDB (via {backend})")
+            image_dedup.report(f"manga/{manga_id}/{chapter_id}")
+            if len(done) < len(pages):
+                return self.repair_chapter(manga_id, chapter_id, pages)
+            return [url for page in done for url in page_urls(page)]
         
-        # 2. CloudScraper (cho Vercel)
-        if self.use_cloudscraper:
-            urls = self._download_chapter_via_cloudscraper(manga_id, chapter_id, chapter_url)
-            if urls:
-                db.save_chapter_images(manga_id, chapter_id, urls)
-                print(f"☁️ Đã lưu {len(urls)} URLs vào MongoDB (via CloudScraper)")
-                return urls
-            else:
-                print("⚠️ CloudScraper thất bại, thử Playwright...")
+        print("❌ Không có phương thức nào khả dụng!")
+        return []
+    
+    def repair_chapter(self, manga_id, chapter_id, pages=None):
+        """
+        Tải lại CHỈ các ảnh lỗi của chapter (không chạy lại cả chapter)
+        Lượt đầu chạy ngay; trước mỗi lượt sau chờ backoff = CHAPTER_REPAIR_BACKOFF * 2^(số lần đã thử - 1),
+        tối đa CHAPTER_REPAIR_BACKOFF_MAX. Chapter chỉ complete khi mọi ảnh đều xong.
+        
+        Returns:
+            List URL các ảnh đã xong theo thứ tự trang
+        """
+        if pages is None:
+            pages = (db.get_chapter_state(manga_id, chapter_id) or {}).get("pages") or []
+        pages = sorted((dict(page) for page in pages), key=lambda page: page["index"])
+        folder_path = f"manga/{manga_id}/{chapter_id}"
+        session = self._probe_session() or self.session
         
-        # 3. Fallback: Sử dụng Playwright (hoạt động tốt trên local)
-        if self.use_playwright:
+        def refetch(page):
             try:
-                urls = self._download_chapter_via_playwright(manga_id, chapter_id, chapter_url)
-                if urls:
-                    db.save_chapter_images(manga_id, chapter_id, urls)
-                    print(f"☁️ Đã lưu {len(urls)} URLs vào MongoDB")
-                return urls
+                response = rate_limiter.request("GET", page["source_url"], session=session, slot=image_slots,
+                                                headers={"Referer": self.base_url + "/"}, timeout=30)
+                if response.status_code == 200 and len(response.content) > 1000:
+                    return image_storage.upload_page(response.content, folder_path, page["index"])
             except Exception as e:
-                print(f"❌ Lỗi Playwright: {e}")
+                print(f"  ❌ Ảnh {page['index']} lỗi: {e}")
+            return None
         
-        print("❌ Không có phương thức nào khả dụng!")
-        return []
-    
+        for round_no in range(self.repair_rounds):
+            failed = [page for page in pages if page["status"] != "done"]
+            if not failed:
+                break
+            if round_no:
+                attempts = min(page.get("attempts", 1) for page in failed)
+                delay = min(self.repair_backoff_max, self.repair_backoff * 2 ** max(0, attempts - 1))
+                print(f"🩹 Repair {chapter_id}: {len(failed)} ảnh lỗi, thử lại sau {delay:.0f}s ({round_no + 1}/{self.repair_rounds})")
+                time.sleep(delay)
+            else:
+                print(f"🩹 Repair {chapter_id}: {len(failed)} ảnh lỗi ({round_no + 1}/{self.repair_rounds})")
+            
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                for page, uploaded in zip(failed, executor.map(refetch, failed)):
+                    page["attempts"] = page.get("attempts", 1) + 1
+                    if uploaded:
+                        page.update(uploaded, status="done")
+            db.save_chapter_pages(manga_id, chapter_id, pages)
+        image_dedup.report(folder_path)
+        
+        done = [page for page in pages if page["status"] == "done"]
+        if len(done) == len(pages):
+            print(f"✅ Chapter {chapter_id} đủ {len(done)} ảnh")
+        else:
+            print(f"⚠️ Chapter {chapter_id} còn {len(pages) - len(done)}/{len(pages)} ảnh lỗi, sẽ repair ở lần tải sau")
+        return [url for page in done for url in page_urls(page)]
+
     def _download_chapter_via_cloudscraper(self, manga_id, chapter_id, chapter_url):
         """Download chapter sử dụng CloudScraper (cho Vercel - không cần browser)"""
         print(f"🌐 Đang download chapter qua CloudScraper...")
         
-        result = cloudscraper_client.get_page(chapter_url)
+        result = self._get_page_via_cloudscraper(chapter_url)
         if not result or not result.get("html"):
             print("❌ CloudScraper không thể lấy được trang")
             return []
         
-        html = result["html"]
-        soup = BeautifulSoup(html, "lxml")
-        
         # Tìm tất cả ảnh chapter
-        imgs = soup.select(".reading-detail img, .page-chapter img, .reading img")
+        imgs = html_parser.chapter_images(result["html"])
         
         if not imgs:
             print(f"⚠️ Không tìm thấy ảnh trong chapter")
@@ -823,66 +1052,68 @@ class MangaCrawler:
         
         folder_path = f"manga/{manga_id}/{chapter_id}"
         
-        # Download và Upload song song
-        def download_and_upload(item):
-            idx, img = item
-            src = img.get("data-original") or img.get("data-src") or img.get("src")
-            if not src:
-                return None
-            if "http" not in src:
-                if src.startswith("//"):
-                    src = "https:" + src
-                else:
-                    return None
-            try:
-                # Download via CloudScraper
-                image_bytes = cloudscraper_client.get_image(src, referer=self.base_url)
-                if image_bytes:
-                    # Upload ngay sau khi download xong
-                    filename = f"{idx:03d}.jpg"
-                    url = image_storage.upload_from_bytes(image_bytes, folder_path, filename)
-                    if url:
-                        return (idx, url)
-            except Exception as e:
-                print(f"  ❌ Ảnh {idx} lỗi: {e}")
-            return None
-        
-        # Chạy song song: download + upload cùng lúc
-        urls = [None] * len(imgs)
-        completed = 0
-        
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            futures = {executor.submit(download_and_upload, (idx, img)): idx for idx, img in enumerate(imgs)}
-            for future in as_completed(futures):
-                result = future.result()
-                if result:
-                    idx, url = result
-                    urls[idx] = url
-                    completed += 1
-                    print(f"  ☁️ [{completed}/{len(imgs)}] Downloaded + Uploaded")
-        
-        # Lọc bỏ None
-        urls = [url for url in urls if url]
-        print(f"✅ Hoàn thành {len(urls)}/{len(imgs)} ảnh (via CloudScraper)")
-        
-        return urls
+        sources = self._extract_image_sources(imgs)
+        results, local_sources = self._ingest_remote(sources, folder_path, len(imgs))
+        
+        if self.image_mode == "async":
+            headers = {"User-Agent": cloudscraper_client.scraper.headers.get("User-Agent", ""), "Referer": self.base_url}
+            downloaded = self._download_chapter_async(
+                local_sources, folder_path,
+                headers=headers,
+                cookies=cloudscraper_client.get_session_cookies()
+            )
+            for idx, uploaded in enumerate(downloaded):
+                results[idx] = results[idx] or uploaded
+            pages = self._build_pages(sources, results)
+            print(f"✅ Hoàn thành {sum(1 for r in results if r)}/{len(imgs)} ảnh (async via CloudScraper)")
+            return pages
+        
+        def fetch(src):
+            # Download via CloudScraper, giới hạn tổng số ảnh đang tải trên toàn process
+            return cloudscraper_client.get_image(src, referer=self.base_url, slot=image_slots)
+        
+        # Stage download và stage upload chạy song song với số thread riêng (ảnh đã ingest từ xa bỏ qua)
+        completed = self._download_staged(local_sources, fetch, folder_path, chapter_id, results)
+        
+        # Ảnh lỗi giữ trạng thái failed để repair sau
+        pages = self._build_pages(sources, results)
+        print(f"✅ Hoàn thành {completed}/{len(imgs)} ảnh (via CloudScraper)")
+        
+        return pages
 
     def _download_chapter_via_playwright(self, manga_id, chapter_id, chapter_url):
         """Download chapter sử dụng Playwright (fallback khi không có FlareSolverr)"""
-        from playwright.sync_api import sync_playwright
-        
         print("🎭 Đang sử dụng Playwright (fallback)...")
         
-        with sync_playwright() as p:
-            context = self._get_browser_context(p)
-            page = context.new_page()
-            
+        folder_path = f"manga/{manga_id}/{chapter_id}"
+        
+        # Upload chạy song song với browser: bytes ảnh đi qua queue có giới hạn + budget chung
+        pipeline = UploadPipeline(folder_path, label=chapter_id)
+        
+        def collect(page):
             # Additional anti-detection measures
             page.add_init_script("""
                 Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
                 window.chrome = {runtime: {}};
             """)
             
+            # Giữ lại response ảnh browser đã tải (chỉ giữ object, body lấy sau khi khớp src)
+            captured = {}
+            
+            def on_response(response):
+                try:
+                    if response.request.resource_type == "image" and response.status == 200:
+                        captured[response.url] = response
+                        redirected = response.request.redirected_from
+                        while redirected:
+                            captured.setdefault(redirected.url, response)
+                            redirected = redirected.redirected_from
+                except Exception:
+                    pass
+            
+            if self.playwright_capture:
+                page.on("response", on_response)
+            
             page.goto(chapter_url, wait_until="domcontentloaded", timeout=60000)
             
             # BYPASS LOGIC 2.0
@@ -893,7 +1124,6 @@ class MangaCrawler:
                 
                 if "Just a moment" in page_title or "Attention Required" in page_title or "Cloudflare" in page_title:
                     print("  🛡️ Detect Cloudflare! Waiting for redirect...")
-                    page.wait_for_timeout(5000)
                     
                     try:
                          frames = page.frames
@@ -903,33 +1133,33 @@ class MangaCrawler:
                                  frame.click("body", timeout=2000)
                     except: pass
                     
-                    page.wait_for_timeout(5000)
+                    # Chờ tới khi challenge chuyển trang (thay vì sleep cố định)
+                    try:
+                        page.wait_for_function(CHALLENGE_DONE_JS, timeout=10000)
+                    except:
+                        pass
                 else:
                     break
             
-            # Cuộn trang để load lazy images
+            # Cuộn trang để load lazy images (dừng ngay khi tất cả ảnh đã tải xong)
             print("📜 Đang kích hoạt lazy loading...")
-            for i in range(10):
-                page.mouse.wheel(0, 1000)
-                page.wait_for_timeout(800)
-            
-            page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-            page.wait_for_timeout(2000)
-            
             try:
                 page.wait_for_selector(".reading-detail img, .page-chapter img", timeout=5000)
             except:
                 print("  ⚠️ Timeout chờ ảnh...")
+            
+            state = wait_for_lazy_images(page, ".reading-detail img, .page-chapter img, .reading img")
+            if state["pending"]:
+                print(f"  ⚠️ Hết thời gian chờ: còn {state['pending']}/{state['total']} ảnh chưa tải")
 
             # Lấy tất cả ảnh
             imgs = page.query_selector_all(".reading-detail img, .page-chapter img, .reading img, #image-0")
             
-            folder_path = f"manga/{manga_id}/{chapter_id}"
-            
             print(f"☁️ Tìm thấy {len(imgs)} ảnh. Download + Upload song song...")
             
-            # Thu thập tất cả src trước
+            # Thu thập tất cả src trước (kèm currentSrc = URL browser thực sự đã tải)
             img_sources = []
+            current_srcs = {}
             for idx, img in enumerate(imgs):
                 src = img.get_attribute("data-original") or img.get_attribute("data-src") or img.get_attribute("src")
                 if src:
@@ -939,44 +1169,53 @@ class MangaCrawler:
                         else:
                             continue
                     img_sources.append((idx, src))
+                    if captured:
+                        current_srcs[idx] = img.evaluate("el => el.currentSrc")
             
-            # Tải ảnh qua Playwright và lưu vào dict
-            downloaded = {}
+            # Lấy bytes từ các response ảnh browser đã nhận, theo thứ tự trang
+            # (đưa thẳng vào pipeline, không giữ lại bytes trong hàm)
+            fetched = set()
             for idx, src in img_sources:
+                response = captured.get(src) or captured.get(current_srcs.get(idx))
+                if not response:
+                    continue
                 try:
+                    body = response.body()
+                    if len(body) > 1000:
+                        pipeline.put(idx, body)
+                        fetched.add(idx)
+                except Exception:
+                    pass
+            if captured:
+                print(f"  🕸️ Lấy được {len(fetched)}/{len(img_sources)} ảnh từ network của browser")
+                captured.clear()
+            
+            # Tải lại các ảnh còn thiếu qua Playwright
+            for idx, src in img_sources:
+                if idx in fetched:
+                    continue
+                try:
+                    rate_limiter.acquire(src)
                     response = page.request.get(src, headers={"referer": self.base_url + "/"})
+                    rate_limiter.feedback(src, response.status, response.headers.get("retry-after"))
                     if response.status == 200:
-                        downloaded[idx] = response.body()
-                        print(f"  📥 Downloaded {len(downloaded)}/{len(img_sources)}")
+                        pipeline.put(idx, response.body())
+                        fetched.add(idx)
+                        print(f"  📥 Downloaded {len(fetched)}/{len(img_sources)}")
                 except Exception as e:
                     print(f"  ❌ Lỗi download {idx}: {e}")
             
-            context.close()
+            return img_sources
         
-        # Upload song song sau khi đóng browser
-        if downloaded:
-            print(f"☁️ Upload {len(downloaded)} ảnh song song...")
-            
-            def upload_one(item):
-                idx, data = item
-                filename = f"{idx:03d}.jpg"
-                return idx, image_storage.upload_from_bytes(data, folder_path, filename)
-            
-            urls = [None] * (max(downloaded.keys()) + 1)
-            with ThreadPoolExecutor(max_workers=8) as executor:
-                futures = {executor.submit(upload_one, item): item[0] for item in downloaded.items()}
-                for future in as_completed(futures):
-                    try:
-                        idx, url = future.result()
-                        if url:
-                            urls[idx] = url
-                            print(f"  ☁️ Uploaded {sum(1 for u in urls if u)}/{len(downloaded)}")
-                    except Exception as e:
-                        print(f"  ❌ Upload error: {e}")
-            
-            return [url for url in urls if url]
+        try:
+            img_sources = browser_pool.run(collect)
+        finally:
+            # Chờ upload nốt các ảnh trong queue (kể cả khi browser lỗi giữa chừng)
+            results = pipeline.close()
         
-        return []
+        if not results:
+            return []
+        return self._build_pages(img_sources, [results.get(idx) for idx in range(max(results) + 1)])
 
     def get_manga_list(self):
         """Lấy danh sách manga từ MongoDB"""
@@ -1005,6 +1244,30 @@ class MangaCrawler:
     def get_downloaded_chapters(self, manga_id):
         """Lấy danh sách chapter IDs đã tải"""
         return db.get_downloaded_chapters(manga_id)
+    
+    def get_reader_pages(self, manga_id, chapter_id):
+        """Các trang cho reader: mỗi trang là list phần ảnh {url, width, height} (nhiều tile nếu strip bị cắt)"""
+        state = db.get_chapter_state(manga_id, chapter_id) or {}
+        if not state.get("pages"):
+            return [[{"url": url}] for url in state.get("images", [])]
+        return [
+            page.get("tiles") or [{"url": page["url"], "width": page.get("width"), "height": page.get("height")}]
+            for page in state["pages"] if page["status"] == "done"
+        ]
+    
+    def get_chapter_version(self, manga_id, chapter_id):
+        """
+        Version ảnh của chapter cho URL /cdn: đổi mỗi khi chapter được ghi lại
+        (tải lại / repair ghi đè cùng path trên ImageKit nên URL ảnh không đổi)
+        """
+        updated_at = db.get_chapter_updated_at(manga_id, chapter_id)
+        if not updated_at:
+            return "0"
+        return str(int(updated_at.replace(tzinfo=timezone.utc).timestamp() * 1000))
+    
+    def get_incomplete_chapters(self, manga_id):
+        """Lấy danh sách chapter IDs còn ảnh lỗi"""
+        return db.get_incomplete_chapters(manga_id)
 
 
 # CLI Interface
@@ -0,0 +1,298 @@
+"""
+HTML Parsers - Tách dữ liệu trang chủ / trang truyện / trang chapter NetTruyen
+Các backend cho cùng kết quả (dict/list thuần), chọn bằng HTML_PARSER:
+- soup: BeautifulSoup + CSS select (cách cũ, dùng làm chuẩn so sánh)
+- lxml: lxml.html + XPath trực tiếp (mặc định, nhanh hơn và ít cấp phát hơn)
+- selectolax: backend lexbor, nếu có cài (tùy chọn, nhanh nhất)
+
+Kiểm tra kết quả giống nhau: python -m pytest tests (trang lưu trong tests/fixtures/html)
+Tốc độ: python -m benchmarks.bench_parsers
+"""
+
+import os
+
+from bs4 import BeautifulSoup
+
+# lxml là parser của BeautifulSoup nên luôn có; selectolax là tùy chọn
+try:
+    import lxml.etree
+    import lxml.html
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxHTMLParser
+    HAS_SELECTOLAX = True
+except ImportError:
+    HAS_SELECTOLAX = False
+
+CHAPTER_IMAGE_SELECTOR = ".reading-detail img, .page-chapter img, .reading img"
+
+
+def _image_src(get):
+    """data-original > data-src > src (giống logic cũ, chuỗi rỗng coi như không có)"""
+    return get("data-original") or get("data-src") or get("src")
+
+
+# ==================== BEAUTIFULSOUP ====================
+
+class SoupParser:
+    name = "soup"
+
+    def parse_home(self, html):
+        """List truyện trên trang chủ: id, title, url, thumbnail_original, latest_chapter"""
+        soup = BeautifulSoup(html, "lxml")
+        items = []
+        for item in soup.select(".item"):
+            title_el = item.select_one("h3 a")
+            if not title_el:
+                continue
+            img_el = item.select_one("img")
+            chapter_el = item.select_one(".comic-item .chapter a") or item.select_one(".chapter a")
+            href = title_el.get('href', '')
+            items.append({
+                "id": href.split('/')[-1] if href else '',
+                "title": title_el.get_text(strip=True),
+                "url": href,
+                "thumbnail_original": (_image_src(img_el.get) or '') if img_el else '',
+                "latest_chapter": chapter_el.get_text(strip=True) if chapter_el else ''
+            })
+        return items
+
+    def parse_story(self, html):
+        """Thông tin truyện + các dòng chapter đang hiển thị [(href, text)]"""
+        soup = BeautifulSoup(html, "lxml")
+
+        def text(selector):
+            el = soup.select_one(selector)
+            return el.get_text(strip=True) if el else ""
+
+        thumb_el = soup.select_one(".col-image img")
+        chapter_links = []
+        for row in soup.select("#nt_listchapter ul li.row:not(.heading)"):
+            link = row.select_one("a")
+            if link:
+                chapter_links.append((link.get('href', ''), link.get_text(strip=True)))
+
+        return {
+            "title": text("h1.title-detail"),
+            "description": text(".detail-content p"),
+            "thumbnail_original": (thumb_el.get('data-original') or thumb_el.get('data-src') or thumb_el.get('src', '')) if thumb_el else "",
+            "genres": [g.get_text(strip=True) for g in soup.select(".kind.row .col-xs-8 a")],
+            "author": text(".author.row .col-xs-8"),
+            "status": text(".status.row .col-xs-8"),
+            "chapter_links": chapter_links
+        }
+
+    def chapter_images(self, html):
+        """src thô của từng thẻ img chapter theo thứ tự trang (None nếu không có)"""
+        soup = BeautifulSoup(html, "lxml")
+        return [_image_src(img.get) for img in soup.select(CHAPTER_IMAGE_SELECTOR)]
+
+
+# ==================== LXML (XPATH) ====================
+
+def _cls(name):
+    """XPath tương đương CSS .name"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# CSS "A B" khớp B có tổ tiên A ở bất kỳ đâu (kể cả ngoài phần tử đang select),
+# nên dùng ancestor:: thay vì đường dẫn từ context để giữ đúng ngữ nghĩa của soupsieve
+_XPATH = {
+    "home_items": f"//*[{_cls('item')}]",
+    "home_title": ".//a[ancestor::h3]",
+    "home_img": ".//img",
+    "home_chapter": f".//a[ancestor::*[{_cls('chapter')}][ancestor::*[{_cls('comic-item')}]]]",
+    "home_chapter_fallback": f".//a[ancestor::*[{_cls('chapter')}]]",
+    "story_title": f"//h1[{_cls('title-detail')}]",
+    "story_description": f"//p[ancestor::*[{_cls('detail-content')}]]",
+    "story_thumbnail": f"//img[ancestor::*[{_cls('col-image')}]]",
+    "story_genres": f"//a[ancestor::*[{_cls('col-xs-8')}][ancestor::*[{_cls('kind')} and {_cls('row')}]]]",
+    "story_author": f"//*[{_cls('col-xs-8')}][ancestor::*[{_cls('author')} and {_cls('row')}]]",
+    "story_status": f"//*[{_cls('col-xs-8')}][ancestor::*[{_cls('status')} and {_cls('row')}]]",
+    "story_rows": f"//li[{_cls('row')} and not({_cls('heading')})][ancestor::ul[ancestor::*[@id='nt_listchapter']]]",
+    "chapter_images": (
+        f"//img[ancestor::*[{_cls('reading-detail')}] or ancestor::*[{_cls('page-chapter')}]"
+        f" or ancestor::*[{_cls('reading')}]]"
+    ),
+}
+
+# Giống get_text(strip=True) của BeautifulSoup: bỏ comment và text trong script/style/template/rt/rp
+_TEXT_XPATH = (
+    "descendant-or-self::text()[not(ancestor::script or ancestor::style or ancestor::template"
+    " or ancestor::rt or ancestor::rp)]"
+)
+
+
+class LxmlParser:
+    name = "lxml"
+
+    def __init__(self):
+        self._xpath = {key: lxml.etree.XPath(expr) for key, expr in _XPATH.items()}
+        self._text = lxml.etree.XPath(_TEXT_XPATH)
+
+    def _document(self, html):
+        try:
+            try:
+                return lxml.html.document_fromstring(html)
+            except ValueError:
+                # Chuỗi unicode có khai báo encoding (<?xml ... encoding=...?>) → đưa bytes
+                return lxml.html.document_fromstring(html.encode("utf-8"))
+        except lxml.etree.ParserError:
+            # HTML rỗng → coi như trang không có gì (BeautifulSoup cũng trả về rỗng)
+            return lxml.html.document_fromstring("<html></html>")
+
+    def _get_text(self, el):
+        return "".join(s.strip() for s in self._text(el))
+
+    def _first(self, key, el):
+        found = self._xpath[key](el)
+        return found[0] if found else None
+
+    def parse_home(self, html):
+        doc = self._document(html)
+        items = []
+        for item in self._xpath["home_items"](doc):
+            title_el = self._first("home_title", item)
+            if title_el is None:
+                continue
+            img_el = self._first("home_img", item)
+            chapter_el = self._first("home_chapter", item)
+            if chapter_el is None:
+                chapter_el = self._first("home_chapter_fallback", item)
+            href = title_el.get('href', '')
+            items.append({
+                "id": href.split('/')[-1] if href else '',
+                "title": self._get_text(title_el),
+                "url": href,
+                "thumbnail_original": (_image_src(img_el.get) or '') if img_el is not None else '',
+                "latest_chapter": self._get_text(chapter_el) if chapter_el is not None else ''
+            })
+        return items
+
+    def parse_story(self, html):
+        doc = self._document(html)
+
+        def text(key):
+            el = self._first(key, doc)
+            return self._get_text(el) if el is not None else ""
+
+        thumb_el = self._first("story_thumbnail", doc)
+        chapter_links = []
+        for row in self._xpath["story_rows"](doc):
+            links = row.xpath(".//a")
+            if links:
+                chapter_links.append((links[0].get('href', ''), self._get_text(links[0])))
+
+        return {
+            "title": text("story_title"),
+            "description": text("story_description"),
+            "thumbnail_original": (thumb_el.get('data-original') or thumb_el.get('data-src') or thumb_el.get('src', '')) if thumb_el is not None else "",
+            "genres": [self._get_text(g) for g in self._xpath["story_genres"](doc)],
+            "author": text("story_author"),
+            "status": text("story_status"),
+            "chapter_links": chapter_links
+        }
+
+    def chapter_images(self, html):
+        doc = self._document(html)
+        return [_image_src(img.get) for img in self._xpath["chapter_images"](doc)]
+
+
+# ==================== SELECTOLAX (TÙY CHỌN) ====================
+
+class SelectolaxParser:
+    name = "selectolax"
+
+    def _tree(self, html):
+        tree = SelectolaxHTMLParser(html)
+        # get_text của BeautifulSoup không lấy text trong các thẻ này
+        tree.strip_tags(["script", "style", "template", "rt", "rp"])
+        return tree
+
+    def _get_text(self, node):
+        return node.text(deep=True, separator="", strip=True)
+
+    def _get(self, node):
+        attrs = node.attributes
+        return lambda key, default=None: attrs.get(key, default)
+
+    def parse_home(self, html):
+        tree = self._tree(html)
+        items = []
+        for item in tree.css(".item"):
+            title_el = item.css_first("h3 a")
+            if title_el is None:
+                continue
+            img_el = item.css_first("img")
+            chapter_el = item.css_first(".comic-item .chapter a") or item.css_first(".chapter a")
+            href = title_el.attributes.get('href') or ''
+            items.append({
+                "id": href.split('/')[-1] if href else '',
+                "title": self._get_text(title_el),
+                "url": href,
+                "thumbnail_original": (_image_src(self._get(img_el)) or '') if img_el is not None else '',
+                "latest_chapter": self._get_text(chapter_el) if chapter_el is not None else ''
+            })
+        return items
+
+    def parse_story(self, html):
+        tree = self._tree(html)
+
+        def text(selector):
+            node = tree.css_first(selector)
+            return self._get_text(node) if node is not None else ""
+
+        thumb_el = tree.css_first(".col-image img")
+        chapter_links = []
+        for row in tree.css("#nt_listchapter ul li.row:not(.heading)"):
+            link = row.css_first("a")
+            if link is not None:
+                chapter_links.append((link.attributes.get('href') or '', self._get_text(link)))
+
+        thumbnail = ""
+        if thumb_el is not None:
+            get = self._get(thumb_el)
+            thumbnail = get('data-original') or get('data-src') or get('src', '') or ''
+
+        return {
+            "title": text("h1.title-detail"),
+            "description": text(".detail-content p"),
+            "thumbnail_original": thumbnail,
+            "genres": [self._get_text(g) for g in tree.css(".kind.row .col-xs-8 a")],
+            "author": text(".author.row .col-xs-8"),
+            "status": text(".status.row .col-xs-8"),
+            "chapter_links": chapter_links
+        }
+
+    def chapter_images(self, html):
+        tree = SelectolaxHTMLParser(html)
+        # css() với selector có dấu phẩy trả về theo từng selector (có trùng), nên lọc theo thứ tự trang
+        return [_image_src(self._get(img)) for img in tree.css("img") if img.css_matches(CHAPTER_IMAGE_SELECTOR)]
+
+
+PARSERS = {"soup": SoupParser, "lxml": LxmlParser, "selectolax": SelectolaxParser}
+
+
+def available_parsers():
+    names = ["soup"]
+    if HAS_LXML:
+        names.append("lxml")
+    if HAS_SELECTOLAX:
+        names.append("selectolax")
+    return names
+
+
+def get_parser(name=None):
+    """Parser theo tên (hoặc env HTML_PARSER), fallback về soup nếu backend chưa cài"""
+    name = (name or os.getenv("HTML_PARSER", "lxml")).lower()
+    if name not in available_parsers():
+        print(f"⚠️ HTML_PARSER={name} không khả dụng, dùng BeautifulSoup")
+        name = "soup"
+    return PARSERS[name]()
+
+
+# Singleton instance
+html_parser = get_parser()
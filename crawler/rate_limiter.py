@@ -0,0 +1,186 @@
+"""
+Rate Limiter - Token bucket theo host, dùng chung cho mọi thread/event loop
+Mọi request HTTP đi ra (CDN ảnh nguồn, trang NetTruyen, ImageKit) lấy token
+của host trước khi gửi. Gặp 429/503 (hoặc Retry-After) thì giảm tốc độ
+một nửa và tạm dừng host đó; request thành công thì tăng dần trở lại (AIMD).
+"""
+
+import os
+import time
+import asyncio
+import threading
+from urllib.parse import urlparse
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+
+import requests
+
+DEFAULT_RATE = float(os.getenv("RATE_LIMIT_DEFAULT", "8"))      # request/giây mỗi host lúc bắt đầu
+MAX_RATE = float(os.getenv("RATE_LIMIT_MAX", "32"))             # trần khi tăng dần
+MIN_RATE = 0.5
+INCREASE_STEP = 0.5                                             # tăng ~0.5 req/s sau mỗi giây không bị chặn
+DECREASE_FACTOR = 0.5                                           # nhân khi gặp 429/503
+MAX_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", "2"))         # số lần thử lại khi bị giới hạn
+MAX_PAUSE = 120                                                 # giây, chặn Retry-After quá lớn
+
+
+def _parse_host_rates(value):
+    """RATE_LIMIT_HOSTS="upload.imagekit.io=10,img.example.com=4" → {host: rate}"""
+    rates = {}
+    for part in value.split(","):
+        if "=" in part:
+            host, rate = part.split("=", 1)
+            try:
+                rates[host.strip()] = float(rate)
+            except ValueError:
+                print(f"⚠️ RATE_LIMIT_HOSTS không hợp lệ: {part}")
+    return rates
+
+
+HOST_RATES = _parse_host_rates(os.getenv("RATE_LIMIT_HOSTS", ""))
+
+
+def _retry_after_seconds(value):
+    """Retry-After có thể là số giây hoặc HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _HostBucket:
+    def __init__(self, rate):
+        self.rate = rate
+        self.max_rate = max(rate, MAX_RATE)
+        self.burst = max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.last_throttled = None
+
+    def reserve(self, now):
+        """Lấy 1 token (có thể âm = đặt chỗ trước), trả về số giây phải chờ"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        self.requests += 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+
+class RateLimiter:
+    def __init__(self, default_rate=None, host_rates=None):
+        self.default_rate = default_rate or DEFAULT_RATE
+        self.host_rates = host_rates if host_rates is not None else HOST_RATES
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host):
+        if host not in self._buckets:
+            self._buckets[host] = _HostBucket(self.host_rates.get(host, self.default_rate))
+        return self._buckets[host]
+
+    def _reserve(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            return self._bucket(host).reserve(time.monotonic())
+
+    def acquire(self, url):
+        """Chờ tới lượt gửi request tới host của url (blocking, dùng trong thread)"""
+        wait = self._reserve(url)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, url):
+        """Như acquire() nhưng không chặn event loop"""
+        wait = self._reserve(url)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def feedback(self, url, status, retry_after=None):
+        """
+        Cập nhật tốc độ của host theo response
+
+        Args:
+            url: URL vừa request
+            status: HTTP status code
+            retry_after: Giá trị header Retry-After (nếu có)
+
+        Returns:
+            True nếu host đang bị giới hạn (429, hoặc 503 kèm Retry-After)
+        """
+        host = urlparse(url).netloc
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(host)
+            # 503 không có Retry-After thường là challenge Cloudflare, không phải quá tải
+            if status == 429 or (status == 503 and retry_after):
+                bucket.rate = max(MIN_RATE, bucket.rate * DECREASE_FACTOR)
+                bucket.burst = max(1.0, bucket.rate)
+                bucket.tokens = min(bucket.tokens, 0.0)
+                pause = _retry_after_seconds(retry_after)
+                if pause is None:
+                    pause = 1 / bucket.rate
+                bucket.paused_until = max(bucket.paused_until, now + min(pause, MAX_PAUSE))
+                bucket.throttled += 1
+                bucket.last_throttled = time.time()
+                print(f"🐢 {host} trả về {status}, giảm còn {bucket.rate:.1f} req/s, nghỉ {min(pause, MAX_PAUSE):.1f}s")
+                return True
+            if status < 400 and bucket.rate < bucket.max_rate:
+                bucket.rate = min(bucket.max_rate, bucket.rate + INCREASE_STEP / max(1.0, bucket.rate))
+                bucket.burst = max(1.0, bucket.rate)
+            return False
+
+    def request(self, method, url, session=None, slot=None, **kwargs):
+        """
+        Gửi request qua rate limiter (thay cho requests.get/post/session.get)
+
+        Args:
+            method: "GET", "POST", ...
+            url: URL đích
+            session: requests.Session / cloudscraper (mặc định dùng module requests)
+            slot: Semaphore chỉ giữ trong lúc gửi request (không giữ khi chờ lượt / Retry-After)
+
+        Returns:
+            requests.Response của lần thử cuối
+        """
+        client = session or requests
+        for attempt in range(MAX_RETRIES + 1):
+            self.acquire(url)
+            with slot or nullcontext():
+                response = client.request(method, url, **kwargs)
+            retry_after = response.headers.get("Retry-After")
+            if not self.feedback(url, response.status_code, retry_after):
+                return response
+            if attempt < MAX_RETRIES:
+                print(f"🔁 Thử lại {url[:60]} ({attempt + 1}/{MAX_RETRIES})")
+        return response
+
+    def snapshot(self):
+        """Tốc độ hiện tại của từng host (cho admin)"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                host: {
+                    "rate": round(b.rate, 2),
+                    "max_rate": b.max_rate,
+                    "tokens": round(min(b.burst, b.tokens + (now - b.updated) * b.rate), 2),
+                    "paused_for": round(max(0.0, b.paused_until - now), 1),
+                    "requests": b.requests,
+                    "throttled": b.throttled,
+                    "last_throttled": b.last_throttled
+                }
+                for host, b in self._buckets.items()
+            }
+
+
+# Singleton instance
+rate_limiter = RateLimiter()
@@ -0,0 +1,191 @@
+"""
+Remote Ingest - Gửi URL ảnh nguồn cho ImageKit tự fetch (upload_from_url)
+Mặc định mỗi ảnh chapter được tải về worker rồi upload lại: mọi byte đi qua mạng
+của mình 2 lần. Khi IMAGE_INGEST_MODE=remote, ảnh của host ảnh không chặn
+hotlink được gửi thẳng URL cho ImageKit (song song, giới hạn
+REMOTE_INGEST_CONCURRENCY); host cần cookie / Referer của mình thì tự tải như cũ.
+
+Mỗi host được thử 1 lần: GET ảnh đầu tiên KHÔNG cookie, KHÔNG Referer (giống
+ImageKit fetch). Quyết định "remote" / "download" lưu trong RAM + MongoDB
+(collection ingest_hosts) REMOTE_INGEST_TTL giây; host remote mà ImageKit fetch
+lỗi nhiều thì chuyển sang "download".
+
+Ảnh ingest từ xa không qua dedup / transcode / cắt tile (worker không có bytes).
+"""
+
+import os
+import sys
+import time
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from database import db
+from imagekit_storage import image_storage
+from crawler.rate_limiter import rate_limiter
+from crawler.transcoder import sniff_format
+
+MODE = os.getenv("IMAGE_INGEST_MODE", "download").lower()            # download / remote
+CONCURRENCY = int(os.getenv("REMOTE_INGEST_CONCURRENCY", "16"))
+DECISION_TTL = int(os.getenv("REMOTE_INGEST_TTL", "86400"))          # giây giữ quyết định của 1 host
+RETRY_TTL = 300                                                      # probe lỗi mạng → thử lại sau 5 phút
+FAILURE_RATIO = 0.5                                                  # ImageKit fetch lỗi ≥ 50% ảnh → "download"
+
+# UA trình duyệt thường, không cookie / Referer
+PROBE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36",
+    "Accept": "image/webp,image/apng,image/*,*/*;q=0.8"
+}
+
+
+def _new_counters():
+    return {"remote": 0, "remote_failed": 0, "downloaded": 0}
+
+
+class RemoteIngest:
+    def __init__(self, mode=None, concurrency=None, ttl=None):
+        self.mode = (mode or MODE).lower()
+        self.concurrency = concurrency or CONCURRENCY
+        self.ttl = ttl or DECISION_TTL
+        self.totals = _new_counters()
+        self._hosts = {}      # host → {"mode", "reason", "expires_at"}
+        self._counters = {}   # host → counters
+        self._lock = threading.Lock()
+
+        if self.mode not in ("download", "remote"):
+            print(f"⚠️ IMAGE_INGEST_MODE={self.mode} không hợp lệ, dùng download")
+            self.mode = "download"
+        if self.mode == "remote" and not image_storage.backend.supports_remote_fetch:
+            print(f"⚠️ IMAGE_INGEST_MODE=remote cần backend tự fetch URL (ImageKit), {image_storage.backend.name} sẽ tự tải")
+            self.mode = "download"
+
+    @property
+    def enabled(self):
+        return self.mode == "remote"
+
+    def probe(self, url):
+        """
+        Thử tải ảnh như ImageKit (không cookie, không Referer)
+
+        Returns:
+            (mode "remote" / "download", lý do, có lưu lâu không)
+        """
+        try:
+            response = rate_limiter.request("GET", url, headers=PROBE_HEADERS, stream=True, timeout=10)
+        except Exception as e:
+            return "download", f"probe lỗi: {e}", False
+        try:
+            if response.status_code != 200:
+                return "download", f"HTTP {response.status_code} khi không có cookie/Referer", True
+            content_type = response.headers.get("Content-Type", "")
+            head = next(response.iter_content(64), b"")
+            if not sniff_format(head) and not content_type.startswith("image/"):
+                # Trang challenge / chặn hotlink trả HTML thay vì ảnh
+                return "download", f"không phải ảnh ({content_type or '?'})", True
+            return "remote", "tải được không cần cookie/Referer", True
+        finally:
+            response.close()
+
+    def _store(self, host, mode, reason, durable=True):
+        expires_at = time.time() + (self.ttl if durable else RETRY_TTL)
+        with self._lock:
+            self._hosts[host] = {"mode": mode, "reason": reason, "expires_at": expires_at}
+        print(f"  🧭 Ingest {host}: {mode} ({reason})")
+        if not durable:
+            return
+        try:
+            db.save_ingest_host(host, mode, reason, expires_at)
+        except Exception as e:
+            print(f"⚠️ Không lưu được ingest_hosts: {e}")
+
+    def decide(self, host, sample_url):
+        """Chế độ ingest của host (RAM → MongoDB → probe)"""
+        now = time.time()
+        with self._lock:
+            entry = self._hosts.get(host)
+        if entry and entry["expires_at"] > now:
+            return entry["mode"]
+        try:
+            entry = db.get_ingest_host(host)
+        except Exception:
+            entry = None
+        if entry and entry.get("expires_at", 0) > now:
+            with self._lock:
+                self._hosts[host] = entry
+            return entry["mode"]
+        mode, reason, durable = self.probe(sample_url)
+        self._store(host, mode, reason, durable)
+        return mode
+
+    def _count(self, host, key):
+        with self._lock:
+            for counters in (self.totals, self._counters.setdefault(host, _new_counters())):
+                counters[key] += 1
+
+    def ingest(self, sources, folder_path):
+        """
+        Gửi ảnh của các host "remote" cho ImageKit fetch
+
+        Args:
+            sources: List (idx, src)
+            folder_path: Folder trên ImageKit (manga/<manga_id>/<chapter_id>)
+
+        Returns:
+            (dict idx → {url, width, height} đã ingest, list (idx, src) còn phải tự tải)
+        """
+        if not self.enabled or not sources:
+            return {}, sources
+
+        by_host = {}
+        for idx, src in sources:
+            by_host.setdefault(urlparse(src).netloc, []).append((idx, src))
+        remote, local = [], []
+        for host, items in by_host.items():
+            (remote if self.decide(host, items[0][1]) == "remote" else local).extend(items)
+        if not remote:
+            self._count_local(local)
+            return {}, sources
+
+        print(f"🛰️ Ingest từ xa: {len(remote)} ảnh do ImageKit tự fetch, {len(local)} ảnh tự tải")
+        results, attempted, failed = {}, {}, {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            uploads = executor.map(lambda item: image_storage.upload_page_from_url(item[1], folder_path, item[0]), remote)
+            for (idx, src), uploaded in zip(remote, uploads):
+                host = urlparse(src).netloc
+                attempted[host] = attempted.get(host, 0) + 1
+                if uploaded:
+                    results[idx] = uploaded
+                    self._count(host, "remote")
+                else:
+                    # ImageKit không fetch được → tự tải ảnh này ngay trong lượt này
+                    failed[host] = failed.get(host, 0) + 1
+                    self._count(host, "remote_failed")
+                    local.append((idx, src))
+
+        # Host remote mà ImageKit fetch lỗi nhiều → lần sau tự tải
+        for host, count in failed.items():
+            if count >= 2 and count / attempted[host] >= FAILURE_RATIO:
+                self._store(host, "download", f"ImageKit fetch lỗi {count}/{attempted[host]} ảnh")
+
+        self._count_local(local)
+        local.sort()
+        return results, local
+
+    def _count_local(self, local):
+        for idx, src in local:
+            self._count(urlparse(src).netloc, "downloaded")
+
+    def snapshot(self):
+        """Quyết định theo host + số ảnh ingest từ xa / tự tải (cho admin)"""
+        with self._lock:
+            hosts = {
+                host: {**entry, **self._counters.get(host, _new_counters())}
+                for host, entry in self._hosts.items()
+            }
+            totals = dict(self.totals)
+        return {"mode": self.mode, "concurrency": self.concurrency, "ttl": self.ttl, "totals": totals, "hosts": hosts}
+
+
+# Singleton instance
+remote_ingest = RemoteIngest()
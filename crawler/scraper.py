@@ -1,28 +1,26 @@
 import os
+import sys
 import json
 import time
-from playwright.sync_api import sync_playwright
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.browser_pool import BrowserPool
+from crawler.rate_limiter import rate_limiter
 
 class MangaScraper:
     def __init__(self, user_data_dir="browser_profile"):
         self.user_data_dir = user_data_dir
         self.base_url = "https://nettruyen.me.uk"
-
-    def start_browser(self, p):
-        # Sử dụng Persistent Context để giữ session và né bot detection
-        context = p.chromium.launch_persistent_context(
-            self.user_data_dir,
-            headless=True, # True khi deploy lên server
-            args=["--disable-blink-features=AutomationControlled"],
+        # Sử dụng Persistent Context (giữ sẵn trong pool) để giữ session và né bot detection
+        self.pool = BrowserPool(
+            size=1,
+            user_data_dir=self.user_data_dir,
             user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
         )
-        return context
 
     def get_home_manga(self):
         """Lấy danh sách truyện mới nhất từ trang chủ"""
-        with sync_playwright() as p:
-            context = self.start_browser(p)
-            page = context.new_page()
+        def crawl(page):
             page.goto(self.base_url, wait_until="networkidle")
             
             manga_list = []
@@ -38,16 +36,15 @@ class MangaScraper:
                         "thumbnail": img_el.get_attribute("src") if img_el else "",
                         "id": title_el.get_attribute("href").split("/")[-1]
                     })
-            context.close()
             return manga_list
 
+        return self.pool.run(crawl)
+
     def download_chapter(self, chapter_url, save_path):
         """Tải toàn bộ ảnh của một chương"""
         if not os.path.exists(save_path): os.makedirs(save_path)
         
-        with sync_playwright() as p:
-            context = self.start_browser(p)
-            page = context.new_page()
+        def download(page):
             page.goto(chapter_url, wait_until="domcontentloaded")
             
             # Cuộn trang để kích hoạt Lazy Load
@@ -59,7 +56,13 @@ class MangaScraper:
                 src = img.get_attribute("data-src") or img.get_attribute("src")
                 if src and "http" in src:
                     # Tải ảnh qua page.request để giữ Referer (tránh 403)
+                    rate_limiter.acquire(src)
                     response = page.request.get(src, headers={"referer": self.base_url})
+                    rate_limiter.feedback(src, response.status, response.headers.get("retry-after"))
                     with open(f"{save_path}/{idx:03d}.jpg", "wb") as f:
                         f.write(response.body())
-            context.close()
\ No newline at end of file
+
+        self.pool.run(download)
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,298 @@
+"""
+Storage Backends - Nơi lưu bytes ảnh sau khi đã dedup / transcode / cắt tile
+ImageStorage (imagekit_storage.py) giữ toàn bộ logic chung và chỉ gọi backend
+để ghi bytes → URL. Chọn bằng STORAGE_BACKEND:
+    imagekit  - ImageKit REST API (mặc định, ImageKitBackend trong imagekit_storage.py)
+    local     - Ổ đĩa của server, web app serve qua /media/<key>
+    s3        - S3-compatible (AWS S3, MinIO, R2...), cần boto3
+
+local / s3 lưu theo nội dung (content-addressed): key = BLAKE2b-128 của bytes,
+chia thư mục 2 cấp (ab/cd/abcd....jpg) để mỗi thư mục không quá nhiều file.
+Cùng nội dung → cùng key nên ghi lại không tốn thêm dung lượng.
+Benchmark: python benchmarks/bench_storage_backends.py
+"""
+
+import os
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from crawler.transcoder import sniff_format, FORMATS
+
+# boto3 là tùy chọn - chỉ cần khi STORAGE_BACKEND=s3
+try:
+    import boto3
+    HAS_BOTO3 = True
+except ImportError:
+    HAS_BOTO3 = False
+
+BACKEND = os.getenv("STORAGE_BACKEND", "imagekit").lower()
+LOCAL_ROOT = os.getenv("STORAGE_LOCAL_ROOT") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "images")
+PUBLIC_URL = os.getenv("STORAGE_PUBLIC_URL", "")
+S3_BUCKET = os.getenv("STORAGE_S3_BUCKET", "")
+S3_ENDPOINT = os.getenv("STORAGE_S3_ENDPOINT", "")          # vd. http://localhost:9000 cho MinIO
+S3_REGION = os.getenv("STORAGE_S3_REGION", "us-east-1")
+PUT_WORKERS = int(os.getenv("STORAGE_PUT_WORKERS", "16"))
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"     # key theo nội dung → không bao giờ đổi
+
+
+def content_key(data, file_name=None):
+    """Key theo nội dung: ab/cd/<blake2b-128>.<đuôi theo magic bytes>"""
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    fmt = sniff_format(data)
+    ext = FORMATS[fmt][0] if fmt else (os.path.splitext(file_name or "")[1].lstrip(".").lower() or "bin")
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+class StorageBackend:
+    """Interface chung: ghi bytes → URL công khai"""
+    name = "base"
+    supports_remote_fetch = False    # backend tự fetch được URL nguồn (IMAGE_INGEST_MODE=remote)
+
+    def connect(self):
+        return True
+
+    def put(self, data, folder, file_name, mime_type=None):
+        """Ghi 1 ảnh, trả URL hoặc None nếu lỗi"""
+        raise NotImplementedError
+
+    def put_many(self, items, max_workers=None):
+        """
+        Ghi nhiều ảnh
+
+        Args:
+            items: List (data, folder, file_name, mime_type)
+
+        Returns:
+            List URL (None cho ảnh lỗi) theo đúng thứ tự items
+        """
+        with ThreadPoolExecutor(max_workers=max_workers or PUT_WORKERS) as executor:
+            return list(executor.map(lambda item: self.put(*item), items))
+
+    def put_url(self, url, folder, file_name):
+        """Backend tự fetch ảnh từ URL nguồn, trả JSON {url, width, height} hoặc None"""
+        return None
+
+    def delete(self, file_id):
+        raise NotImplementedError
+
+    def list(self, path="", limit=100):
+        return []
+
+    def get_url(self, path, transformations=None):
+        return f"{self.public_url}/{path}"
+
+    def snapshot(self):
+        return {"backend": self.name}
+
+
+class LocalBackend(StorageBackend):
+    """Lưu trên đĩa: ghi file tạm cùng thư mục + fsync + os.replace (không bao giờ thấy file ghi dở)"""
+    name = "local"
+
+    def __init__(self, root=None, public_url=None):
+        self.root = root or LOCAL_ROOT
+        self.public_url = (public_url or PUBLIC_URL or "/media").rstrip("/")
+        self.stats = {"writes": 0, "existing": 0, "bytes_written": 0}
+        self._lock = threading.Lock()
+
+    def connect(self):
+        try:
+            os.makedirs(self.root, exist_ok=True)
+        except OSError as e:
+            print(f"❌ Không tạo được thư mục lưu ảnh {self.root}: {e}")
+            return False
+        print(f"✅ Lưu ảnh trên đĩa: {self.root} (URL {self.public_url}/...)")
+        return True
+
+    def path_for(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def _write_temp(self, data, directory):
+        """Ghi bytes vào file tạm trong thư mục đích (cùng filesystem để os.replace là atomic)"""
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return tmp_path
+
+    def _count(self, written, size):
+        with self._lock:
+            if written:
+                self.stats["writes"] += 1
+                self.stats["bytes_written"] += size
+            else:
+                self.stats["existing"] += 1
+
+    def put(self, data, folder, file_name, mime_type=None):
+        key = content_key(data, file_name)
+        path = self.path_for(key)
+        try:
+            if os.path.exists(path):
+                self._count(False, 0)
+            else:
+                os.replace(self._write_temp(data, os.path.dirname(path)), path)
+                self._fsync_dir(os.path.dirname(path))
+                self._count(True, len(data))
+            return f"{self.public_url}/{key}"
+        except OSError as e:
+            print(f"❌ Lỗi ghi ảnh {file_name}: {e}")
+            return None
+
+    def put_many(self, items, max_workers=None):
+        """Ghi hết file tạm (song song), rồi mới đổi tên hàng loạt và fsync mỗi thư mục shard 1 lần"""
+        keys = [content_key(data, file_name) for data, _, file_name, _ in items]
+        urls = [None] * len(items)
+        pending = {}
+        for i, key in enumerate(keys):
+            if os.path.exists(self.path_for(key)):
+                self._count(False, 0)
+                urls[i] = f"{self.public_url}/{key}"
+            else:
+                pending.setdefault(key, []).append(i)
+
+        def write(key):
+            try:
+                data = items[pending[key][0]][0]
+                return key, self._write_temp(data, os.path.dirname(self.path_for(key)))
+            except OSError as e:
+                print(f"❌ Lỗi ghi ảnh {key}: {e}")
+                return key, None
+
+        with ThreadPoolExecutor(max_workers=max_workers or PUT_WORKERS) as executor:
+            temps = list(executor.map(write, pending))
+
+        directories = set()
+        for key, tmp_path in temps:
+            if not tmp_path:
+                continue
+            path = self.path_for(key)
+            try:
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"❌ Lỗi ghi ảnh {key}: {e}")
+                continue
+            directories.add(os.path.dirname(path))
+            self._count(True, len(items[pending[key][0]][0]))
+            for i in pending[key]:
+                urls[i] = f"{self.public_url}/{key}"
+        for directory in directories:
+            self._fsync_dir(directory)
+        return urls
+
+    @staticmethod
+    def _fsync_dir(directory):
+        """fsync thư mục để lần đổi tên đã ghi xuống đĩa (không hỗ trợ trên Windows)"""
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def delete(self, file_id):
+        """file_id = key (ab/cd/<hash>.<ext>)"""
+        try:
+            os.remove(self.path_for(file_id))
+            return True
+        except OSError as e:
+            print(f"❌ Lỗi xóa file: {e}")
+            return False
+
+    def list(self, path="", limit=100):
+        files = []
+        for directory, _, names in os.walk(os.path.join(self.root, path)):
+            for name in sorted(names):
+                if name.startswith(".tmp-"):
+                    continue
+                key = os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, "/")
+                files.append({"name": name, "fileId": key, "url": f"{self.public_url}/{key}"})
+                if len(files) >= limit:
+                    return files
+        return files
+
+    def snapshot(self):
+        with self._lock:
+            return {"backend": self.name, "root": self.root, **self.stats}
+
+
+class S3Backend(StorageBackend):
+    """S3-compatible (AWS S3 / MinIO / R2): PUT object là atomic nên không cần file tạm"""
+    name = "s3"
+
+    def __init__(self, bucket=None, endpoint=None, region=None, public_url=None):
+        self.bucket = bucket or S3_BUCKET
+        self.endpoint = endpoint or S3_ENDPOINT or None
+        self.region = region or S3_REGION
+        default_url = f"{self.endpoint.rstrip('/')}/{self.bucket}" if self.endpoint else f"https://{self.bucket}.s3.{self.region}.amazonaws.com"
+        self.public_url = (public_url or PUBLIC_URL or default_url).rstrip("/")
+        self.stats = {"writes": 0, "bytes_written": 0}
+        self._client = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        if not HAS_BOTO3:
+            print("❌ STORAGE_BACKEND=s3 cần boto3: pip install boto3")
+            return False
+        if not self.bucket:
+            print("❌ Thiếu STORAGE_S3_BUCKET")
+            return False
+        with self._lock:
+            if self._client is None:
+                # Credentials lấy từ AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY như mọi tool S3
+                self._client = boto3.client("s3", endpoint_url=self.endpoint, region_name=self.region)
+        print(f"✅ Lưu ảnh trên S3: {self.bucket} (URL {self.public_url}/...)")
+        return True
+
+    def put(self, data, folder, file_name, mime_type=None):
+        if self._client is None and not self.connect():
+            return None
+        key = content_key(data, file_name)
+        fmt = sniff_format(data)
+        try:
+            self._client.put_object(
+                Bucket=self.bucket, Key=key, Body=data,
+                ContentType=mime_type or (FORMATS[fmt][1] if fmt else "application/octet-stream"),
+                CacheControl=IMMUTABLE_CACHE
+            )
+        except Exception as e:
+            print(f"❌ Lỗi upload S3 {file_name}: {e}")
+            return None
+        with self._lock:
+            self.stats["writes"] += 1
+            self.stats["bytes_written"] += len(data)
+        return f"{self.public_url}/{key}"
+
+    def delete(self, file_id):
+        try:
+            self._client.delete_object(Bucket=self.bucket, Key=file_id)
+            return True
+        except Exception as e:
+            print(f"❌ Lỗi xóa file: {e}")
+            return False
+
+    def list(self, path="", limit=100):
+        try:
+            response = self._client.list_objects_v2(Bucket=self.bucket, Prefix=path, MaxKeys=limit)
+        except Exception as e:
+            print(f"❌ Lỗi liệt kê files: {e}")
+            return []
+        return [
+            {"name": obj["Key"].rsplit("/", 1)[-1], "fileId": obj["Key"], "url": f"{self.public_url}/{obj['Key']}"}
+            for obj in response.get("Contents", [])
+        ]
+
+    def snapshot(self):
+        with self._lock:
+            return {"backend": self.name, "bucket": self.bucket, "endpoint": self.endpoint, **self.stats}
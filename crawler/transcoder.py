@@ -0,0 +1,189 @@
+"""
+Image Transcoder - Nhận diện định dạng thật của ảnh và encode lại trước khi upload
+Ảnh tải về được upload nguyên bytes và luôn đặt tên .jpg; strip webtoon PNG/JPEG
+lớn tốn dung lượng + băng thông ImageKit. Khi bật IMAGE_TRANSCODE=webp/avif,
+ảnh được encode lại (Pillow) trong ProcessPoolExecutor để không tranh GIL với
+các thread download; chỉ dùng bản mới nếu nhỏ hơn bản gốc.
+
+Không bật transcode thì ảnh vẫn được đặt đúng đuôi theo magic bytes.
+Benchmark bytes tiết kiệm + CPU mỗi ảnh: python benchmarks/bench_transcode.py
+"""
+
+import io
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Pillow là tùy chọn - không có thì chỉ nhận diện định dạng, không transcode
+try:
+    from PIL import Image, features
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+MODE = os.getenv("IMAGE_TRANSCODE", "off").lower()                  # off / webp / avif
+QUALITY = int(os.getenv("IMAGE_TRANSCODE_QUALITY", "80"))
+WORKERS = int(os.getenv("IMAGE_TRANSCODE_WORKERS", "0")) or os.cpu_count() or 1
+
+# định dạng → (đuôi file, mime type)
+FORMATS = {
+    "jpeg": ("jpg", "image/jpeg"),
+    "png": ("png", "image/png"),
+    "webp": ("webp", "image/webp"),
+    "gif": ("gif", "image/gif"),
+    "avif": ("avif", "image/avif"),
+}
+PIL_FORMATS = {"webp": "WEBP", "avif": "AVIF"}
+WEBP_MAX_SIDE = 16383   # giới hạn kích thước của WebP
+
+
+def sniff_format(data):
+    """Định dạng thật theo magic bytes (jpeg / png / webp / gif / avif) hoặc None"""
+    head = data[:32]
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "avif"
+    return None
+
+
+def available_targets():
+    """Các định dạng đích Pillow encode được trên máy này"""
+    if not HAS_PIL:
+        return []
+    targets = []
+    if features.check("webp"):
+        targets.append("webp")
+    try:
+        if features.check("avif"):
+            targets.append("avif")
+    except ValueError:
+        # Pillow cũ chưa biết feature avif
+        pass
+    return targets
+
+
+def transcode_bytes(data, target, quality):
+    """
+    Encode lại 1 ảnh (chạy trong process con)
+
+    Returns:
+        (bytes mới hoặc None nếu không nên transcode, giây CPU đã dùng)
+    """
+    cpu_start = time.process_time()
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if getattr(img, "is_animated", False):
+                return None, time.process_time() - cpu_start
+            if target == "webp" and max(img.size) > WEBP_MAX_SIDE:
+                return None, time.process_time() - cpu_start
+            if img.mode not in ("RGB", "RGBA", "L"):
+                img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+            params = {"quality": quality}
+            if target == "webp":
+                params["method"] = 4   # cân bằng tốc độ / dung lượng (0 nhanh nhất, 6 nhỏ nhất)
+            out = io.BytesIO()
+            img.save(out, PIL_FORMATS[target], **params)
+            return out.getvalue(), time.process_time() - cpu_start
+    except Exception:
+        return None, time.process_time() - cpu_start
+
+
+class Transcoder:
+    def __init__(self, mode=None, quality=None, workers=None):
+        self.mode = (mode or MODE).lower()
+        self.quality = quality or QUALITY
+        self.workers = workers or WORKERS
+        self.stats = {"images": 0, "transcoded": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0}
+        self._pool = None
+        self._lock = threading.Lock()
+
+        if self.mode != "off" and self.mode not in available_targets():
+            print(f"⚠️ IMAGE_TRANSCODE={self.mode} không khả dụng (cần Pillow hỗ trợ định dạng này), giữ nguyên ảnh")
+            self.mode = "off"
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn thay vì fork: process đang chạy nhiều thread download, fork có thể kẹt lock
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def call(self, fn, *args):
+        """Chạy fn(*args) trong process pool (Vercel không tạo được process → chạy ngay trong thread)"""
+        try:
+            return self._executor().submit(fn, *args).result()
+        except (OSError, NotImplementedError, RuntimeError) as e:
+            print(f"⚠️ Không dùng được process pool ({e}), xử lý ảnh trong thread")
+            return fn(*args)
+
+    async def call_async(self, fn, *args):
+        """Như call() nhưng không chặn event loop"""
+        try:
+            return await asyncio.wrap_future(self._executor().submit(fn, *args))
+        except (OSError, NotImplementedError, RuntimeError):
+            return await asyncio.to_thread(fn, *args)
+
+    def _finish(self, data, encoded, cpu_seconds):
+        """Chọn bản nhỏ hơn, cập nhật thống kê, trả về (bytes, đuôi file, mime)"""
+        source_format = sniff_format(data) or "jpeg"
+        chosen, fmt = data, source_format
+        if encoded and len(encoded) < len(data):
+            chosen, fmt = encoded, self.mode
+        with self._lock:
+            self.stats["images"] += 1
+            self.stats["bytes_in"] += len(data)
+            self.stats["bytes_out"] += len(chosen)
+            self.stats["cpu_seconds"] += cpu_seconds
+            if chosen is not data:
+                self.stats["transcoded"] += 1
+        ext, mime = FORMATS[fmt]
+        return chosen, ext, mime
+
+    def _should_encode(self, data):
+        return self.enabled and sniff_format(data) in ("jpeg", "png", "webp")
+
+    def prepare(self, data):
+        """
+        Ảnh sẵn sàng upload
+
+        Returns:
+            (bytes, đuôi file, mime type)
+        """
+        if not self._should_encode(data):
+            return self._finish(data, None, 0.0)
+        encoded, cpu_seconds = self.call(transcode_bytes, data, self.mode, self.quality)
+        return self._finish(data, encoded, cpu_seconds)
+
+    async def prepare_async(self, data):
+        """Như prepare() nhưng không chặn event loop"""
+        if not self._should_encode(data):
+            return self._finish(data, None, 0.0)
+        encoded, cpu_seconds = await self.call_async(transcode_bytes, data, self.mode, self.quality)
+        return self._finish(data, encoded, cpu_seconds)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["mode"] = self.mode
+        stats["quality"] = self.quality
+        stats["saved_percent"] = round((1 - stats["bytes_out"] / stats["bytes_in"]) * 100, 1) if stats["bytes_in"] else 0.0
+        stats["cpu_ms_per_image"] = round(stats["cpu_seconds"] / stats["images"] * 1000, 1) if stats["images"] else 0.0
+        return stats
+
+
+# Singleton instance
+transcoder = Transcoder()
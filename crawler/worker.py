@@ -0,0 +1,192 @@
+"""
+Crawl Worker - Lấy job từ crawl job queue và chạy crawler
+Chạy độc lập với web server, scale bằng số process.
+
+Cách sử dụng:
+    CRAWL_JOB_QUEUE=sqlite python -m crawler.worker
+    CRAWL_JOB_QUEUE=mongo python -m crawler.worker --processes 4
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from crawler.job_queue import get_job_queue, LeaseLost, LEASE_SECONDS
+
+POLL_INTERVAL = 2  # giây chờ khi queue rỗng
+
+
+class _LeaseKeeper(threading.Thread):
+    """Thread gia hạn lease định kỳ trong lúc job đang chạy"""
+
+    def __init__(self, queue, job_id, worker_id):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(LEASE_SECONDS / 3):
+            try:
+                if not self.queue.heartbeat(self.job_id, self.worker_id):
+                    print(f"⚠️ Mất lease job {self.job_id}")
+                    self.lost.set()
+                    return
+            except Exception as e:
+                print(f"⚠️ Heartbeat lỗi: {e}")
+
+    def check(self):
+        """Raise LeaseLost nếu job đã bị worker khác lấy - handler gọi giữa các bước để dừng sớm"""
+        if self.lost.is_set():
+            raise LeaseLost(f"Job {self.job_id} đã bị worker khác lấy lại")
+
+    def update_progress(self, progress):
+        if not self.queue.update_progress(self.job_id, self.worker_id, progress):
+            self.lost.set()
+        self.check()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def run_chapter_job(crawler, queue, job, lease):
+    payload = job["payload"]
+    images = crawler.download_chapter_images(payload["manga_id"], payload["chapter_id"], payload.get("chapter_url"))
+    lease.check()
+    if not images:
+        raise RuntimeError(f"Không tải được ảnh chapter {payload['chapter_id']}")
+    # Còn ảnh lỗi → fail để queue chạy lại sau (lần sau chỉ repair các ảnh lỗi)
+    if payload["chapter_id"] in crawler.get_incomplete_chapters(payload["manga_id"]):
+        raise RuntimeError(f"Chapter {payload['chapter_id']} còn ảnh lỗi ({len(images)} ảnh đã xong)")
+    return {"images": len(images)}
+
+
+def run_story_job(crawler, queue, job, lease):
+    manga_id = job["payload"]["manga_id"]
+    data = crawler.crawl_story_detail(manga_id, force=job["payload"].get("force", False))
+    if not data:
+        raise RuntimeError(f"Không crawl được truyện {manga_id}")
+    lease.check()
+    new_chapters = data.get("new_chapters", [])
+    # Tự đưa chapter mới vào queue tải nếu được yêu cầu
+    if job["payload"].get("download_new"):
+        for chapter_id in new_chapters:
+            queue.enqueue("chapter", {"manga_id": manga_id, "chapter_id": chapter_id},
+                          dedupe_key=f"chapter:{manga_id}:{chapter_id}")
+    return {"title": data.get("title", ""), "chapters": len(data.get("chapters", [])), "new_chapters": new_chapters}
+
+
+def run_download_all_job(crawler, queue, job, lease):
+    """Tải toàn bộ truyện, bỏ qua các chapter đã xong ở lần chạy trước"""
+    from crawler.chapter_scheduler import ChapterScheduler
+
+    manga_id = job["payload"]["manga_id"]
+    story_data = crawler.get_story_data(manga_id) or crawler.crawl_story_detail(manga_id)
+    if not story_data:
+        raise RuntimeError(f"Không crawl được truyện {manga_id}")
+    lease.check()
+
+    progress = job.get("progress") or {}
+    completed = set(progress.get("completed", []))
+    chapters = [c for c in reversed(story_data.get("chapters", [])) if c.get("id") not in completed]
+    if completed:
+        print(f"🔁 Tiếp tục job {job['id']}: đã xong {len(completed)} chapters")
+
+    total = len(completed) + len(chapters)
+    errors = []
+    dedup = None
+    scheduler = ChapterScheduler(crawler, chapter_concurrency=job["payload"].get("concurrency"))
+    for event in scheduler.run(manga_id, chapters):
+        if event["type"] == "progress" and (event.get("images") or event.get("skipped")):
+            completed.add(event["chapter"])
+        elif event["type"] == "error":
+            errors.append(f"{event['chapter']}: {event['error']}")
+        elif event["type"] == "complete":
+            dedup = event.get("dedup")
+        if event["type"] in ("progress", "error"):
+            # Mất lease → LeaseLost thoát vòng lặp, scheduler hủy các chapter chưa chạy
+            lease.update_progress({
+                "total": total,
+                "current": len(completed) + len(errors),
+                "last_chapter": event["chapter"],
+                "completed": sorted(completed),
+                "errors": errors[-10:]
+            })
+
+    return {"total": total, "downloaded": len(completed), "errors": errors[:10], "dedup": dedup}
+
+
+JOB_HANDLERS = {
+    "chapter": run_chapter_job,
+    "story": run_story_job,
+    "download_all": run_download_all_job,
+}
+
+
+def worker_loop(worker_id=None, once=False):
+    """Vòng lặp chính: claim → chạy → complete/fail"""
+    from crawler.manga_crawler import MangaCrawler
+
+    queue = get_job_queue()
+    if queue is None:
+        print("❌ CRAWL_JOB_QUEUE chưa được thiết lập (sqlite hoặc mongo)")
+        return
+
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    crawler = MangaCrawler()
+    print(f"👷 Worker {worker_id} sẵn sàng")
+
+    while True:
+        job = queue.claim(worker_id)
+        if not job:
+            if once:
+                return
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        print(f"▶️ Job {job['id']} ({job['kind']}) - lần thử {job['attempts']}/{job['max_attempts']}")
+        handler = JOB_HANDLERS.get(job["kind"])
+        keeper = _LeaseKeeper(queue, job["id"], worker_id)
+        keeper.start()
+        try:
+            if handler is None:
+                raise ValueError(f"Loại job không hợp lệ: {job['kind']}")
+            result = handler(crawler, queue, job, keeper)
+            if queue.complete(job["id"], worker_id, result):
+                print(f"✅ Job {job['id']} hoàn thành")
+            else:
+                print(f"⚠️ Job {job['id']} xong nhưng đã mất lease, bỏ kết quả")
+        except LeaseLost as e:
+            print(f"⏹️ Dừng job {job['id']}: {e}")
+        except Exception as e:
+            print(f"❌ Job {job['id']} lỗi: {e}")
+            if not queue.fail(job["id"], worker_id, str(e)):
+                print(f"⚠️ Job {job['id']} đã mất lease, không ghi lỗi")
+        finally:
+            keeper.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl worker")
+    parser.add_argument("--processes", type=int, default=1, help="Số worker process")
+    parser.add_argument("--once", action="store_true", help="Thoát khi queue rỗng")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        worker_loop(once=args.once)
+    else:
+        processes = [
+            multiprocessing.Process(target=worker_loop, kwargs={"once": args.once})
+            for _ in range(args.processes)
+        ]
+        for proc in processes:
+            proc.start()
+        for proc in processes:
+            proc.join()
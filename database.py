@@ -19,6 +19,13 @@ except ImportError:
     MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "manga_heaven")
 
 
+def page_urls(page):
+    """URL ảnh của 1 trang theo thứ tự hiển thị (các tile nếu strip bị cắt)"""
+    if page.get("tiles"):
+        return [tile["url"] for tile in page["tiles"]]
+    return [page["url"]]
+
+
 class Database:
     _instance = None
     _client = None
@@ -110,6 +117,60 @@ class Database:
         collection = self.db.manga_details
         return collection.find_one({"id": manga_id})
     
+    def get_manga_head(self, manga_id):
+        """Lấy chi tiết manga nhưng chỉ kèm chapter mới nhất (không tải cả mảng chapters)"""
+        collection = self.db.manga_details
+        return collection.find_one({"id": manga_id}, {"chapters": {"$slice": 1}, "total_chapters": 1, "latest_chapter": 1})
+    
+    def get_chapter_ids(self, manga_id):
+        """ID các chapter đã lưu (chỉ lấy field id)"""
+        collection = self.db.manga_details
+        doc = collection.find_one({"id": manga_id}, {"chapters.id": 1, "_id": 0})
+        return [c["id"] for c in doc.get("chapters", [])] if doc else []
+    
+    def get_chapter_statuses(self, manga_id):
+        """Trạng thái probe đã lưu của từng chapter: {chapter_id: "verified" / "missing" / "unknown"}"""
+        collection = self.db.manga_details
+        doc = collection.find_one({"id": manga_id}, {"chapters.id": 1, "chapters.status": 1, "_id": 0})
+        return {c["id"]: c.get("status") for c in doc.get("chapters", [])} if doc else {}
+    
+    def set_chapter_status(self, manga_id, statuses):
+        """Cập nhật trạng thái của các chapter đã có trong mảng chapters (không ghi lại cả mảng)"""
+        collection = self.db.manga_details
+        by_status = {}
+        for chapter_id, status in statuses.items():
+            by_status.setdefault(status, []).append(chapter_id)
+        for status, chapter_ids in by_status.items():
+            collection.update_one(
+                {"id": manga_id},
+                {"$set": {"chapters.$[c].status": status}},
+                array_filters=[{"c.id": {"$in": chapter_ids}}]
+            )
+    
+    def append_new_chapters(self, manga_id, new_chapters, head_chapter_id, fields=None):
+        """
+        Thêm chapter mới vào đầu mảng chapters (không ghi lại toàn bộ document)
+        
+        Args:
+            manga_id: ID của manga
+            new_chapters: List chapter mới (mới nhất trước)
+            head_chapter_id: ID chapter đầu mảng hiện tại - chỉ cập nhật nếu chưa bị ai thay đổi
+            fields: Các field metadata khác cần $set (title, status, ...)
+        
+        Returns:
+            True nếu cập nhật thành công, False nếu document đã thay đổi (cần lưu lại toàn bộ)
+        """
+        collection = self.db.manga_details
+        update = {"$set": {**(fields or {}), "updated_at": datetime.utcnow()}}
+        if new_chapters:
+            update["$set"]["latest_chapter"] = new_chapters[0]["name"]
+            update["$push"] = {"chapters": {"$each": new_chapters, "$position": 0}}
+            update["$inc"] = {"total_chapters": len(new_chapters)}
+        
+        # Cùng 1 update_one → push chapters, latest_chapter, total_chapters thay đổi nguyên tử
+        result = collection.update_one({"id": manga_id, "chapters.0.id": head_chapter_id}, update)
+        return result.matched_count == 1
+    
     # ==================== CHAPTER OPERATIONS ====================
     
     def save_chapter_images(self, manga_id, chapter_id, images):
@@ -135,6 +196,62 @@ class Database:
         
         return result
     
+    def save_chapter_pages(self, manga_id, chapter_id, pages):
+        """
+        Lưu trạng thái từng ảnh của chapter
+        
+        Args:
+            pages: List dict {index, source_url, status ("done" / "failed"), attempts, url,
+                   width, height, tiles (list {url, width, height} khi strip bị cắt)}
+        
+        images chỉ gồm URL ảnh đã xong theo thứ tự trang (tile trải phẳng, reader cũ vẫn dùng được),
+        complete = True khi mọi ảnh đều xong.
+        """
+        collection = self.db.chapter_images
+        pages = sorted(pages, key=lambda p: p["index"])
+        done = [p for p in pages if p["status"] == "done"]
+        images = [url for p in done for url in page_urls(p)]
+        failed_count = len(pages) - len(done)
+        
+        return collection.update_one(
+            {"manga_id": manga_id, "chapter_id": chapter_id},
+            {
+                "$set": {
+                    "manga_id": manga_id,
+                    "chapter_id": chapter_id,
+                    "pages": pages,
+                    "images": images,
+                    "image_count": len(images),
+                    "failed_count": failed_count,
+                    "complete": failed_count == 0,
+                    "updated_at": datetime.utcnow()
+                },
+                "$setOnInsert": {
+                    "created_at": datetime.utcnow()
+                }
+            },
+            upsert=True
+        )
+    
+    def get_chapter_state(self, manga_id, chapter_id):
+        """Document chapter_images (images, pages, complete) hoặc None"""
+        return self.db.chapter_images.find_one(
+            {"manga_id": manga_id, "chapter_id": chapter_id},
+            {"_id": 0, "images": 1, "pages": 1, "complete": 1}
+        )
+    
+    def get_chapter_updated_at(self, manga_id, chapter_id):
+        """Thời điểm ghi gần nhất của chapter (download / repair), None nếu chưa có"""
+        doc = self.db.chapter_images.find_one(
+            {"manga_id": manga_id, "chapter_id": chapter_id}, {"_id": 0, "updated_at": 1}
+        )
+        return doc.get("updated_at") if doc else None
+    
+    def get_incomplete_chapters(self, manga_id):
+        """Các chapter_id còn ảnh lỗi cần repair"""
+        cursor = self.db.chapter_images.find({"manga_id": manga_id, "complete": False}, {"chapter_id": 1, "_id": 0})
+        return [doc["chapter_id"] for doc in cursor]
+    
     def get_chapter_images(self, manga_id, chapter_id):
         """Lấy danh sách URL ảnh của chapter"""
         collection = self.db.chapter_images
@@ -142,17 +259,17 @@ class Database:
         return doc.get("images", []) if doc else []
     
     def get_downloaded_chapters(self, manga_id):
-        """Lấy danh sách các chapter_id đã tải của một manga"""
+        """Lấy danh sách các chapter_id đã tải đủ ảnh của một manga (document cũ không có complete coi như đủ)"""
         collection = self.db.chapter_images
-        cursor = collection.find({"manga_id": manga_id}, {"chapter_id": 1, "_id": 0})
+        cursor = collection.find({"manga_id": manga_id, "complete": {"$ne": False}}, {"chapter_id": 1, "_id": 0})
         return [doc["chapter_id"] for doc in cursor]
     
     def get_download_status(self, manga_id):
         """Lấy trạng thái tải của một manga"""
         collection = self.db.chapter_images
         
-        # Đếm số chapter đã tải
-        downloaded = collection.count_documents({"manga_id": manga_id})
+        # Đếm số chapter đã tải đủ ảnh
+        downloaded = collection.count_documents({"manga_id": manga_id, "complete": {"$ne": False}})
         
         # Lấy tổng số chapter từ manga_details
         detail = self.get_manga_detail(manga_id)
@@ -164,6 +281,81 @@ class Database:
             "percentage": round(downloaded / total * 100, 1) if total > 0 else 0
         }
     
+    # ==================== CLOUDFLARE CLEARANCE ====================
+    
+    def save_clearance(self, host, cookies, user_agent, expires_at):
+        """Lưu cookies cf_clearance của 1 host (dùng chung cho mọi worker)"""
+        collection = self.db.cf_clearance
+        return collection.update_one(
+            {"host": host},
+            {
+                "$set": {
+                    "host": host,
+                    "cookies": cookies,
+                    "user_agent": user_agent,
+                    "expires_at": expires_at,
+                    "updated_at": datetime.utcnow()
+                }
+            },
+            upsert=True
+        )
+    
+    def get_clearance(self, host):
+        """Lấy cookies cf_clearance của 1 host"""
+        collection = self.db.cf_clearance
+        return collection.find_one({"host": host}, {"_id": 0})
+    
+    def delete_clearance(self, host):
+        """Xóa cookies cf_clearance đã hết hiệu lực"""
+        return self.db.cf_clearance.delete_one({"host": host})
+    
+    # ==================== IMAGE HASHES (DEDUP) ====================
+    
+    def get_image_by_hash(self, digest):
+        """URL đã upload của ảnh có cùng nội dung (hash) hoặc None - chỉ URL ghi theo nội dung (stable)"""
+        doc = self.db.image_hashes.find_one_and_update(
+            {"_id": digest, "stable": True},
+            {"$inc": {"hits": 1}, "$set": {"last_hit_at": datetime.utcnow()}},
+            projection={"url": 1}
+        )
+        return doc["url"] if doc else None
+    
+    def save_image_hash(self, digest, url, size):
+        """
+        Ghi hash → URL sau khi upload. URL ghi theo nội dung (không bị ghi đè bằng bytes khác)
+        nên được đánh dấu stable; hash cũ trỏ vào folder chapter bị thay bằng URL mới
+        """
+        self.db.image_hashes.update_one(
+            {"_id": digest},
+            {
+                "$set": {"url": url, "size": size, "stable": True},
+                "$setOnInsert": {"hits": 0, "created_at": datetime.utcnow()}
+            },
+            upsert=True
+        )
+    
+    # ==================== REMOTE INGEST HOSTS ====================
+    
+    def save_ingest_host(self, host, mode, reason, expires_at):
+        """Lưu quyết định ingest của 1 host ảnh ("remote" = ImageKit tự fetch, "download" = tự tải)"""
+        return self.db.ingest_hosts.update_one(
+            {"host": host},
+            {
+                "$set": {
+                    "host": host,
+                    "mode": mode,
+                    "reason": reason,
+                    "expires_at": expires_at,
+                    "updated_at": datetime.utcnow()
+                }
+            },
+            upsert=True
+        )
+    
+    def get_ingest_host(self, host):
+        """Lấy quyết định ingest đã lưu của 1 host ảnh"""
+        return self.db.ingest_hosts.find_one({"host": host}, {"_id": 0})
+    
     # ==================== USER MANAGEMENT ====================
     
     def create_user(self, username, email, password_hash, role='user'):
@@ -271,7 +463,7 @@ class Database:
         # 3. Đếm số chapter đã tải từ chapter_images
         # Dùng aggregation để group by manga_id và count
         pipeline = [
-            {"$match": {"manga_id": {"$in": manga_ids}}},
+            {"$match": {"manga_id": {"$in": manga_ids}, "complete": {"$ne": False}}},
             {"$group": {
                 "_id": "$manga_id",
                 "count": {"$sum": 1}
@@ -0,0 +1,324 @@
+"""
+Image Cache - Cache ảnh trên đĩa cho route /cdn của reader
+Ảnh chapter được tải từ CDN (ImageKit) 1 lần rồi serve từ đĩa của server:
+chapter đọc nhiều không tốn thêm băng thông ImageKit và vẫn đọc được khi CDN chậm.
+
+- LRU theo tổng dung lượng (IMAGE_CACHE_MB): vượt budget thì xóa ảnh lâu không đọc nhất
+- Index (key, size, lần đọc cuối) nằm trong SQLite cạnh cache nên mọi web worker
+  (gunicorn nhiều process) dùng chung 1 budget và 1 thứ tự LRU
+- Nhiều request cùng lúc cho 1 ảnh chưa có trong cache chỉ tải từ CDN 1 lần:
+  trong process bằng Event, giữa các process bằng fcntl.flock (256 file lock theo key)
+- Ghi file tạm + os.replace nên không bao giờ serve file ghi dở
+- get() trả file đã mở sẵn: ảnh bị xóa (evict) ngay sau đó vẫn gửi trọn vẹn
+- URL /cdn kèm version chapter nên web app serve với ETag, Range, Cache-Control immutable
+"""
+
+import os
+import sys
+import time
+import hashlib
+import sqlite3
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(__file__))
+from crawler.http_pool import http_pool
+from crawler.transcoder import sniff_format, FORMATS
+
+# fcntl chỉ có trên POSIX - không có thì chỉ gộp request trong cùng process
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+CACHE_DIR = os.getenv("IMAGE_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "image_cache")
+MAX_BYTES = int(float(os.getenv("IMAGE_CACHE_MB", "2048")) * 1024 * 1024)
+UPSTREAM_TIMEOUT = float(os.getenv("IMAGE_CACHE_TIMEOUT", "30"))
+CHUNK_SIZE = 64 * 1024
+TOUCH_INTERVAL = 60       # giây: chỉ ghi lại lần đọc cuối nếu cũ hơn (tránh ghi SQLite mỗi hit)
+STALE_TMP_SECONDS = 3600  # file tạm cũ hơn 1 giờ là của lần ghi bị ngắt
+
+
+def image_ref(url):
+    """
+    ID ảnh trong /cdn/<manga_id>/<chapter_id>/<version>/<ref>: hash của cả URL gốc
+    (tên file không đủ: chapter có thể dùng lại ảnh chapter khác qua dedup, tile trùng tên trang khác)
+    """
+    return hashlib.blake2b(url.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class _Flight:
+    """1 lần tải từ CDN đang chạy, các thread khác cùng ảnh chờ kết quả"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.found = False
+        self.url = None
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE / COMMIT: khóa ghi index giữa các process"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class _KeyLock:
+    """flock trên 1 trong 256 file lock (theo 2 ký tự đầu của key) - gộp cache miss giữa các process"""
+
+    def __init__(self, root, key, timeout):
+        self.path = os.path.join(root, ".locks", key[:2])
+        self.timeout = timeout
+        self.fd = None
+
+    def __enter__(self):
+        if not HAS_FCNTL:
+            return self
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return self
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    # Process giữ lock bị treo → tự tải, không chờ mãi
+                    return self
+                time.sleep(0.05)
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.fd is not None:
+            os.close(self.fd)  # đóng fd cũng nhả flock
+        return False
+
+
+class ImageCache:
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or CACHE_DIR
+        self.max_bytes = max_bytes or MAX_BYTES
+        self.stats = {"hits": 0, "misses": 0, "collapsed": 0, "evictions": 0, "errors": 0}  # của process này
+        self._inflight = {}             # key → _Flight (thread trong process này)
+        self._ready = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(*parts):
+        return hashlib.blake2b("/".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _conn(self):
+        """Mỗi thread 1 connection SQLite tới index dùng chung"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.root, "index.sqlite3"), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _setup(self):
+        """Tạo index lần đầu; cache cũ chưa có index thì đọc lại từ đĩa (thứ tự LRU theo mtime)"""
+        with self._lock:
+            if self._ready:
+                return
+            os.makedirs(self.root, exist_ok=True)
+            with _Transaction(self._conn()) as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    "key TEXT PRIMARY KEY, size INTEGER NOT NULL, mimetype TEXT NOT NULL, last_access REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries (last_access)")
+                if conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 0:
+                    conn.executemany("INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?)", self._scan())
+                    self._evict(conn)
+            self._ready = True
+
+    def _scan(self):
+        now = time.time()
+        for directory, _, names in os.walk(self.root):
+            if os.path.basename(directory) == ".locks":
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                    if name.startswith(".tmp-"):
+                        # File tạm của lần ghi bị ngắt (file mới có thể đang được process khác ghi)
+                        if now - stat.st_mtime > STALE_TMP_SECONDS:
+                            os.remove(path)
+                        continue
+                    if directory == self.root:
+                        continue  # index.sqlite3 và file WAL
+                    with open(path, "rb") as f:
+                        head = f.read(32)
+                except OSError:
+                    continue
+                fmt = sniff_format(head)
+                yield name, stat.st_size, FORMATS[fmt][1] if fmt else "application/octet-stream", stat.st_mtime
+
+    def _evict(self, conn, keep=None):
+        """Xóa ảnh lâu không đọc nhất tới khi nằm trong budget - gọi trong transaction"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            with self._lock:
+                self.stats["evictions"] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _open(self, key):
+        """
+        Entry {path, size, mimetype, file (đã mở)} hoặc None
+        Mở file trước khi trả: process khác evict ngay sau đó thì handle vẫn đọc được
+        """
+        row = self._conn().execute("SELECT size, mimetype, last_access FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        size, mimetype, last_access = row
+        path = self._path(key)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            # Bị xóa giữa chừng (evict / xóa tay) → coi như miss
+            with _Transaction(self._conn()) as conn:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        now = time.time()
+        if now - last_access > TOUCH_INTERVAL:
+            self._conn().execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        return {"path": path, "size": size, "mimetype": mimetype, "file": f}
+
+    def _download(self, key, url):
+        """Tải ảnh từ CDN vào cache (stream ra file tạm), True nếu đã lưu"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        response = http_pool.request("GET", url, stream=True, timeout=(5, UPSTREAM_TIMEOUT))
+        try:
+            if response.status_code != 200:
+                print(f"⚠️ Image cache: CDN trả {response.status_code} cho {url[:80]}")
+                return False
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+            size, head = 0, b""
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        if not head:
+                            head = chunk[:32]
+                        f.write(chunk)
+                        size += len(chunk)
+                if size > self.max_bytes:
+                    os.remove(tmp_path)
+                    return False
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        finally:
+            response.close()
+
+        fmt = sniff_format(head)
+        mimetype = FORMATS[fmt][1] if fmt else response.headers.get("Content-Type", "application/octet-stream")
+        with _Transaction(self._conn()) as conn:
+            conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, size, mimetype, time.time()))
+            self._evict(conn, keep=key)
+        return True
+
+    def _fill(self, key, resolve, flight):
+        """Thread dẫn đầu: gộp với process khác qua flock, tải nếu vẫn chưa có"""
+        with _KeyLock(self.root, key, UPSTREAM_TIMEOUT + 5):
+            # Process khác có thể vừa tải xong trong lúc chờ lock
+            entry = self._open(key)
+            if entry:
+                entry["file"].close()
+                flight.found = True
+                return
+            flight.url = resolve()
+            if flight.url:
+                flight.found = self._download(key, flight.url)
+
+    def get(self, key, resolve):
+        """
+        Ảnh trong cache, tải từ CDN nếu chưa có (nhiều request cùng ảnh chỉ tải 1 lần)
+
+        Args:
+            key: Key của ảnh (key_for(manga_id, chapter_id, version chapter, image_ref(URL gốc)))
+            resolve: Hàm () → URL ảnh gốc trên CDN hoặc None (chỉ gọi khi cache miss)
+
+        Returns:
+            (entry {"path", "size", "mimetype", "file"} hoặc None, URL gốc hoặc None)
+            Người gọi phải đóng entry["file"] (send_file tự đóng khi gửi xong).
+        """
+        self._setup()
+        entry = self._open(key)
+        if entry:
+            with self._lock:
+                self.stats["hits"] += 1
+            return entry, None
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.stats["misses"] += 1
+            else:
+                self.stats["collapsed"] += 1
+
+        if leader:
+            try:
+                self._fill(key, resolve, flight)
+            except Exception as e:
+                print(f"⚠️ Image cache: lỗi tải {key}: {e}")
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                    if not flight.found:
+                        self.stats["errors"] += 1
+                flight.done.set()
+        else:
+            flight.done.wait(UPSTREAM_TIMEOUT + 10)
+
+        entry = self._open(key) if flight.found else None
+        return entry, flight.url
+
+    def snapshot(self):
+        self._setup()
+        entries, used = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        with self._lock:
+            requests = self.stats["hits"] + self.stats["misses"] + self.stats["collapsed"]
+            return {
+                "root": self.root,
+                "entries": entries,
+                "used_mb": round(used / 1048576, 1),
+                "max_mb": round(self.max_bytes / 1048576, 1),
+                "shared_lock": HAS_FCNTL,
+                "hit_rate": round(self.stats["hits"] / requests * 100, 1) if requests else 0.0,
+                "in_flight": len(self._inflight),
+                **self.stats
+            }
+
+
+# Singleton instance
+image_cache = ImageCache()
@@ -2,13 +2,16 @@
 ImageKit Module - Upload và quản lý ảnh trên ImageKit.io
 Free tier: 20GB storage, 20GB bandwidth/month
 Sử dụng REST API trực tiếp để đảm bảo tương thích
+
+ImageStorage lo dedup / transcode / cắt tile; bytes được ghi qua backend chọn
+bằng STORAGE_BACKEND (imagekit / local / s3 - xem crawler/storage_backends.py)
 """
 
-import requests
 import os
 import sys
-import base64
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import uuid
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
 
 # Import config
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
@@ -19,19 +22,68 @@ except ImportError:
     IMAGEKIT_PRIVATE_KEY = os.getenv("IMAGEKIT_PRIVATE_KEY", "")
     IMAGEKIT_URL_ENDPOINT = os.getenv("IMAGEKIT_URL_ENDPOINT", "")
 
+from crawler.http_pool import http_pool
+from crawler.image_dedup import image_dedup
+from crawler.transcoder import transcoder, sniff_format, FORMATS
+from crawler.image_tiles import image_tiler
+from crawler.storage_backends import StorageBackend, LocalBackend, S3Backend, BACKEND
 
-class ImageStorage:
-    _instance = None
+
+class MultipartBody:
+    """
+    Body multipart/form-data gửi thẳng bytes ảnh (không base64, không ghép thành 1 bytes mới)
+    requests gửi lần lượt từng phần (memoryview của ảnh) qua socket; có __len__ nên
+    vẫn gửi Content-Length thay vì chunked. Lặp lại được nên rate limiter retry được.
+    """
+    CHUNK_SIZE = 256 * 1024
+
+    def __init__(self, fields, file_name, file_bytes, mime_type, file_field="file"):
+        self.boundary = uuid.uuid4().hex
+        head = "".join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+        )
+        head += (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{file_name}"\r\n'
+            f'Content-Type: {mime_type}\r\n\r\n'
+        )
+        self._head = head.encode("utf-8")
+        self._file = memoryview(file_bytes)
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return len(self._head) + self._file.nbytes + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        for start in range(0, self._file.nbytes, self.CHUNK_SIZE):
+            yield self._file[start:start + self.CHUNK_SIZE]
+        yield self._tail
+
+
+# Đuôi file giữ nguyên khi ImageKit fetch ảnh từ URL nguồn
+REMOTE_EXTENSIONS = {"jpg", "jpeg", "png", "webp", "gif", "avif"}
+
+
+def guess_mime_type(file_bytes):
+    """Mime type theo magic bytes (ảnh lạ → application/octet-stream)"""
+    fmt = sniff_format(file_bytes)
+    return FORMATS[fmt][1] if fmt else "application/octet-stream"
+
+
+class ImageKitBackend(StorageBackend):
+    """ImageKit REST API (free tier: 20GB storage, 20GB bandwidth/month)"""
+    name = "imagekit"
+    supports_remote_fetch = True
     
     # ImageKit API endpoints
     UPLOAD_URL = "https://upload.imagekit.io/api/v1/files/upload"
     API_URL = "https://api.imagekit.io/v1"
     
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
-    
     def __init__(self):
         self.private_key = IMAGEKIT_PRIVATE_KEY
         self.public_key = IMAGEKIT_PUBLIC_KEY
@@ -54,6 +106,132 @@ class ImageStorage:
         """Tạo auth header cho API calls"""
         return (self.private_key, "")
     
+    def put(self, data, folder, file_name, mime_type=None):
+        """Upload bytes lên ImageKit bằng multipart nhị phân"""
+        try:
+            body = MultipartBody(
+                {
+                    "fileName": file_name,
+                    "folder": f"/{folder}",
+                    "useUniqueFileName": "false",
+                    "overwriteFile": "true"
+                },
+                file_name, data, mime_type or guess_mime_type(data)
+            )
+            
+            response = http_pool.request(
+                "POST", self.UPLOAD_URL,
+                data=body,
+                headers={"Content-Type": body.content_type},
+                auth=self._get_auth()
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                return result.get('url')
+            else:
+                print(f"❌ Lỗi upload: {response.status_code}")
+                return None
+                
+        except Exception as e:
+            print(f"❌ Lỗi upload {file_name}: {e}")
+            return None
+    
+    def put_url(self, url, folder, file_name):
+        """Gửi URL nguồn cho ImageKit fetch, trả JSON kết quả (có url, width, height) hoặc None"""
+        try:
+            data = {
+                "file": url,
+                "fileName": file_name,
+                "folder": f"/{folder}",
+                "useUniqueFileName": "false",
+                "overwriteFile": "true"
+            }
+            
+            response = http_pool.request(
+                "POST", self.UPLOAD_URL,
+                data=data,
+                auth=self._get_auth()
+            )
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                print(f"❌ Lỗi upload từ URL: {response.status_code}")
+                return None
+                
+        except Exception as e:
+            print(f"❌ Lỗi upload {file_name}: {e}")
+            return None
+    
+    def get_url(self, path, transformations=None):
+        """URL với transformations của ImageKit"""
+        if transformations:
+            tr_str = ",".join([f"{k}-{v}" for t in transformations for k, v in t.items()])
+            return f"{self.url_endpoint}/tr:{tr_str}/{path}"
+        return f"{self.url_endpoint}/{path}"
+    
+    def delete(self, file_id):
+        """Xóa file theo ID"""
+        try:
+            response = http_pool.request(
+                "DELETE", f"{self.API_URL}/files/{file_id}",
+                auth=self._get_auth()
+            )
+            return response.status_code == 204
+        except Exception as e:
+            print(f"❌ Lỗi xóa file: {e}")
+            return False
+    
+    def list(self, path="", limit=100):
+        """Liệt kê files trong folder"""
+        try:
+            params = {"limit": limit}
+            if path:
+                params["path"] = path
+            
+            response = http_pool.request(
+                "GET", f"{self.API_URL}/files",
+                params=params,
+                auth=self._get_auth()
+            )
+            
+            if response.status_code == 200:
+                return response.json()
+            return []
+        except Exception as e:
+            print(f"❌ Lỗi liệt kê files: {e}")
+            return []
+
+
+def create_backend(name=None):
+    """Backend theo STORAGE_BACKEND: imagekit (mặc định) / local / s3"""
+    name = (name or BACKEND).lower()
+    if name == "local":
+        return LocalBackend()
+    if name == "s3":
+        return S3Backend()
+    if name != "imagekit":
+        print(f"⚠️ STORAGE_BACKEND={name} không hợp lệ, dùng ImageKit")
+    return ImageKitBackend()
+
+
+class ImageStorage:
+    _instance = None
+    
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+    
+    def __init__(self):
+        # Dedup / transcode / cắt tile làm ở đây, backend chỉ ghi bytes → URL
+        self.backend = create_backend()
+    
+    def connect(self):
+        """Kiểm tra kết nối storage backend"""
+        return self.backend.connect()
+    
     def upload_from_file(self, file_path, folder, file_name=None):
         """
         Upload file từ đường dẫn local
@@ -75,37 +253,16 @@ class ImageStorage:
         
         try:
             with open(file_path, "rb") as f:
-                file_data = base64.b64encode(f.read()).decode('utf-8')
-            
-            data = {
-                "file": file_data,
-                "fileName": file_name,
-                "folder": f"/{folder}",
-                "useUniqueFileName": "false",
-                "overwriteFile": "true"
-            }
-            
-            response = requests.post(
-                self.UPLOAD_URL,
-                data=data,
-                auth=self._get_auth(),
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('url')
-            else:
-                print(f"❌ Lỗi upload: {response.status_code} - {response.text[:200]}")
-                return None
-                
-        except Exception as e:
-            print(f"❌ Lỗi upload {file_name}: {e}")
+                file_bytes = f.read()
+        except OSError as e:
+            print(f"❌ Lỗi đọc file {file_path}: {e}")
             return None
+        
+        return self._upload_bytes(file_bytes, folder, file_name)
     
     def upload_from_bytes(self, file_bytes, folder, file_name):
         """
-        Upload file từ bytes
+        Upload file từ bytes (ảnh trùng nội dung với ảnh đã upload → dùng lại URL cũ)
         
         Args:
             file_bytes: Dữ liệu file dạng bytes
@@ -115,42 +272,51 @@ class ImageStorage:
         Returns:
             URL của ảnh đã upload hoặc None nếu lỗi
         """
-        try:
-            file_data = base64.b64encode(file_bytes).decode('utf-8')
-            
-            data = {
-                "file": file_data,
-                "fileName": file_name,
-                "folder": f"/{folder}",
-                "useUniqueFileName": "false",
-                "overwriteFile": "true"
-            }
-            
-            response = requests.post(
-                self.UPLOAD_URL,
-                data=data,
-                auth=self._get_auth(),
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('url')
-            else:
-                print(f"❌ Lỗi upload: {response.status_code}")
+        return image_dedup.upload(file_bytes, folder, file_name, self._transcode_and_upload)
+    
+    def upload_page(self, file_bytes, folder, idx):
+        """
+        Upload 1 trang chapter, strip quá cao được cắt thành tile (IMAGE_TILE_HEIGHT)
+        
+        Args:
+            file_bytes: Bytes ảnh gốc
+            folder: Thư mục trên ImageKit
+            idx: Số thứ tự trang (tên file {idx:03d}, tile {idx:03d}-{t:02d})
+        
+        Returns:
+            Dict {url, width, height, tiles?} hoặc None nếu lỗi (tile nào lỗi coi như cả trang lỗi)
+        """
+        width, height, tiles = image_tiler.split(file_bytes)
+        if not tiles:
+            url = self.upload_from_bytes(file_bytes, folder, f"{idx:03d}.jpg")
+            return {"url": url, "width": width, "height": height} if url else None
+        
+        # Tile đã encode đúng định dạng đích → chỉ dedup, không transcode lại
+        uploaded = []
+        for t, (tile_bytes, ext, tile_width, tile_height) in enumerate(tiles):
+            url = image_dedup.upload(tile_bytes, folder, f"{idx:03d}-{t:02d}.{ext}", self._upload_bytes)
+            if not url:
                 return None
-                
-        except Exception as e:
-            print(f"❌ Lỗi upload {file_name}: {e}")
-            return None
+            uploaded.append({"url": url, "width": tile_width, "height": tile_height})
+        print(f"  🧩 Trang {idx}: {width}×{height} → {len(uploaded)} tile")
+        return {"url": uploaded[0]["url"], "width": width, "height": height, "tiles": uploaded}
+    
+    def _transcode_and_upload(self, file_bytes, folder, file_name):
+        """Encode lại ảnh (nếu bật IMAGE_TRANSCODE) và đặt đúng đuôi file theo định dạng thật"""
+        file_bytes, ext, mime_type = transcoder.prepare(file_bytes)
+        return self._upload_bytes(file_bytes, folder, f"{os.path.splitext(file_name)[0]}.{ext}", mime_type)
+    
+    def _upload_bytes(self, file_bytes, folder, file_name, mime_type=None):
+        """Ghi bytes qua storage backend (không qua dedup)"""
+        return self.backend.put(file_bytes, folder, file_name, mime_type)
     
     def upload_batch_from_bytes(self, items, folder_path, max_workers=5):
         """
-        Upload nhiều ảnh song song
+        Upload nhiều ảnh: dedup + transcode từng ảnh, ảnh mới ghi 1 lượt qua backend.put_many
         
         Args:
             items: List of (idx, file_bytes) tuples
-            folder_path: Folder trên ImageKit
+            folder_path: Folder trên storage
             max_workers: Số thread song song
         
         Returns:
@@ -158,23 +324,43 @@ class ImageStorage:
         """
         results = [None] * len(items)
         
-        def upload_one(item):
+        def prepare(item):
             idx, file_bytes = item
-            filename = f"{idx:03d}.jpg"
-            url = self.upload_from_bytes(file_bytes, folder_path, filename)
-            return idx, url
+            try:
+                digest, url = image_dedup.lookup(file_bytes, folder_path)
+                if url:
+                    return idx, digest, url, None
+                data, ext, mime_type = transcoder.prepare(file_bytes)
+                folder, file_name = image_dedup.target(digest, folder_path, f"{idx:03d}.{ext}")
+                return idx, digest, None, (data, folder, file_name, mime_type)
+            except Exception as e:
+                # Ảnh hỏng chỉ bỏ trang đó, không làm hỏng cả batch
+                print(f"  ⚠️ Lỗi chuẩn bị ảnh {idx}: {e}")
+                return idx, None, None, None
         
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(upload_one, item): item[0] for item in items}
-            for future in as_completed(futures):
-                try:
-                    idx, url = future.result()
-                    results[idx] = url
-                    print(f"  ☁️ [{idx+1}/{len(items)}] Uploaded")
-                except Exception as e:
-                    idx = futures[future]
-                    print(f"  ❌ [{idx+1}/{len(items)}] Failed: {e}")
+            prepared = list(executor.map(prepare, items))
+        
+        # Ảnh trùng nội dung trong cùng batch chỉ ghi 1 lần (nhóm theo digest)
+        groups = {}
+        for idx, digest, url, put_item in prepared:
+            if url:
+                results[idx] = url
+            elif put_item:
+                group = groups.setdefault(digest or ("idx", idx), [idx, digest, put_item, []])
+                group[3].append(idx)
+        pending = list(groups.values())
+        
+        originals = dict(items)
+        urls = self.backend.put_many([put_item for _, _, put_item, _ in pending], max_workers=max_workers)
+        for (idx, digest, _, indexes), url in zip(pending, urls):
+            image_dedup.remember(digest, url, originals[idx], folder_path)
+            for i in indexes:
+                results[i] = url
         
+        uploaded = sum(1 for url in results if url)
+        print(f"  ☁️ Uploaded {uploaded}/{len(items)} ảnh "
+              f"({uploaded - len(pending)} ảnh trùng nội dung)")
         return [url for url in results if url]
     
     def upload_from_url(self, url, folder, file_name):
@@ -189,31 +375,28 @@ class ImageStorage:
         Returns:
             URL của ảnh đã upload hoặc None nếu lỗi
         """
-        try:
-            data = {
-                "file": url,
-                "fileName": file_name,
-                "folder": f"/{folder}",
-                "useUniqueFileName": "false",
-                "overwriteFile": "true"
-            }
-            
-            response = requests.post(
-                self.UPLOAD_URL,
-                data=data,
-                auth=self._get_auth()
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('url')
-            else:
-                print(f"❌ Lỗi upload từ URL: {response.status_code}")
-                return None
-                
-        except Exception as e:
-            print(f"❌ Lỗi upload {file_name}: {e}")
+        result = self._upload_remote(url, folder, file_name)
+        return result.get('url') if result else None
+    
+    def upload_page_from_url(self, source_url, folder, idx):
+        """
+        ImageKit tự fetch ảnh trang idx từ source_url (bytes không đi qua worker)
+        Không dedup / transcode / cắt tile được vì không có bytes ảnh.
+        
+        Returns:
+            {url, width, height} hoặc None nếu ImageKit không fetch được
+        """
+        ext = os.path.splitext(urlparse(source_url).path)[1].lower().lstrip(".")
+        if ext not in REMOTE_EXTENSIONS:
+            ext = "jpg"
+        result = self._upload_remote(source_url, folder, f"{idx:03d}.{ext}")
+        if not result or not result.get('url'):
             return None
+        return {"url": result['url'], "width": result.get('width'), "height": result.get('height')}
+    
+    def _upload_remote(self, url, folder, file_name):
+        """Backend tự fetch ảnh từ URL nguồn (chỉ ImageKit), trả JSON kết quả hoặc None"""
+        return self.backend.put_url(url, folder, file_name)
     
     def upload_chapter_images(self, manga_id, chapter_id, local_folder):
         """
@@ -286,48 +469,21 @@ class ImageStorage:
         Lấy URL với transformations
         
         Args:
-            path: Đường dẫn ảnh trên ImageKit
-            transformations: List các transformation (resize, quality, etc.)
+            path: Đường dẫn ảnh trên storage
+            transformations: List các transformation (resize, quality, etc. - chỉ ImageKit)
         
         Returns:
             URL với transformations
         """
-        if transformations:
-            tr_str = ",".join([f"{k}-{v}" for t in transformations for k, v in t.items()])
-            return f"{self.url_endpoint}/tr:{tr_str}/{path}"
-        return f"{self.url_endpoint}/{path}"
+        return self.backend.get_url(path, transformations)
     
     def delete_file(self, file_id):
         """Xóa file theo ID"""
-        try:
-            response = requests.delete(
-                f"{self.API_URL}/files/{file_id}",
-                auth=self._get_auth()
-            )
-            return response.status_code == 204
-        except Exception as e:
-            print(f"❌ Lỗi xóa file: {e}")
-            return False
+        return self.backend.delete(file_id)
     
     def list_files(self, path="", limit=100):
         """Liệt kê files trong folder"""
-        try:
-            params = {"limit": limit}
-            if path:
-                params["path"] = path
-            
-            response = requests.get(
-                f"{self.API_URL}/files",
-                params=params,
-                auth=self._get_auth()
-            )
-            
-            if response.status_code == 200:
-                return response.json()
-            return []
-        except Exception as e:
-            print(f"❌ Lỗi liệt kê files: {e}")
-            return []
+        return self.backend.list(path, limit)
 
 
 # Singleton instance
@@ -0,0 +1,30 @@
+"""
+chapter_number: thứ tự chapter theo (major, minor), chap lẻ 2 chữ số không bị xếp sai.
+
+Chạy: python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.chapter_probe import chapter_number
+
+
+@pytest.mark.parametrize("chapter_id, expected", [
+    ("chuong-12", (12, 0)),
+    ("chuong-12-5", (12, 5)),
+    ("chap-12.5", (12, 5)),
+    ("chapter12", (12, 0)),
+    ("chuong-12-15", (12, 15)),
+    ("ngoai-truyen", None),
+])
+def test_chapter_number(chapter_id, expected):
+    assert chapter_number(chapter_id) == expected
+
+
+def test_minor_chapters_sort_numerically():
+    ids = ["chuong-13", "chuong-12-15", "chuong-12", "chuong-12-5", "chuong-12-2"]
+    assert sorted(ids, key=chapter_number) == ["chuong-12", "chuong-12-2", "chuong-12-5", "chuong-12-15", "chuong-13"]
@@ -0,0 +1,53 @@
+"""
+ChapterScheduler: chapter lỗi vẫn có event, client ngắt SSE giữa chừng không làm callback lỗi.
+
+Chạy: python -m pytest tests
+"""
+
+import os
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.chapter_scheduler import ChapterScheduler
+
+
+class _FakeCrawler:
+    def get_downloaded_chapters(self, manga_id):
+        return []
+
+    def download_chapter_images(self, manga_id, chapter_id):
+        time.sleep(0.05)
+        return ["img"]
+
+
+class _CrashingScheduler(ChapterScheduler):
+    def _download_one(self, manga_id, chapter_id):
+        if chapter_id == "chuong-2":
+            raise RuntimeError("boom")
+        return super()._download_one(manga_id, chapter_id)
+
+
+def chapters(count):
+    return [{"id": f"chuong-{i}"} for i in range(1, count + 1)]
+
+
+def test_raised_future_becomes_error_event():
+    events = list(_CrashingScheduler(_FakeCrawler(), chapter_concurrency=2).run("manga", chapters(3)))
+
+    assert [e["chapter"] for e in events if e["type"] == "error"] == ["chuong-2"]
+    assert events[-1]["type"] == "complete"
+    assert events[-1]["downloaded"] == 2
+    assert events[-1]["errors"] == ["chuong-2: boom"]
+
+
+def test_disconnect_cancels_pending_without_callback_errors(caplog):
+    run = ChapterScheduler(_FakeCrawler(), chapter_concurrency=1).run("manga", chapters(10))
+    with caplog.at_level(logging.ERROR, logger="concurrent.futures"):
+        assert next(run)["type"] == "start"
+        assert next(run)["type"] == "progress"
+        run.close()  # client ngắt SSE → shutdown(cancel_futures=True)
+        time.sleep(0.2)
+
+    assert not caplog.records
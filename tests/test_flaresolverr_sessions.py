@@ -0,0 +1,48 @@
+"""
+FlareSolverr session pool: tái sử dụng session, không bao giờ tạo quá pool_size session.
+
+Chạy: python -m pytest tests
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fake_servers import fake_flaresolverr
+from crawler.flaresolverr_client import FlareSolverrClient
+
+
+@pytest.fixture
+def server():
+    with fake_flaresolverr(solve_time=0.2, latency=0.01) as srv:
+        yield srv
+
+
+def crawl(server, pool_size, pages=12, workers=4):
+    client = FlareSolverrClient()
+    client.base_url = server.url
+    client.pool_size = pool_size
+    client.available = True
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(client.get_page, [f"https://example.test/page/{i}" for i in range(pages)]))
+    finally:
+        client.close()
+
+
+@pytest.mark.parametrize("pool_size", [1, 2])
+def test_pool_reuses_sessions(server, pool_size):
+    results = crawl(server, pool_size)
+
+    assert all(results)
+    assert server.stats["request.get"] == 12
+    assert server.stats["sessions.create"] <= pool_size
+    assert not server.sessions  # close() hủy hết session
+
+
+def test_no_pool_creates_no_sessions(server):
+    assert all(crawl(server, 0, pages=3))
+    assert server.stats["sessions.create"] == 0
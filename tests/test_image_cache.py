@@ -0,0 +1,79 @@
+"""
+Cache ảnh /cdn: 2 ImageCache cùng thư mục = 2 web worker (gunicorn nhiều process)
+dùng chung budget, gộp cache miss và không làm hỏng file đang gửi của nhau.
+
+Chạy: python -m pytest tests
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fake_servers import FakeServer
+from image_cache import ImageCache
+
+IMAGE_SIZE = 10_000
+
+
+@pytest.fixture
+def server():
+    with FakeServer(latency=0.2, image_size=IMAGE_SIZE) as srv:
+        yield srv
+
+
+def cached_files(root):
+    return [
+        name for directory, _, names in os.walk(root) if directory != root and not directory.endswith(".locks")
+        for name in names if not name.startswith(".tmp-")
+    ]
+
+
+def fetch(cache, server, name):
+    entry, _ = cache.get(cache.key_for(name), lambda: f"{server.url}/img/{name}.jpg")
+    return entry
+
+
+def test_workers_share_budget(server, tmp_path):
+    budget = int(IMAGE_SIZE * 2.5)
+    worker_a, worker_b = ImageCache(str(tmp_path), budget), ImageCache(str(tmp_path), budget)
+    for name in ("1", "2"):
+        fetch(worker_a, server, name)["file"].close()
+    fetch(worker_b, server, "3")["file"].close()
+
+    assert len(cached_files(str(tmp_path))) == 2
+    assert worker_a.snapshot()["entries"] == worker_b.snapshot()["entries"] == 2
+    # Ảnh của worker A vẫn dùng được từ worker B (không tải lại)
+    fetch(worker_b, server, "2")["file"].close()
+    assert server.stats["get"] == 3
+
+
+def test_concurrent_miss_fetched_once_across_workers(server, tmp_path):
+    workers = [ImageCache(str(tmp_path)), ImageCache(str(tmp_path))]
+    entries = []
+
+    def read(cache):
+        entry = fetch(cache, server, "hot")
+        entries.append(entry)
+        entry["file"].close()
+
+    threads = [threading.Thread(target=read, args=(workers[i % 2],)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert server.stats["get"] == 1
+    assert len(entries) == 8 and all(entry["size"] == IMAGE_SIZE for entry in entries)
+
+
+def test_evicted_entry_still_served(server, tmp_path):
+    worker_a, worker_b = ImageCache(str(tmp_path), IMAGE_SIZE), ImageCache(str(tmp_path), IMAGE_SIZE)
+    entry = fetch(worker_a, server, "old")
+    fetch(worker_b, server, "new")["file"].close()  # evict "old"
+
+    assert not os.path.exists(entry["path"])
+    with entry["file"] as f:
+        assert f.read() == server.image_bytes
@@ -0,0 +1,61 @@
+"""
+Upload ImageKit: multipart nhị phân (không base64) qua kết nối keep-alive trong pool.
+
+Chạy: python -m pytest tests
+"""
+
+import os
+import sys
+from email.parser import BytesParser
+from urllib.parse import urlparse
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fake_servers import FakeServer
+from crawler.http_pool import HTTPPool
+from crawler.rate_limiter import rate_limiter
+from imagekit_storage import MultipartBody, ImageKitBackend
+
+IMAGE = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 400
+
+
+@pytest.fixture
+def server():
+    with FakeServer(latency=0, image_size=2000) as srv:
+        # Không để rate limiter làm chậm test
+        rate_limiter.host_rates[urlparse(srv.url).netloc] = 100000
+        yield srv
+
+
+def test_multipart_body_is_valid_form():
+    body = MultipartBody({"fileName": "001.jpg", "folder": "/manga/x"}, "001.jpg", IMAGE, "image/jpeg")
+    raw = b"".join(bytes(part) for part in body)
+    assert len(raw) == len(body)
+
+    message = BytesParser().parsebytes(b"Content-Type: " + body.content_type.encode() + b"\r\n\r\n" + raw)
+    parts = {part.get_param("name", header="content-disposition"): part for part in message.get_payload()}
+    assert parts["fileName"].get_payload(decode=True) == b"001.jpg"
+    assert parts["file"].get_content_type() == "image/jpeg"
+    assert parts["file"].get_payload(decode=True) == IMAGE
+    # Lặp lại được (rate limiter retry gửi lại cùng body)
+    assert b"".join(bytes(part) for part in body) == raw
+
+
+def test_put_sends_raw_bytes(server):
+    backend = ImageKitBackend()
+    backend.UPLOAD_URL = f"{server.url}/upload"
+    backend.private_key = "test"
+
+    assert backend.put(IMAGE, "manga/x", "001.jpg").startswith(server.url)
+    # Base64 sẽ làm body lớn hơn ~33%
+    assert len(IMAGE) < server.stats["bytes_received"] < len(IMAGE) * 1.05
+
+
+def test_pool_reuses_connection(server):
+    pool = HTTPPool(pool_size=4, host_pool_sizes={}, http2_hosts=[])
+    for i in range(5):
+        assert pool.request("GET", f"{server.url}/img/{i}.jpg").status_code == 200
+
+    assert server.stats["get"] == 5
+    assert server.stats["connections"] == 1
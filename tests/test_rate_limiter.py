@@ -0,0 +1,39 @@
+"""
+Rate limiter: slot tải ảnh (image_slots) không bị giữ trong lúc host đang nghỉ (Retry-After).
+
+Chạy: python -m pytest tests
+"""
+
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.rate_limiter import RateLimiter
+
+
+class _Response:
+    status_code = 200
+    headers = {}
+
+
+class _Client:
+    def request(self, method, url, **kwargs):
+        time.sleep(0.05)
+        return _Response()
+
+
+def test_slot_not_held_while_host_paused():
+    limiter = RateLimiter(default_rate=100, host_rates={})
+    slot = threading.BoundedSemaphore(1)
+    limiter.feedback("http://cdn.test/1.jpg", 429, "1")
+
+    thread = threading.Thread(target=limiter.request, args=("GET", "http://cdn.test/1.jpg"),
+                              kwargs={"session": _Client(), "slot": slot})
+    thread.start()
+    time.sleep(0.3)
+    assert slot.acquire(blocking=False)  # request kia vẫn đang chờ hết Retry-After
+    slot.release()
+    thread.join()
+    assert slot.acquire(blocking=False)  # đã trả slot sau khi tải
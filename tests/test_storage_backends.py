@@ -0,0 +1,45 @@
+"""
+LocalBackend: key theo nội dung, ảnh trùng chỉ ghi 1 lần, không để lại file tạm.
+
+Chạy: python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.storage_backends import LocalBackend, content_key
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x01" * 2000
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x02" * 2000
+
+
+def files(root):
+    return sorted(os.path.relpath(os.path.join(d, n), root) for d, _, names in os.walk(root) for n in names)
+
+
+def test_content_key_uses_real_format():
+    key = content_key(PNG, "001.jpg")
+    assert key.endswith(".png")
+    assert key.split("/")[:2] == [key.split("/")[2][:2], key.split("/")[2][2:4]]
+
+
+def test_put_is_content_addressed(tmp_path):
+    backend = LocalBackend(str(tmp_path), "/media")
+    url = backend.put(JPEG, "manga/a/chuong-1", "001.jpg")
+    again = backend.put(JPEG, "manga/b/chuong-9", "007.jpg")
+
+    assert url == again == f"/media/{content_key(JPEG)}"
+    with open(backend.path_for(content_key(JPEG)), "rb") as f:
+        assert f.read() == JPEG
+    assert backend.stats["writes"] == 1 and backend.stats["existing"] == 1
+
+
+def test_put_many_writes_duplicates_once(tmp_path):
+    backend = LocalBackend(str(tmp_path), "/media")
+    items = [(JPEG, "f", "001.jpg", None), (PNG, "f", "002.png", None), (JPEG, "f", "003.jpg", None)]
+    urls = backend.put_many(items)
+
+    assert urls[0] == urls[2] != urls[1]
+    assert backend.stats["writes"] == 2
+    assert files(str(tmp_path)) == sorted(os.path.join(*content_key(d).split("/")) for d in (JPEG, PNG))
@@ -0,0 +1,53 @@
+"""
+Transcoder: nhận định dạng theo magic bytes, chỉ dùng bản encode lại khi nhỏ hơn.
+
+Chạy: python -m pytest tests
+"""
+
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.transcoder import Transcoder, sniff_format, transcode_bytes, available_targets, HAS_PIL
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 100
+
+
+@pytest.mark.parametrize("head, expected", [
+    (b"\xff\xd8\xff\xe0", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "webp"),
+    (b"GIF89a", "gif"),
+    (b"\x00\x00\x00\x1cftypavif", "avif"),
+    (b"<html>", None),
+])
+def test_sniff_format(head, expected):
+    assert sniff_format(head + b"\x00" * 32) == expected
+
+
+def test_off_keeps_original():
+    assert Transcoder(mode="off").prepare(JPEG) == (JPEG, "jpg", "image/jpeg")
+
+
+def png(size=(400, 600)):
+    from PIL import Image
+    out = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(out, "PNG")
+    return out.getvalue()
+
+
+@pytest.mark.skipif(not HAS_PIL or "webp" not in available_targets(), reason="Pillow không hỗ trợ WebP")
+def test_webp_used_only_when_smaller():
+    transcoder = Transcoder(mode="webp", quality=80, workers=1)
+    data = png()
+    encoded, _ = transcode_bytes(data, "webp", 80)
+    assert sniff_format(encoded) == "webp"
+
+    chosen, ext, mime = transcoder._finish(data, encoded, 0.0)
+    assert (ext, mime) == ("webp", "image/webp") and chosen == encoded
+    # Bản encode lớn hơn → giữ ảnh gốc
+    assert transcoder._finish(encoded, data, 0.0) == (encoded, "webp", "image/webp")
+    assert transcoder.snapshot()["transcoded"] == 1
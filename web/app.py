@@ -20,6 +20,17 @@ sys.path.insert(0, ROOT_DIR)
 
 # Import crawler và database
 from crawler.manga_crawler import MangaCrawler
+from crawler.chapter_scheduler import ChapterScheduler
+from crawler.job_queue import get_job_queue
+from crawler.backend_router import backend_router
+from crawler.rate_limiter import rate_limiter
+from crawler.http_pool import http_pool
+from crawler.remote_ingest import remote_ingest
+from imagekit_storage import image_storage
+from image_cache import image_cache, image_ref
+from crawler.image_pipeline import image_byte_budget, recent_chapters
+from crawler.image_dedup import image_dedup
+from crawler.transcoder import transcoder
 from database import db
 
 app = Flask(__name__)
@@ -33,6 +44,9 @@ login_manager.login_view = 'login'
 login_manager.login_message = 'Vui lòng đăng nhập để tiếp tục.'
 login_manager.login_message_category = 'warning'
 
+# Reader lấy ảnh qua /cdn (cache trên đĩa server) thay vì trỏ thẳng ImageKit
+READER_IMAGE_PROXY = os.getenv('READER_IMAGE_PROXY', 'false').lower() == 'true'
+
 
 # User class for Flask-Login
 class User(UserMixin):
@@ -93,6 +107,59 @@ except Exception as e:
     traceback.print_exc()
     crawler = None
 
+# Job queue (CRAWL_JOB_QUEUE=sqlite|mongo): crawl chạy ở worker riêng thay vì trong request
+try:
+    job_queue = get_job_queue()
+    if job_queue:
+        print(f"📬 Crawl job queue: {os.getenv('CRAWL_JOB_QUEUE')}")
+except Exception as e:
+    print(f"❌ Error initializing job queue: {e}")
+    job_queue = None
+
+
+def enqueue_job(kind, payload, dedupe_key):
+    """Đưa job vào queue và trả về response 202 kèm job_id"""
+    job_id = job_queue.enqueue(kind, payload, dedupe_key=dedupe_key)
+    return jsonify({"success": True, "queued": True, "job_id": job_id}), 202
+
+
+def queue_new_chapters(manga_id, chapter_ids):
+    """Đưa các chapter mới phát hiện khi refresh vào queue tải (nếu bật queue)"""
+    if not job_queue:
+        return []
+    return [
+        job_queue.enqueue('chapter', {'manga_id': manga_id, 'chapter_id': chapter_id},
+                          dedupe_key=f"chapter:{manga_id}:{chapter_id}")
+        for chapter_id in chapter_ids
+    ]
+
+
+def follow_job(job_id):
+    """SSE generator: theo dõi tiến độ job download_all trong queue"""
+    yield f"data: {json.dumps({'type': 'queued', 'job_id': job_id})}\n\n"
+    started = False
+    last_current = -1
+    while True:
+        job = job_queue.get(job_id)
+        if not job:
+            yield f"data: {json.dumps({'type': 'error', 'success': False, 'error': 'Job không tồn tại'})}\n\n"
+            return
+        progress = job.get('progress') or {}
+        if not started and progress.get('total'):
+            started = True
+            yield f"data: {json.dumps({'type': 'start', 'total': progress['total'], 'job_id': job_id})}\n\n"
+        if started and progress.get('current', 0) != last_current:
+            last_current = progress.get('current', 0)
+            yield f"data: {json.dumps({'type': 'progress', 'current': last_current, 'total': progress['total'], 'chapter': progress.get('last_chapter'), 'images': 0})}\n\n"
+        if job['state'] == 'done':
+            result = job.get('result') or {}
+            yield f"data: {json.dumps({'type': 'complete', 'success': True, 'job_id': job_id, **result})}\n\n"
+            return
+        if job['state'] == 'failed':
+            yield f"data: {json.dumps({'type': 'error', 'success': False, 'job_id': job_id, 'error': job.get('error')})}\n\n"
+            return
+        time.sleep(2)
+
 
 # Route serve static files thủ công cho Vercel
 @app.route('/static/<path:filename>')
@@ -102,6 +169,64 @@ def serve_static(filename):
     return send_from_directory(os.path.join(CURRENT_DIR, 'static'), filename)
 
 
+@app.route('/cdn/<manga_id>/<chapter_id>/<version>/<ref>')
+@login_required
+def cdn_image(manga_id, chapter_id, version, ref):
+    """
+    Proxy ảnh chapter có cache trên đĩa (LRU), chỉ serve ảnh thuộc chapter trong MongoDB.
+    version (crawler.get_chapter_version) đổi khi chapter được tải lại / repair nên URL cache vĩnh viễn được.
+    """
+    from flask import send_file, redirect, abort
+    
+    def resolve():
+        # Version cũ: không tải ảnh mới vào key của version cũ
+        if crawler.get_chapter_version(manga_id, chapter_id) != version:
+            return None
+        # ref = hash của cả URL gốc (kể cả ảnh dùng lại từ chapter khác và từng tile)
+        for url in crawler.get_chapter_images(manga_id, chapter_id) or []:
+            if image_ref(url) == ref and url.startswith(('http://', 'https://')):
+                return url
+        return None
+    
+    key = image_cache.key_for(manga_id, chapter_id, version, ref)
+    entry, url = image_cache.get(key, resolve)
+    if not entry:
+        # CDN lỗi / ảnh quá lớn để cache → để trình duyệt tự tải từ CDN
+        if url:
+            return redirect(url)
+        # Trang đọc cũ (chapter đã được ghi lại) → chuyển sang version hiện tại
+        current = crawler.get_chapter_version(manga_id, chapter_id)
+        if current != version:
+            return redirect(url_for('cdn_image', manga_id=manga_id, chapter_id=chapter_id, version=current, ref=ref))
+        abort(404)
+    
+    # Gửi từ file đã mở sẵn trong cache: ảnh bị evict giữa chừng vẫn gửi trọn vẹn.
+    # Key gồm version + hash URL gốc nên nội dung không đổi → dùng làm ETag; Range (206) / 304 qua make_conditional
+    try:
+        response = send_file(entry["file"], mimetype=entry["mimetype"], conditional=False, etag=False, max_age=31536000)
+    except Exception:
+        entry["file"].close()
+        raise
+    response.content_length = entry["size"]
+    response.set_etag(key)
+    response.make_conditional(request, accept_ranges=True, complete_length=entry["size"])
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+@app.route('/media/<path:key>')
+@login_required
+def serve_media(key):
+    """Serve ảnh khi STORAGE_BACKEND=local (key theo nội dung → cache vĩnh viễn, chỉ ở trình duyệt vì cần đăng nhập)"""
+    from flask import send_from_directory, abort
+    root = getattr(image_storage.backend, "root", None)
+    if not root:
+        abort(404)
+    response = send_from_directory(root, key, max_age=31536000)
+    response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
+
 @app.route('/')
 @login_required
 def index():
@@ -163,25 +288,37 @@ def reader(manga_id, chapter_id):
     # Lấy URLs ảnh từ MongoDB (ImageKit URLs)
     images = crawler.get_chapter_images(manga_id, chapter_id)
     
-    # Nếu chưa có, tải và upload lên ImageKit
-    if not images:
+    # Nếu chưa có, đưa vào queue (nếu bật) hoặc tải và upload lên ImageKit
+    job_id = None
+    if not images and job_queue:
+        job_id = job_queue.enqueue('chapter', {'manga_id': manga_id, 'chapter_id': chapter_id},
+                                   dedupe_key=f"chapter:{manga_id}:{chapter_id}")
+    elif not images:
         try:
             images = crawler.download_chapter_images(manga_id, chapter_id)
         except Exception as e:
             print(f"Lỗi tải ảnh: {e}")
             images = []
     
-    # Tất cả images giờ đều là cloud URLs
-    is_cloud_urls = True
+    # Ảnh trỏ thẳng cloud URLs, hoặc qua proxy /cdn khi bật READER_IMAGE_PROXY
+    is_cloud_urls = not READER_IMAGE_PROXY
+    
+    # Mỗi trang gồm 1 hoặc nhiều tile (kèm kích thước để giữ chỗ, vẽ dần từ tile đầu)
+    reader_pages = crawler.get_reader_pages(manga_id, chapter_id) if images else []
+    if not is_cloud_urls:
+        version = crawler.get_chapter_version(manga_id, chapter_id)
+        reader_pages = [[dict(part, url=f'{version}/{image_ref(part["url"])}') for part in parts] for parts in reader_pages]
     
     return render_template('reader.html', 
                          manga_id=manga_id,
                          chapter=chapter_info,
                          images=images,
+                         reader_pages=reader_pages,
                          is_cloud_urls=is_cloud_urls,
                          story=story_data,
                          prev_chapter=prev_chapter,
-                         next_chapter=next_chapter)
+                         next_chapter=next_chapter,
+                         job_id=job_id)
 
 
 # ==================== API Endpoints ====================
@@ -201,9 +338,16 @@ def api_crawl_home():
 @login_required
 def api_crawl_story(manga_id):
     """API: Crawl chi tiết truyện -> MongoDB"""
+    download_new = request.args.get('download_new', '0') == '1'
+    if job_queue:
+        return enqueue_job('story', {'manga_id': manga_id, 'download_new': download_new, 'force': True}, f"story:{manga_id}")
     try:
-        data = crawler.crawl_story_detail(manga_id)
-        return jsonify({"success": True, "chapters": len(data.get('chapters', []))})
+        data = crawler.crawl_story_detail(manga_id, force=True)
+        return jsonify({
+            "success": True,
+            "chapters": len(data.get('chapters', [])),
+            "new_chapters": data.get('new_chapters', [])
+        })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -212,6 +356,9 @@ def api_crawl_story(manga_id):
 @login_required
 def api_crawl_chapter(manga_id, chapter_id):
     """API: Tải và upload chapter -> ImageKit + MongoDB"""
+    if job_queue:
+        return enqueue_job('chapter', {'manga_id': manga_id, 'chapter_id': chapter_id},
+                           f"chapter:{manga_id}:{chapter_id}")
     try:
         images = crawler.download_chapter_images(manga_id, chapter_id)
         return jsonify({"success": True, "images": len(images)})
@@ -223,6 +370,17 @@ def api_crawl_chapter(manga_id, chapter_id):
 @login_required
 def api_download_all(manga_id):
     """API: Tải toàn bộ truyện lên cloud (Streaming để tránh timeout)"""
+    chapter_concurrency = request.args.get('concurrency', type=int)
+    
+    # Có job queue: worker tải, request chỉ theo dõi tiến độ (ngắt kết nối không mất job)
+    if job_queue:
+        job_id = job_queue.enqueue('download_all', {'manga_id': manga_id, 'concurrency': chapter_concurrency},
+                                   dedupe_key=f"download_all:{manga_id}")
+        return Response(follow_job(job_id), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+    
     def generate():
         try:
             story_data = crawler.get_story_data(manga_id)
@@ -232,29 +390,11 @@ def api_download_all(manga_id):
             chapters = story_data.get('chapters', [])
             # Đảo ngược để tải từ chap đầu đến chap mới nhất
             chapters = list(reversed(chapters))
-            total = len(chapters)
-            downloaded = 0
-            errors = []
-            
-            # Gửi thông tin ban đầu
-            yield f"data: {json.dumps({'type': 'start', 'total': total})}\n\n"
-            
-            for idx, chapter in enumerate(chapters):
-                try:
-                    chapter_id = chapter.get('id')
-                    if chapter_id:
-                        images = crawler.download_chapter_images(manga_id, chapter_id)
-                        if images:
-                            downloaded += 1
-                        # Gửi progress cho mỗi chapter
-                        yield f"data: {json.dumps({'type': 'progress', 'current': idx + 1, 'total': total, 'chapter': chapter_id, 'images': len(images) if images else 0})}\n\n"
-                except Exception as e:
-                    error_msg = f"{chapter.get('id')}: {str(e)}"
-                    errors.append(error_msg)
-                    yield f"data: {json.dumps({'type': 'error', 'chapter': chapter.get('id'), 'error': str(e)})}\n\n"
             
-            # Gửi kết quả cuối cùng
-            yield f"data: {json.dumps({'type': 'complete', 'success': True, 'total': total, 'downloaded': downloaded, 'errors': errors[:10]})}\n\n"
+            # Tải song song nhiều chapter, event gửi theo thứ tự hoàn thành
+            scheduler = ChapterScheduler(crawler, chapter_concurrency=chapter_concurrency)
+            for event in scheduler.run(manga_id, chapters):
+                yield f"data: {json.dumps(event)}\n\n"
             
         except Exception as e:
             yield f"data: {json.dumps({'type': 'error', 'success': False, 'error': str(e)})}\n\n"
@@ -265,6 +405,18 @@ def api_download_all(manga_id):
     })
 
 
+@app.route('/api/jobs/<job_id>')
+@login_required
+def api_job_status(job_id):
+    """API: Trạng thái một crawl job"""
+    if not job_queue:
+        return jsonify({"error": "Job queue chưa được bật"}), 404
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(job)
+
+
 @app.route('/api/download-status/<manga_id>')
 @login_required
 def api_download_status(manga_id):
@@ -277,12 +429,16 @@ def api_download_status(manga_id):
 def api_check_chapter(manga_id, chapter_id):
     """API: Kiểm tra chapter đã được tải chưa"""
     from database import db
-    images = db.get_chapter_images(manga_id, chapter_id)
+    state = db.get_chapter_state(manga_id, chapter_id) or {}
+    images = state.get("images", [])
+    pages = state.get("pages", [])
     return jsonify({
         "manga_id": manga_id,
         "chapter_id": chapter_id,
         "downloaded": len(images) > 0 if images else False,
-        "images_count": len(images) if images else 0
+        "images_count": len(images) if images else 0,
+        "complete": state.get("complete", bool(images)),
+        "failed_pages": [p["index"] for p in pages if p["status"] != "done"]
     })
 
 
@@ -356,7 +512,7 @@ def api_crawl_from_url():
             return jsonify({"success": False, "error": "Crawler chưa khởi tạo"}), 500
         
         # Crawl chi tiết truyện
-        story_data = crawler.crawl_story_detail(manga_id)
+        story_data = crawler.crawl_story_detail(manga_id, force=True)
         
         if story_data:
             print(f"✅ Crawl thành công: {story_data.get('title', 'Unknown')}")
@@ -364,7 +520,8 @@ def api_crawl_from_url():
                 "success": True, 
                 "manga_id": manga_id,
                 "title": story_data.get('title', ''),
-                "chapters": len(story_data.get('chapters', []))
+                "chapters": len(story_data.get('chapters', [])),
+                "new_chapters": story_data.get('new_chapters', [])
             })
         else:
             print(f"❌ Không thể crawl truyện: {manga_id}")
@@ -594,7 +751,7 @@ def admin_manga_add():
                 else:
                     manga_id = url.rstrip('/').split('/')[-1]
                 
-                story_data = crawler.crawl_story_detail(manga_id)
+                story_data = crawler.crawl_story_detail(manga_id, force=True)
                 
                 if story_data and story_data.get('title'):
                     flash(f'Đã thêm truyện: {story_data["title"]} ({len(story_data.get("chapters", []))} chapters)', 'success')
@@ -643,9 +800,13 @@ def admin_manga_delete(manga_id):
 def admin_manga_refresh(manga_id):
     """Cập nhật lại thông tin manga"""
     try:
-        story_data = crawler.crawl_story_detail(manga_id)
+        story_data = crawler.crawl_story_detail(manga_id, force=True)
         if story_data:
-            flash(f'Đã cập nhật: {story_data["title"]} ({len(story_data.get("chapters", []))} chapters)', 'success')
+            new_chapters = story_data.get("new_chapters", [])
+            message = f'Đã cập nhật: {story_data["title"]} ({len(story_data.get("chapters", []))} chapters, {len(new_chapters)} chapter mới)'
+            if request.form.get('download_new') and queue_new_chapters(manga_id, new_chapters):
+                message += ' - đã đưa chapter mới vào hàng đợi tải'
+            flash(message, 'success')
         else:
             flash('Không thể cập nhật truyện.', 'danger')
     except Exception as e:
@@ -747,6 +908,25 @@ def api_admin_download_chapter(manga_id, chapter_id):
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route('/api/admin/repair/<manga_id>', methods=['POST'])
+@admin_required
+def api_admin_repair(manga_id):
+    """API: Tải lại các ảnh lỗi của mọi chapter chưa đủ ảnh"""
+    chapter_ids = crawler.get_incomplete_chapters(manga_id)
+    if job_queue:
+        # Job chapter gặp chapter chưa đủ ảnh sẽ tự chuyển sang repair
+        job_ids = queue_new_chapters(manga_id, chapter_ids)
+        return jsonify({"success": True, "chapters": chapter_ids, "job_ids": job_ids}), 202
+    for chapter_id in chapter_ids:
+        try:
+            crawler.repair_chapter(manga_id, chapter_id)
+        except Exception as e:
+            print(f"Lỗi repair {chapter_id}: {e}")
+    remaining = set(crawler.get_incomplete_chapters(manga_id))
+    results = {chapter_id: chapter_id not in remaining for chapter_id in chapter_ids}
+    return jsonify({"success": True, "repaired": results})
+
+
 @app.route('/api/admin/stats')
 @admin_required
 def api_admin_stats():
@@ -762,6 +942,69 @@ def api_admin_stats():
     })
 
 
+@app.route('/api/admin/jobs')
+@admin_required
+def api_admin_jobs():
+    """API: Danh sách crawl jobs gần đây"""
+    if not job_queue:
+        return jsonify([])
+    return jsonify(job_queue.list_jobs(state=request.args.get('state'), limit=request.args.get('limit', 50, type=int)))
+
+
+@app.route('/api/admin/backends')
+@admin_required
+def api_admin_backends():
+    """API: Tình trạng các backend crawl (circuit breaker, tỉ lệ thành công, độ trễ)"""
+    return jsonify(backend_router.snapshot())
+
+
+@app.route('/api/admin/rate-limits')
+@admin_required
+def api_admin_rate_limits():
+    """API: Tốc độ request hiện tại theo từng host (token bucket + AIMD)"""
+    return jsonify(rate_limiter.snapshot())
+
+
+@app.route('/api/admin/image-pipeline')
+@admin_required
+def api_admin_image_pipeline():
+    """API: Budget bytes ảnh đang giữ trong RAM, đỉnh RSS các chapter gần nhất, thống kê transcode"""
+    return jsonify({
+        "budget": image_byte_budget.snapshot(),
+        "recent_chapters": list(recent_chapters),
+        "transcode": transcoder.snapshot(),
+        "storage": image_storage.backend.snapshot()
+    })
+
+
+@app.route('/api/admin/dedup')
+@admin_required
+def api_admin_dedup():
+    """API: Hit rate dedup ảnh + dung lượng upload tiết kiệm được"""
+    return jsonify(image_dedup.snapshot())
+
+
+@app.route('/api/admin/http-pool')
+@admin_required
+def api_admin_http_pool():
+    """API: Số kết nối mới (handshake) / tái sử dụng theo host của pool HTTP dùng chung"""
+    return jsonify(http_pool.snapshot())
+
+
+@app.route('/api/admin/ingest')
+@admin_required
+def api_admin_ingest():
+    """API: Chế độ ingest theo host ảnh (ImageKit tự fetch / tự tải) + số ảnh mỗi loại"""
+    return jsonify(remote_ingest.snapshot())
+
+
+@app.route('/api/admin/image-cache')
+@admin_required
+def api_admin_image_cache():
+    """API: Dung lượng / hit rate của cache ảnh /cdn trên đĩa"""
+    return jsonify(image_cache.snapshot())
+
+
 # ==================== Error Handler ====================
 
 @app.errorhandler(404)